@@ -6,17 +6,18 @@ import base64
 from typing import Tuple
 
 import yaml
-from ansible.inventory.manager import InventoryManager
-from ansible.parsing.dataloader import DataLoader
 
 from cloudtiger.cloudtiger import Operation
-from cloudtiger.common_tools import bash_action, j2, load_yaml
+from cloudtiger.common_tools import bash_action, copy_if_changed, j2, load_yaml, write_if_changed
 from cloudtiger.data import (
     DEFAULT_ANSIBLE_PYTHON_INTERPRETER,
     DEFAULT_SSH_PORT,
     common_group_names,
     common_environment_tags
 )
+from cloudtiger.output_store import get_output_store
+from cloudtiger.scope_index import get_scope_index
+from cloudtiger.vm_registry import VMRecord, VMRegistry
 
 
 def infer_group_env(vm_name: str, subnet_name: str) -> Tuple[str, str, str]:
@@ -86,46 +87,61 @@ def load_ssh_parameters_meta(operation: Operation):
     # loading meta IP information data
     operation.load_meta_info()
 
-    operation.scope_config_dict["vm_ssh_params"] = {}
+    # the VMs of the registry are replaced by the VMs of all_addresses_info.yml
+    vm_registry = VMRegistry()
     default_os_user = operation.scope_config_dict.get("default_os_user", "ubuntu")
     for subnet_name, subnet_vms in operation.addresses_info['vm_ips'].items():
         for vm_name, vm_ip in subnet_vms["addresses"].items():
             group, env, owner = infer_group_env(vm_name, subnet_name)
-            operation.scope_config_dict["vm_ssh_params"][vm_name] = {
-                "private_ip": vm_ip.split(':')[0],
-                "group": group,
-                "os_user": default_os_user,
-                "standard_user": os.environ["CLOUDTIGER_SSH_USERNAME"],
-                "ssh_port": extract_ssh_port(vm_ip),
-                "env": env,
-                "ansible_python_interpreter": DEFAULT_ANSIBLE_PYTHON_INTERPRETER,
-                "owner": owner
-            }
-
-    # replace the unpacked VMs
-    unpacked_vms = [
-        (vm_name, "blank_network", subnet_name,
-         [operation.scope_config_dict["vm_ssh_params"][vm_name]["group"]])
-        for subnet_name, subnet_vms in operation.addresses_info['vm_ips'].items()
-        for vm_name, vm_ip in subnet_vms["addresses"].items()
-        ]
-
-    operation.scope_config_dict["unpacked_vms"] = unpacked_vms
-
-    # replace the unpacked IPs
-    unpacked_ips = {
-        vm_name: vm_ip
-        for _, subnet_vms in operation.addresses_info['vm_ips'].items()
-        for vm_name, vm_ip in subnet_vms["addresses"].items()
-    }
+            vm = VMRecord(vm_name, "blank_network", subnet_name, group=group, address=vm_ip,
+                          env=env, owner=owner)
+            vm.os_user = default_os_user
+            vm.standard_user = os.environ["CLOUDTIGER_SSH_USERNAME"]
+            vm.ssh_port = extract_ssh_port(vm_ip)
+            vm.ansible_python_interpreter = DEFAULT_ANSIBLE_PYTHON_INTERPRETER
+            vm_registry.add(vm)
+
+    operation.vm_registry = vm_registry
+    operation.vms = vm_registry
+    if operation.restricted_vms:
+        operation.set_restricted_vms()
+
+    operation.scope_config_dict["vm_ssh_params"] = operation.vms.records
+
+
+def get_escape_bastion(operation: Operation, network_name: str) -> Tuple[str, str]:
+
+    """ this function returns the SSH bastion used by the private machines of a network,
+    i.e. the first VM of group 'bastion' in the 'escape public subnet' of the network
+    (= the subnet with public internet access)
 
-    operation.scope_unpacked_ips = unpacked_ips
+    :param operation: Operation, the current Operation
+    :param network_name: str, the name of the network
+
+    :return: (str, str), the terraform name and the public IP of the bastion
+    """
+
+    escape_public_subnet = operation.scope_config_dict["network"][network_name]\
+        .get("private_subnets_escape_public_subnet", None)
+
+    escape_bastions = [
+        vm for vm in operation.vm_registry.by_subnet.get(escape_public_subnet, [])
+        if (vm.network == network_name) & (vm.config.get("group", "") == "bastion")
+    ]
+    escape_bastion = escape_bastions[0]
+
+    # the public IP of the bastion is read from the terraform output store
+    escape_bastion_name = escape_bastion.config.get("prefix", "") + escape_bastion.name + "_vm"
+    bastion_output = get_output_store(operation.logger, operation.project_root)\
+        .get_vm(operation.scope, escape_bastion_name) or {}
+
+    return escape_bastion_name, bastion_output.get("public_ip", "unset")
 
 
 def load_ssh_parameters(operation: Operation):
 
-    """ this function modify the operation.scope_config_dict in order
-    to load it with necessary parameters to setup the ssh.cfg file
+    """ this function sets the SSH parameters of the VMs of the registry,
+    necessary to setup the ssh.cfg file
 
     :param operation: Operation, the current Operation
 
@@ -135,89 +151,64 @@ def load_ssh_parameters(operation: Operation):
     # loading IP information data
     operation.load_ips()
 
-    # here we get the mapping VM / ssh parameters
-    operation.scope_config_dict["vm_ssh_params"] = {}
     default_os_user = operation.scope_config_dict.get("default_os_user", "ubuntu")
-    for network_name, network_subnets in operation.scope_config_dict['vm'].items():
-        for subnet_name, subnet_vms in network_subnets.items():
-            for vm_name, vm in subnet_vms.items():
-                operation.scope_config_dict["vm_ssh_params"][vm_name] = {
-                    "private_ip": vm.get("private_ip", "unset_ip"),
-                    "group" : vm.get("group", "ungrouped")
-                }
-                vm_system_image = vm.get("system_image", "ubuntu_server")
-
-                # we set the OS username (used for initial SSH connexion)
-                # by order of priority, the OS username for a VM should be:
-                # - vm["user"]
-                # - system_images[provider]["username"]
-                # - default_os_user[provider]
-
-                operation.scope_config_dict["vm_ssh_params"][vm_name]["os_user"] = \
-                    vm.get(
-                        "os_user",
-                        operation.standard_config["system_images"][operation.provider].get(
-                            vm_system_image, {"username": default_os_user}
-                        )["username"]
-                    )
-
-                # we set the SSH port for the machine
-                # by order of priority, the SSH port should be :
-                # - custom_ssh_parameters["ssh_ports"][vm_name]
-                # - operation.scope_config_dict["vm"][vm_name]
-                # ["extra_parameters"]["custom_ssh_port"]
-
-                operation.scope_config_dict["vm_ssh_params"][vm_name]["ssh_port"] = \
-                    operation.scope_config_dict.get(
-                        "custom_ssh_parameters", {}).get(
-                            "ssh_ports", {}).get(
-                                vm_name,
-                                operation.scope_config_dict\
-                                    ["vm"][network_name][subnet_name][vm_name].get(
-                                        "extra_parameters", {}).get(
-                                            "custom_ssh_port", DEFAULT_SSH_PORT))
-
-                # we set the standard SSH username
-                # by order of priority, the standard username for a VM should be :
-                # - custom_ssh_parameters["usernames"][vm_name]
-                # - CLOUDTIGER_SSH_USERNAME env variable
-
-                operation.scope_config_dict["vm_ssh_params"][vm_name]["standard_user"] =\
-                    operation.scope_config_dict.get(
-                        "custom_ssh_parameters", {}).get("usernames", {}).get(
-                            vm_name, os.environ["CLOUDTIGER_SSH_USERNAME"])
-
-                # we set the Ansible python interpreter
-                # by order of priority, the Ansible python interpreter for a VM should be :
-                # - custom_ssh_parameters["python_interpreter"]
-                # - python3
-
-                operation.scope_config_dict["vm_ssh_params"][vm_name]\
-                    ["ansible_python_interpreter"] = \
-                        operation.scope_config_dict["vm"][network_name][subnet_name][vm_name]\
-                            .get("extra_parameters", {})\
-                                .get("python_interpreter", DEFAULT_ANSIBLE_PYTHON_INTERPRETER)
-
-                # we set the bastion public IP for a SSH proxy access mode
-                if operation.scope_config_dict.get("use_proxy", False):
-                    # first we get the 'escape public subnet' (= the subnet with public
-                    # internet access hosting SSH bastions used by the private machines)
-                    escape_public_subnet = operation.scope_config_dict["network"][network_name]\
-                        .get("private_subnets_escape_public_subnet", None)
-                    # then we get the VMs with a group tag 'bastion'
-                    escape_bastions = {
-                        vm.get("prefix", "") + vm_name + "_vm": vm
-                        for vm_name, vm in operation.scope_config_dict["vm"][network_name]\
-                            .get(escape_public_subnet, {}).items() \
-                                if vm.get("group", "") == "bastion"
-                    }
-                    # we choose the first available bastion
-                    escape_bastion = list(escape_bastions.keys())[0]
-                    # we attribute the bastion to the SSH parameters for the current VM
-                    operation.scope_config_dict["vm_ssh_params"][vm_name]["bastion_address"] \
-                        = operation.terraform_vm_data[escape_bastion].get("public_ip", "unset")
-                    operation.scope_config_dict["vm_ssh_params"][vm_name]["bastion_name"] \
-                        = escape_bastion
+    custom_ssh_parameters = operation.scope_config_dict.get("custom_ssh_parameters", {})
+    custom_ssh_ports = custom_ssh_parameters.get("ssh_ports", {})
+    custom_usernames = custom_ssh_parameters.get("usernames", {})
+    system_images = operation.standard_config["system_images"][operation.provider]
+    escape_bastions = {}
+
+    for vm in operation.vms:
+        if vm.private_ip is None:
+            vm.private_ip = "unset_ip"
+        vm_system_image = vm.config.get("system_image", "ubuntu_server")
+
+        # we set the OS username (used for initial SSH connexion)
+        # by order of priority, the OS username for a VM should be:
+        # - vm["user"]
+        # - system_images[provider]["username"]
+        # - default_os_user[provider]
+
+        vm.os_user = vm.config.get(
+            "os_user",
+            system_images.get(vm_system_image, {"username": default_os_user})["username"]
+        )
+
+        # we set the SSH port for the machine
+        # by order of priority, the SSH port should be :
+        # - custom_ssh_parameters["ssh_ports"][vm_name]
+        # - operation.scope_config_dict["vm"][vm_name]
+        # ["extra_parameters"]["custom_ssh_port"]
+
+        vm.ssh_port = custom_ssh_ports.get(
+            vm.name,
+            vm.config.get("extra_parameters", {}).get("custom_ssh_port", DEFAULT_SSH_PORT))
+
+        # we set the standard SSH username
+        # by order of priority, the standard username for a VM should be :
+        # - custom_ssh_parameters["usernames"][vm_name]
+        # - CLOUDTIGER_SSH_USERNAME env variable
+
+        vm.standard_user = custom_usernames.get(vm.name, os.environ["CLOUDTIGER_SSH_USERNAME"])
+
+        # we set the Ansible python interpreter
+        # by order of priority, the Ansible python interpreter for a VM should be :
+        # - custom_ssh_parameters["python_interpreter"]
+        # - python3
+
+        vm.ansible_python_interpreter = vm.config.get("extra_parameters", {})\
+            .get("python_interpreter", DEFAULT_ANSIBLE_PYTHON_INTERPRETER)
+
+        # we set the bastion public IP for a SSH proxy access mode
+        if operation.scope_config_dict.get("use_proxy", False):
+            # the bastion is the same for all the VMs of a network
+            if vm.network not in escape_bastions.keys():
+                escape_bastions[vm.network] = get_escape_bastion(operation, vm.network)
+            # we attribute the bastion to the SSH parameters for the current VM
+            vm.bastion_name, vm.bastion_address = escape_bastions[vm.network]
+
+    # the VM records hold the parameters read by the ssh.cfg templates
+    operation.scope_config_dict["vm_ssh_params"] = operation.vms.records
 
 
 def set_vm_ansible_parameters(operation: Operation, vm_name: str) -> dict:
@@ -230,24 +221,19 @@ def set_vm_ansible_parameters(operation: Operation, vm_name: str) -> dict:
     :return vm_ssh_parameters: dict of SSH parameters to reach the VM with Ansible
     """
 
-    ansible_ssh_host = operation.scope_unpacked_ips[vm_name].split(':')[0]
+    vm = operation.vms.get(vm_name)
 
     if operation.default_user:
-        ansible_user = operation.scope_config_dict["vm_ssh_params"][vm_name]["os_user"]
+        ansible_user = vm.os_user
     else:
-        ansible_user = operation.scope_config_dict["vm_ssh_params"][vm_name]["standard_user"]
-
-    ansible_python_interpreter =\
-        operation.scope_config_dict["vm_ssh_params"][vm_name]["ansible_python_interpreter"]
-
-    ansible_ssh_port = operation.scope_config_dict["vm_ssh_params"][vm_name]["ssh_port"]
+        ansible_user = vm.standard_user
 
     vm_ssh_parameters = {
-        "ansible_ssh_host": ansible_ssh_host
+        "ansible_ssh_host": vm.private_ip
     }
 
-    if ansible_ssh_port != "22":
-        vm_ssh_parameters["ansible_ssh_port"] = ansible_ssh_port
+    if vm.ssh_port != "22":
+        vm_ssh_parameters["ansible_ssh_port"] = vm.ssh_port
 
     if ansible_user != os.environ["CLOUDTIGER_SSH_USERNAME"]:
         vm_ssh_parameters["ansible_user"] = ansible_user
@@ -256,15 +242,15 @@ def set_vm_ansible_parameters(operation: Operation, vm_name: str) -> dict:
             vm_ssh_parameters["ansible_become_pass"] = ansible_user
             vm_ssh_parameters["ansible_ssh_pass"] = ansible_user
 
-    if ansible_python_interpreter != DEFAULT_ANSIBLE_PYTHON_INTERPRETER:
-        vm_ssh_parameters["ansible_python_interpreter"] = ansible_python_interpreter
+    if vm.ansible_python_interpreter != DEFAULT_ANSIBLE_PYTHON_INTERPRETER:
+        vm_ssh_parameters["ansible_python_interpreter"] = vm.ansible_python_interpreter
 
     return vm_ssh_parameters
 
 
 def group_hosts(operation: Operation) -> dict:
 
-    """ this function takes the operation.scope_config_dict["vm"] dictionary
+    """ this function takes the VM registry of the operation
     and return a dictionary ready for dump as an ansible hosts file 
 
     :param operation: Operation, the current Operation
@@ -272,77 +258,33 @@ def group_hosts(operation: Operation) -> dict:
     :return host_file: dict the content of the hosts.yml file for Ansible
     """
 
-    scope_groups = [
-        item
-        for _, _, _, group_list in operation.scope_config_dict["unpacked_vms"]
-        for item in group_list
-    ]
-    scope_groups = list(set(scope_groups))
-
-    scope_subnets = list(set([
-        subnet
-        for _, _, subnet, _ in operation.scope_config_dict["unpacked_vms"]
-        ]))
-
-    group_children = {
-        scope_group: {
-            "hosts": {
-                vm_name: set_vm_ansible_parameters(operation, vm_name)
-                for vm_name, _, _, vm_groups
-                in operation.scope_config_dict["unpacked_vms"] if scope_group in vm_groups
-            }
-        } for scope_group in scope_groups
+    # the parameters of each VM are computed once, and copied in each of its groups
+    # (a shared dictionary would be dumped as a yaml alias)
+    vms_parameters = {
+        vm.name: set_vm_ansible_parameters(operation, vm.name) for vm in operation.vms
     }
 
-    subnet_children = {
-        subnet: {
-            "hosts": {
-                vm_name: set_vm_ansible_parameters(operation, vm_name)
-                for vm_name, _, subnet_name, _
-                in operation.scope_config_dict["unpacked_vms"] if subnet_name == subnet
-            }
-        } for subnet in scope_subnets
-    }
+    def hosts_children(index: dict) -> dict:
+        return {
+            key: {
+                "hosts": {vm.name: dict(vms_parameters[vm.name]) for vm in vms}
+            } for key, vms in index.items()
+        }
 
     host_file = {
         "all": {
             "vars": operation.scope_config_dict\
                 .get("custom_ssh_parameters", {}).get("all", {}).get("vars", {}),
-            "children": {** group_children, **subnet_children}
+            "children": {**hosts_children(operation.vms.by_group),
+                         **hosts_children(operation.vms.by_subnet)}
         }
     }
 
     if operation.consolidated:
         # if we are in consolidated mode, we also group VMs by environment and
         # by owner
-        all_environments = list(set(
-            {vm["env"] for vm in operation.scope_config_dict["vm_ssh_params"].values()}))
-
-        environment_children = {
-            environment: {
-                "hosts": {
-                    vm_name: set_vm_ansible_parameters(operation, vm_name)
-                    for vm_name, content in operation.scope_config_dict["vm_ssh_params"].items()
-                    if content["env"] == environment
-                }
-            } for environment in all_environments
-        }
-
-        all_owners = list(set(
-            {vm["owner"] for vm in operation.scope_config_dict["vm_ssh_params"].values()}))
-
-        owner_children = {
-            owner: {
-                "hosts": {
-                    vm_name: set_vm_ansible_parameters(operation, vm_name)
-                    for vm_name, content in operation.scope_config_dict["vm_ssh_params"].items()
-                    if content["owner"] == owner
-                }
-            } for owner in all_owners
-        }
-
-        host_file["all"]["children"].update(environment_children)
-        host_file["all"]["children"].update(owner_children)
+        host_file["all"]["children"].update(hosts_children(operation.vms.by_env))
+        host_file["all"]["children"].update(hosts_children(operation.vms.by_owner))
 
     return host_file
 
@@ -378,8 +320,11 @@ def create_inventory(operation: Operation):
     # then, we define the location of the target ssh.cfg
     ssh_cfg_output = os.path.join(operation.scope_folder, 'inventory', "ssh.cfg")
 
-    # we create the ssh.cfg file
-    j2(operation.logger, ssh_cfg_template, operation.scope_config_dict, ssh_cfg_output)
+    # we create the ssh.cfg file (the generated files are only written when they change)
+    nb_changed_files = len(operation.changed_files)
+    if j2(operation.logger, ssh_cfg_template, operation.scope_config_dict, ssh_cfg_output,
+          os.path.join(operation.libraries_path, "internal")):
+        operation.changed_files.append(ssh_cfg_output)
 
     # set hosts.yml
 
@@ -389,8 +334,8 @@ def create_inventory(operation: Operation):
     # then, we define the location of the target hosts.yml
     host_file_output = os.path.join(operation.scope_folder, "inventory", "hosts.yml")
 
-    with open(host_file_output, "w") as f:
-        yaml.dump(host_file_content, f)
+    if write_if_changed(operation.logger, host_file_output, yaml.dump(host_file_content)):
+        operation.changed_files.append(host_file_output)
 
     # set ansible.cfg
     # if we are using the default OS user, we disable host fingerprint checking
@@ -400,7 +345,12 @@ def create_inventory(operation: Operation):
         )
     else:
         ansible_cfg = os.path.join(operation.libraries_path, "internal", "inventory", "ansible.cfg")
-    shutil.copy(ansible_cfg, os.path.join(operation.scope_folder, "inventory", "ansible.cfg"))
+    copy_if_changed(operation.logger, ansible_cfg,
+                    os.path.join(operation.scope_folder, "inventory", "ansible.cfg"),
+                    operation.changed_files)
+
+    operation.logger.info("Inventory created (%s file(s) changed)"
+                          % (len(operation.changed_files) - nb_changed_files))
 
 
 def install_ansible_dependencies(operation: Operation):
@@ -446,7 +396,7 @@ def install_ansible_dependencies(operation: Operation):
         command += " --force"
 
     bash_action(operation.logger, command, operation.project_root,
-                os.environ, operation.stdout_file)
+                os.environ, operation.stdout_file, check=True)
 
 
 def install_ansible_playbooks(operation: Operation):
@@ -499,7 +449,8 @@ def prepare_ansible(operation: Operation):
     else:
         ansible_config_dict = operation.scope_config_dict
 
-    j2(operation.logger, execute_ansible_template, ansible_config_dict, execute_ansible_output)
+    j2(operation.logger, execute_ansible_template, ansible_config_dict, execute_ansible_output,
+       os.path.join(operation.libraries_path, "internal"))
 
 
 def execute_ansible(operation: Operation):
@@ -533,7 +484,7 @@ def execute_ansible(operation: Operation):
         command += ' --extra-vars "ansible_become_pass=$(echo $CLOUDTIGER_SSH_PASSWORD | base64 --decode)"'
 
     bash_action(operation.logger, command, operation.scope_inventory_folder,
-                ansible_environ, operation.stdout_file, operation.stderr_file)
+                ansible_environ, operation.stdout_file, operation.stderr_file, check=True)
 
 
 def setup_ssh_connection(operation: Operation):
@@ -546,6 +497,10 @@ def setup_ssh_connection(operation: Operation):
     :return: empty return
     """
 
+    # Ansible is slow to import, we only load it when needed
+    from ansible.inventory.manager import InventoryManager
+    from ansible.parsing.dataloader import DataLoader
+
     operation.logger.info("Collecting list of all VMs")
 
     data_loader = DataLoader()
@@ -560,11 +515,18 @@ def setup_ssh_connection(operation: Operation):
 
     all_vms_ip = inventory.get_groups_dict()["all"]
 
+    # there is no fingerprint to remove without a known_hosts file
+    known_hosts = format("/home/%s/.ssh/known_hosts" % os.environ["USER"])
+    if not os.path.isfile(known_hosts):
+        operation.logger.debug("No %s file, no fingerprint to remove" % known_hosts)
+        return
+
     for vm in all_vms_ip:
         operation.logger.debug("Removing vm %s from known hosts" % vm)
-        command = format("ssh-keygen -f \"/home/%s/.ssh/known_hosts\" -R \"%s\""
-                         % (os.environ["USER"], operation.scope_unpacked_ips[vm]))
-        bash_action(operation.logger, command, operation.scope_inventory_folder, os.environ)
+        command = format("ssh-keygen -f \"%s\" -R \"%s\""
+                         % (known_hosts, operation.vms.get(vm).address))
+        bash_action(operation.logger, command, operation.scope_inventory_folder, os.environ,
+                    check=True)
 
 
 def meta_aggregate(operation: Operation):
@@ -579,28 +541,24 @@ def meta_aggregate(operation: Operation):
     meta_config = {'ansible':dict()}
     meta_config_path = os.path.join(operation.scope_config_folder, "meta_config.yml")
     if os.path.isfile(meta_config_path):
-        with open(meta_config_path, "r") as f:
-            try:
-                meta_config = yaml.load(f, Loader=yaml.FullLoader)
-            except Exception as e:
-                operation.logger.error(format(
-                    "Failed to open meta_config file %s with error %s" % (meta_config_path, e)))
-
-    # we loop through the config folder
-    for (root, dirs, files) in os.walk(operation.scope_config_folder):
-        if 'config.yml' in files:
-            subconfig_path = os.path.join(root, 'config.yml')
-            subconfig_scope = os.path.join(
-                *(subconfig_path.split(os.sep)
-                  [len(operation.scope_config_folder.split(os.sep)):-1])
-            )
-            with open(subconfig_path, 'r') as f:
-                try:
-                    subconfig_data = yaml.load(f, Loader=yaml.FullLoader)
-                except Exception as e:
-                    operation.logger.error(format(
-                        "Failed to open file %s with error %s" % (subconfig_path, e)))
-            meta_config['ansible'][subconfig_scope] = subconfig_data.get('ansible')
+        try:
+            meta_config = load_yaml(operation.logger, meta_config_path)
+        except Exception as e:
+            operation.logger.error(format(
+                "Failed to open meta_config file %s with error %s" % (meta_config_path, e)))
+
+    # we loop through the scopes inside the config folder
+    scope_index = get_scope_index(operation.logger, operation.project_root)
+    for indexed_scope in scope_index.select(operation.scope):
+        subconfig_path = os.path.join(operation.project_root, 'config', indexed_scope,
+                                      'config.yml')
+        subconfig_scope = os.path.relpath(indexed_scope, operation.scope)
+        try:
+            subconfig_data = load_yaml(operation.logger, subconfig_path)
+        except Exception as e:
+            operation.logger.error(format(
+                "Failed to open file %s with error %s" % (subconfig_path, e)))
+        meta_config['ansible'][subconfig_scope] = subconfig_data.get('ansible')
 
     # we write the meta_config.yml
     meta_config_path = os.path.join(operation.scope_config_folder, "meta_config.yml")
@@ -620,8 +578,7 @@ def meta_distribute(operation: Operation):
 
     # we load the meta_config data
     meta_config_path = os.path.join(operation.scope_config_folder, "meta_config.yml")
-    with open(meta_config_path, "r") as f:
-        meta_config = yaml.load(f, Loader=yaml.FullLoader)
+    meta_config = load_yaml(operation.logger, meta_config_path)
 
     # ensure the ansible entry is well defined
     meta_config['ansible'] = meta_config.get('ansible', {})
@@ -629,18 +586,11 @@ def meta_distribute(operation: Operation):
     meta_defined_scopes = meta_config.get('ansible', {}).keys()
 
     # set empty ansible entries for scopes in the folder tree but without meta_config data
-    for (root, _, files) in os.walk(operation.scope_config_folder):
-        if 'config.yml' in files:
-            subconfig_path = os.path.join(root, 'config.yml')
-            subconfig_scope = subconfig_path.split(os.sep)[
-                len(operation.scope_config_folder.split(os.sep)):-1
-            ]
-            if len(subconfig_scope) > 0:
-                subconfig_scope = os.path.join(*subconfig_scope)
-            else:
-                subconfig_scope = "."
-            if subconfig_scope not in meta_defined_scopes:
-                meta_config['ansible'][subconfig_scope] = {}
+    scope_index = get_scope_index(operation.logger, operation.project_root)
+    for indexed_scope in scope_index.select(operation.scope):
+        subconfig_scope = os.path.relpath(indexed_scope, operation.scope)
+        if subconfig_scope not in meta_defined_scopes:
+            meta_config['ansible'][subconfig_scope] = {}
 
     for scope, scope_content in meta_config['ansible'].items():
         subconfig_path = os.path.join(operation.scope_config_folder, scope, 'config.yml')
@@ -648,14 +598,13 @@ def meta_distribute(operation: Operation):
             operation.logger.debug("Updating ansible config for scope %s" % scope)
             subconfig_data = {}
             # loading pre-existing config
-            with open(subconfig_path, 'r') as f:
-                try:
-                    subconfig_data = yaml.load(f, Loader=yaml.FullLoader)
-                except Exception as e:
-                    operation.logger.error("Failed to open file %s with error %s"
-                                          % (subconfig_path, e))
+            try:
+                subconfig_data = load_yaml(operation.logger, subconfig_path)
+            except Exception as e:
+                operation.logger.error("Failed to open file %s with error %s"
+                                      % (subconfig_path, e))
             # updating config with ansible data for considered scope
-            subconfig_data['ansible'] = scope_content.get('tasks', {})
+            subconfig_data['ansible'] = scope_content.get('tasks', [])
 
             # adding ansible_params if necessary
             if "params" in scope_content.keys():
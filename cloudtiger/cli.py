@@ -1,31 +1,17 @@
 """Console script for cloudtiger."""
+import copy
+import importlib
 import os
 import sys
 
 import click
 
-from cloudtiger.init import (
-    folder,
-    config,
-    set_ssh_keys,
-    configure_ip,
-    prepare_scope_folder,
-    init_meta_aggregate,
-    init_meta_distribute
-)
-from cloudtiger.ans import (
-    load_ssh_parameters,
-    load_ssh_parameters_meta,
-    create_inventory,
-    setup_ssh_connection,
-    prepare_ansible,
-    execute_ansible
-)
-from cloudtiger.cloudtiger import Operation
-from cloudtiger.common_tools import create_logger
-from cloudtiger.data import allowed_actions, available_api_services
-from cloudtiger.service import tf_service_generic, prepare
-from cloudtiger.tf import tf_generic
+from cloudtiger.cloudtiger import LIBRARIES_PATH, Operation
+from cloudtiger.common_tools import create_logger, precompile_templates, set_log_context
+from cloudtiger.data import TF_APPROVAL_ACTIONS, allowed_actions, available_api_services
+from cloudtiger.project import get_project_context
+from cloudtiger.scheduler import run_operations
+from cloudtiger.scope_index import get_scope_index
 
 
 @click.group()
@@ -39,16 +25,35 @@ from cloudtiger.tf import tf_generic
 @click.option('--recursive', '-r', is_flag=True, default=False,
               help="this option will apply your command recursively on all scope folders inside"
               "current folder")
+@click.option('--select', '-s', multiple=True,
+              help="used with --recursive, only apply your command on the scopes matching"
+              " a criterion 'provider=<PATTERN>', 'service=<PATTERN>' or 'name=<PATTERN>'"
+              " (can be repeated)")
+@click.option('--jobs', '-j', default=1, type=int,
+              help="number of scopes processed in parallel when used with --recursive."
+              " Each scope then logs into <PROJECT_ROOT>/scopes/<SCOPE>/logs")
 @click.option('--verbose', '-v', is_flag=True, default=False,
               help="set logger to verbose mode")
+@click.option('--json-logs', is_flag=True, default=False, envvar="CLOUDTIGER_JSON_LOGS",
+              help="write the log files as JSON lines")
+@click.option('--remote', is_flag=True, default=False, envvar="CLOUDTIGER_REMOTE",
+              help="send the command to the CloudTiger daemon of the project root"
+              " (see the 'serve' command)")
 @click.argument('scope')
 @click.pass_context
-def main(context, scope, project_root, libraries_path, output_file, error_file, recursive, verbose):
+def main(context, scope, project_root, libraries_path, output_file, error_file, recursive, select,
+         jobs, verbose, json_logs, remote):
     """ Cloud Tiger is a CLI tool for creating, configuring and managing infrastructures.
     """
 
+    # the command is executed by the daemon, with the same arguments
+    if remote:
+        from cloudtiger.daemon import forward_command
+        args = [arg for arg in sys.argv[1:] if arg != "--remote"]
+        sys.exit(forward_command(os.path.expanduser(project_root), args))
+
     # create a logger for the command
-    logger = create_logger(verbose=verbose)
+    logger = create_logger(verbose=verbose, json_logs=json_logs)
 
     logger.info("Starting Cloud Tiger")
 
@@ -80,28 +85,33 @@ def main(context, scope, project_root, libraries_path, output_file, error_file,
     # of current working directory
 
     if recursive:
-        for root, _, files in os.walk(os.path.join(project_root, scope)):
-            for file in files:
-                if file == "config.yml":
-                    subscope = root.lstrip('./').rstrip('/')
-                    logger.info(
-                        "Will execute Cloud Tiger action on subscope %s" % subscope)
-                    scopes.append(subscope)
+        scope_index = get_scope_index(logger, project_root)
+        for indexed_scope in scope_index.select(scope, select):
+            subscope = os.path.join("config", indexed_scope)
+            logger.info(
+                "Will execute Cloud Tiger action on subscope %s" % subscope)
+            scopes.append(subscope)
 
         # otherwise, we consider the current working directory as a simple scope
     else:
         logger.info("Starting Cloud Tiger action on simple scope %s", scope)
         scopes = [scope]
 
+    # the files shared by all scopes are loaded once
+    project_context = None
+    if os.path.exists(os.path.join(project_root, ".env")):
+        project_context = get_project_context(logger, project_root,
+                                              libraries_path or LIBRARIES_PATH)
+
     for scope_elt in scopes:
         operation = Operation(logger, project_root, scope_elt, libraries_path, output_file,
-                              error_file)
+                              error_file, project_context)
         # let us check if the provided scope is a well-configured scope in a well-configured
         # project folder
         # if not the case, we should assume that we are using a `init folder` or `init config`
         # command
         root_dotenv = os.path.join(project_root, ".env")
-        config_file = os.path.join(project_root, scope, "config.yml")
+        config_file = os.path.join(project_root, scope_elt, "config.yml")
         if os.path.exists(root_dotenv) & os.path.exists(config_file):
             operation.scope_setup()
             operation.secrets_setup()
@@ -109,14 +119,330 @@ def main(context, scope, project_root, libraries_path, output_file, error_file,
 
         operations.append(operation)
 
+    # invalid scopes are rejected before running any action on any scope
+    invalid_scopes = [operation.scope for operation in operations
+                      if len(getattr(operation, "config_errors", [])) > 0]
+    if len(invalid_scopes) > 0:
+        logger.error("Invalid configuration in scope(s) : %s" % ", ".join(invalid_scopes))
+        sys.exit(format("Invalid configuration in %s scope(s)" % len(invalid_scopes)))
+
     # necessary to pass main CLI context to sub actions
     context.obj = {
-        "operations": operations
+        "operations": operations,
+        "logger": logger,
+        "jobs": jobs,
+        "json_logs": json_logs
     }
 
     return
 
 
+def execute_operations(context, worker, *args):
+
+    """ this function applies a worker on all the operations of the CLI context,
+    and exits with an error if some scopes failed
+
+    :param context: click.Context, the main CLI context
+    :param worker: function, the function to apply on each operation
+    :param args: the extra arguments of the worker
+    """
+
+    # the log records of the operations carry the action, e.g. 'tf:apply'
+    action = context.info_name
+    if (len(args) > 0) and isinstance(args[0], str):
+        action += ":" + args[0]
+    set_log_context(action=action)
+
+    failures = run_operations(context.obj['logger'], context.obj['operations'], worker, args,
+                              context.obj['jobs'], context.obj['json_logs'])
+
+    if len(failures) > 0:
+        sys.exit(format("Cloud Tiger action failed on %s scope(s)" % len(failures)))
+
+
+def check_approval(context, tf_actions: list, auto_approve: bool):
+
+    """ this function refuses to run Terraform actions asking for an approval on scopes run
+    in parallel : their commands have no terminal, and would wait for an answer forever
+
+    :param context: click.Context, the main CLI context
+    :param tf_actions: list, the Terraform actions to run on each scope
+    :param auto_approve: bool, set to True if the actions are run without approval
+    """
+
+    if auto_approve or (context.obj['jobs'] <= 1) or (len(context.obj['operations']) <= 1):
+        return
+
+    for tf_action in tf_actions:
+        if tf_action in TF_APPROVAL_ACTIONS:
+            raise click.UsageError("'terraform %s' asks for an approval, which cannot be "
+                                   "given to scopes run in parallel : use --auto-approve, "
+                                   "or --jobs 1" % tf_action)
+
+
+def init_operation(operation: Operation, action: str):
+
+    """ this function executes an 'init' action on an operation
+
+    :param operation: Operation, the current Operation
+    :param action: str, the init action
+    """
+
+    operation.logger.info("init action")
+
+    # check if action is allowed
+    if action in allowed_actions["init"].keys():
+
+        operation.logger.debug("%s command" %
+                               allowed_actions["init"][action])
+        # subcommand modules are imported only when needed, in order to keep
+        # the CLI startup fast
+        init_module = importlib.import_module("cloudtiger.init")
+        getattr(init_module, allowed_actions["init"][action])(operation)
+
+    else:
+        # unallowed action
+        operation.logger.error("Unallowed action %s" % action)
+
+
+def tf_operation(operation: Operation, action: str, nolock: bool, dry_run: bool = False,
+                 force: bool = False, drift_check: bool = False, auto_approve: bool = False):
+
+    """ this function executes a 'tf' action on an operation
+
+    :param operation: Operation, the current Operation
+    :param action: str, the Terraform action
+    :param nolock: bool, set to True to use Terraform with the '-lock=false' flag
+    :param dry_run: bool, set to True to only display the resources removed from the state
+    :param force: bool, set to True to plan and apply the scope even if it is unchanged
+    :param drift_check: bool, set to True to plan the scope if it is unchanged, and fail if
+    the plan has changes
+    :param auto_approve: bool, set to True to apply and destroy without asking for an approval
+    """
+
+    operation.logger.debug("tf action")
+
+    # do we apply no-lock flag ?
+    if nolock:
+        operation.tf_no_lock = True
+
+    if dry_run:
+        operation.tf_dry_run = True
+
+    if force:
+        operation.tf_force = True
+
+    if drift_check:
+        operation.tf_drift_check = True
+
+    if auto_approve:
+        operation.tf_auto_approve = True
+
+    # check if action is allowed
+    if action in allowed_actions["tf"].keys():
+
+        operation.logger.debug("%s command" % allowed_actions["tf"][action])
+        from cloudtiger.tf import tf_generic
+        tf_generic(operation, allowed_actions["tf"][action])
+
+    else:
+        # unallowed action
+        operation.logger.error("Unallowed action %s" % action)
+
+
+def ans_operation(operation: Operation, action: str, consolidated: bool, default_user: bool,
+                  restricted_vms: str, ansible_force_install: bool, port: str, no_check: bool):
+
+    """ this function executes an 'ans' action on an operation
+
+    :param operation: Operation, the current Operation
+    :param action: str, the Ansible action
+    :param consolidated: bool, running the ansible command in the 'meta' folder
+    :param default_user: bool, use the default user of the VM
+    :param restricted_vms: str, restrict ansible command to hosts listed
+    :param ansible_force_install: bool, force the installation of Ansible dependencies
+    :param port: str, the SSH port
+    :param no_check: bool, disable fingerprint check at SSH connection
+    """
+
+    operation.set_ansible_options(
+        consolidated,
+        default_user,
+        ansible_force_install,
+        restricted_vms,
+        port,
+        no_check
+    )
+
+    operation.logger.info("ansible action")
+
+    ans_module = importlib.import_module("cloudtiger.ans")
+
+    # in consolidated mode, the VMs are restricted once the registry holds the VMs of
+    # all_addresses_info.yml (see load_ssh_parameters_meta)
+    if operation.restricted_vms and not operation.consolidated:
+        operation.set_restricted_vms()
+
+    if action in allowed_actions["ans"].keys():
+        operation.logger.debug("%s command" %
+                               allowed_actions["ans"][action])
+
+        # we load the SSH config parameters
+        if allowed_actions["ans"][action] != "meta_distribute":
+            operation.set_terraform_output_info()
+            if not operation.consolidated:
+                ans_module.load_ssh_parameters(operation)
+            else:
+                ans_module.load_ssh_parameters_meta(operation)
+
+        # if the action chosen is 'securize', it means we roll
+        # 'devops init' role after ans 1 --d, ans 2 --d
+        if allowed_actions["ans"][action] == "securize":
+            # the default user and the devops init tasks are only used by this action, not
+            # by the next steps of a pipeline sharing the operation
+            default_user = operation.default_user
+            ansible_tasks = copy.deepcopy(operation.scope_config_dict.get("ansible"))
+            try:
+                operation.default_user = True
+                operation.devops_init()
+                ans_module.create_inventory(operation)
+                ans_module.setup_ssh_connection(operation)
+                ans_module.prepare_ansible(operation)
+                ans_module.execute_ansible(operation)
+            finally:
+                operation.default_user = default_user
+                if ansible_tasks is None:
+                    operation.scope_config_dict.pop("ansible", None)
+                else:
+                    operation.scope_config_dict["ansible"] = ansible_tasks
+            return
+
+        getattr(ans_module, allowed_actions["ans"][action])(operation)
+
+    else:
+        operation.logger.error("Unallowed action %s" % action)
+
+
+def service_operation(operation: Operation, name: str, step: str, auto_approve: bool = False):
+
+    """ this function executes a 'service' step on an operation
+
+    :param operation: Operation, the current Operation
+    :param name: str, the name of the service
+    :param step: str, the service step
+    :param auto_approve: bool, set to True to apply and destroy without asking for an approval
+    """
+
+    operation.logger.info("service action")
+
+    if auto_approve:
+        operation.tf_auto_approve = True
+
+    # check if service exists and is well defined
+    if name not in operation.scope_config_dict.keys():
+        operation.logger.error("Warning : the requested service is "
+                               "not defined in the config.yml file. Exiting")
+        sys.exit()
+
+    if name not in available_api_services:
+        operation.logger.error("Warning : the requested service is "
+                               "not available in CloudTiger. Exiting")
+        sys.exit()
+
+    if step in allowed_actions["service"].keys():
+
+        operation.logger.debug("%s command" %
+                               allowed_actions["service"][step])
+
+        from cloudtiger.service import tf_service_generic, prepare
+
+        if allowed_actions["service"][step] == "prepare":
+            prepare(operation, name)
+        else:
+            tf_service_generic(operation, allowed_actions["service"][step], name)
+
+    else:
+        operation.logger.error("Unallowed service %s" % name)
+
+
+def parse_pipeline(steps: str) -> list:
+
+    """ this function parses and checks the steps of a pipeline, written as
+    '<COMMAND>:<ACTION>' (or 'service:<NAME>:<STEP>') separated by commas
+
+    :param steps: str, the steps of the pipeline
+
+    :return: list, the list of steps as tuples (command, action[, service name])
+    """
+
+    pipeline = []
+    for step in steps.split(","):
+        step_elts = step.strip().split(":")
+        if (len(step_elts) == 3) & (step_elts[0] == "service"):
+            if step_elts[1] not in available_api_services:
+                raise click.BadParameter("Unknown service in step %s" % step)
+            if step_elts[2] not in allowed_actions["service"].keys():
+                raise click.BadParameter("Unallowed service step in step %s" % step)
+            pipeline.append(("service", step_elts[2], step_elts[1]))
+        elif (len(step_elts) == 2) & (step_elts[0] in ["init", "tf", "ans"]):
+            if step_elts[1] not in allowed_actions[step_elts[0]].keys():
+                raise click.BadParameter("Unallowed action in step %s" % step)
+            pipeline.append((step_elts[0], step_elts[1]))
+        else:
+            raise click.BadParameter("Badly formatted step %s, expected <COMMAND>:<ACTION>"
+                                     " or service:<NAME>:<STEP>" % step)
+
+    return pipeline
+
+
+def pipeline_operation(operation: Operation, pipeline: list, nolock: bool, consolidated: bool,
+                       default_user: bool, restricted_vms: str, ansible_force_install: bool,
+                       port: str, no_check: bool, auto_approve: bool = False,
+                       dry_run: bool = False, force: bool = False, drift_check: bool = False):
+
+    """ this function executes the steps of a pipeline on an operation, one after another.
+    The operation (with its loaded configuration) is shared by all the steps : the files
+    modified by a step (config_ips.yml, terraform_output.json) are reloaded by the
+    following steps needing them
+
+    :param operation: Operation, the current Operation
+    :param pipeline: list, the steps of the pipeline (see parse_pipeline)
+    :param nolock: bool, set to True to use Terraform with the '-lock=false' flag
+    :param consolidated: bool, running the ansible command in the 'meta' folder
+    :param default_user: bool, use the default user of the VM
+    :param restricted_vms: str, restrict ansible command to hosts listed
+    :param ansible_force_install: bool, force the installation of Ansible dependencies
+    :param port: str, the SSH port
+    :param no_check: bool, disable fingerprint check at SSH connection
+    :param auto_approve: bool, set to True to apply and destroy without asking for an approval
+    :param dry_run: bool, set to True to only display the resources removed from the state
+    :param force: bool, set to True to plan and apply the scope even if it is unchanged
+    :param drift_check: bool, set to True to plan the scope if it is unchanged, and fail if
+    the plan has changes
+    """
+
+    for step_index, step in enumerate(pipeline, 1):
+        operation.logger.info("Pipeline step %s/%s : %s" % (step_index, len(pipeline),
+                                                             ":".join(step)))
+        set_log_context(action=":".join(step))
+        if step[0] == "init":
+            init_operation(operation, step[1])
+        elif step[0] == "tf":
+            tf_operation(operation, step[1], nolock, dry_run, force, drift_check, auto_approve)
+        elif step[0] == "ans":
+            ans_operation(operation, step[1], consolidated, default_user, restricted_vms,
+                          ansible_force_install, port, no_check)
+        else:
+            service_operation(operation, step[2], step[1], auto_approve)
+
+        # 'securize' writes the inventory and the playbook of the default user, the next
+        # steps use those of the configured user
+        if (step[0] == "ans") and (allowed_actions["ans"][step[1]] == "securize") \
+                and (step_index < len(pipeline)):
+            importlib.import_module("cloudtiger.ans").create_inventory(operation)
+            importlib.import_module("cloudtiger.ans").prepare_ansible(operation)
+
+
 @click.command('init', short_help='init actions')
 @click.argument('action')
 @click.pass_context
@@ -131,57 +457,55 @@ for the current scope in secrets/ssh/<PROVIDER>/private|public
 \n- meta_distribute (M2)  : distribute the meta_config.yml to children scopes
     """
 
-    for operation_context in context.obj['operations']:
-        operation: Operation = operation_context
+    operations = context.obj['operations']
 
-        operation.logger.info("init action")
+    # the SSH keys of all the scopes are generated at once, in a pool of processes
+    if (allowed_actions["init"].get(action) == "set_ssh_keys") & (len(operations) > 1):
+        importlib.import_module("cloudtiger.init").prepare_ssh_keys(context.obj['logger'],
+                                                                    operations)
 
-        # check if action is allowed
-        if action in allowed_actions["init"].keys():
+    # the templates are compiled once, before rendering them for each scope
+    if (allowed_actions["init"].get(action) == "prepare_scope_folder") & (len(operations) > 1):
+        precompile_templates(context.obj['logger'],
+                             os.path.join(operations[0].libraries_path, "internal"))
 
-            operation.logger.debug("%s command" %
-                                   allowed_actions["init"][action])
-            globals()[allowed_actions["init"][action]](operation)
-
-        else:
-            # unallowed action
-            operation.logger.error("Unallowed action %s" % action)
+    execute_operations(context, init_operation, action)
 
 
 @click.command('tf', short_help='Terraform actions')
 @click.argument('action')
 @click.option('--nolock', '-nl', is_flag=True, default=False,
               help="use Terraform with the '-lock=false' flag")
+@click.option('--dry-run', is_flag=True, default=False,
+              help="for 'import' and 'rm', only display the resources removed from the tfstate")
+@click.option('--force', '-f', is_flag=True, default=False,
+              help="plan and apply the scopes even if unchanged since their last apply")
+@click.option('--drift-check', is_flag=True, default=False,
+              help="plan the scopes unchanged since their last apply instead of skipping them, "
+                   "and fail the scopes whose plan has changes")
+@click.option('--auto-approve', is_flag=True, default=False,
+              help="apply and destroy without asking for an approval (needed with --jobs)")
 @click.pass_context
-def tf(context, action, nolock):
+def tf(context, action, nolock, dry_run, force, drift_check, auto_approve):
     """ Terraform actions
 \n- init (1)             : run Terraform init
-\n- apply (2)            : run Terraform apply & output
+\n- apply (2)            : run Terraform apply & output (skipped if the scope is unchanged
+since its last apply)
 \n- output (O)           : run Terraform output
 \n- import (I)           : custom command for cleaning current tfstate
 from declared resources and reimporting them
+\n- rm                   : remove the declared VMs from the tfstate
+\n- bulk_import (BI)     : import the declared VMs missing from the tfstate
+with a single plan & apply (Terraform >= 1.5)
 \n- refresh (R)          : run Terraform refresh & output
 \n- destroy (D)          : run Terraform destroy
+\n- mirror (M)           : copy the Terraform providers into the mirror of the project
     """
 
-    for operation_context in context.obj['operations']:
-        operation: Operation = operation_context
-
-        operation.logger.debug("tf action")
-
-        # do we apply no-lock flag ?
-        if nolock:
-            operation.tf_no_lock = True
+    check_approval(context, [allowed_actions["tf"].get(action)], auto_approve)
 
-        # check if action is allowed
-        if action in allowed_actions["tf"].keys():
-
-            operation.logger.debug("%s command" % allowed_actions["tf"][action])
-            tf_generic(operation, allowed_actions["tf"][action])
-
-        else:
-            # unallowed action
-            operation.logger.error("Unallowed action %s" % action)
+    execute_operations(context, tf_operation, action, nolock, dry_run, force, drift_check,
+                       auto_approve)
 
 
 @click.command('ans', short_help='Ansible actions')
@@ -196,7 +520,8 @@ from declared resources and reimporting them
               help="will execute ssh connexion using the default user of the VM")
 @click.option('--restricted-vms', '-r',
               default=None,
-              help="restrict ansible command to hosts listed")
+              help="restrict ansible command to hosts listed, as a comma-separated list of"
+              " VM names, groups, subnets, globs ('web-*') or regexes ('re:web-[0-9]+')")
 @click.option('--ansible-force-install', '-F',
               is_flag=True,
               default=False)
@@ -220,57 +545,17 @@ def ans(context, action, consolidated, default_user, restricted_vms,
 \n- run_ansible (3)      : run Ansible meta-playbook
 """
 
-    for operation_context in context.obj['operations']:
-        operation: Operation = operation_context
-
-        operation.set_ansible_options(
-            consolidated,
-            default_user,
-            ansible_force_install,
-            restricted_vms,
-            port,
-            no_check
-        )
-
-        operation.logger.info("ansible action")
-
-        if operation.restricted_vms:
-            operation.set_restricted_vms()
-
-        if action in allowed_actions["ans"].keys():
-            operation.logger.debug("%s command" %
-                                   allowed_actions["ans"][action])
-
-            # we load the SSH config parameters
-            if allowed_actions["ans"][action] != "meta_distribute":
-                operation.set_terraform_output_info()
-                if not operation.consolidated:
-                    load_ssh_parameters(operation)
-                else:
-                    load_ssh_parameters_meta(operation)
-
-            # if the action chosen is 'securize', it means we roll
-            # 'devops init' role after ans 1 --d, ans 2 --d
-            if allowed_actions["ans"][action] == "securize":
-                operation.default_user = True
-                operation.devops_init()
-                create_inventory(operation)
-                setup_ssh_connection(operation)
-                prepare_ansible(operation)
-                execute_ansible(operation)
-                return
-
-            globals()[allowed_actions["ans"][action]](operation)
-
-        else:
-            operation.logger.error("Unallowed action %s" % action)
+    execute_operations(context, ans_operation, action, consolidated, default_user,
+                       restricted_vms, ansible_force_install, port, no_check)
 
 
 @click.command('service', short_help='service configuration')
 @click.argument('name')
 @click.argument('step')
+@click.option('--auto-approve', is_flag=True, default=False,
+              help="apply and destroy without asking for an approval (needed with --jobs)")
 @click.pass_context
-def service(context, name, step):
+def service(context, name, step, auto_approve):
     """ Service configuration through Terraform
 service names:
 \n- gitlab                : configure Gitlab
@@ -283,37 +568,87 @@ steps :
 \n- destroy (D)           : run Terraform destroy
     """
 
-    for operation_context in context.obj['operations']:
-        operation: Operation = operation_context
+    check_approval(context, [allowed_actions["service"].get(step)], auto_approve)
 
-        operation.logger.info("service action")
+    execute_operations(context, service_operation, name, step, auto_approve)
 
-        # check if service exists and is well defined
-        if name not in operation.scope_config_dict.keys():
-            operation.logger.error("Warning : the requested service is "
-                                   "not defined in the config.yml file. Exiting")
-            sys.exit()
 
-        if name not in available_api_services:
-            operation.logger.error("Warning : the requested service is "
-                                   "not available in CloudTiger. Exiting")
-            sys.exit()
+@click.command('run', short_help='run a pipeline of actions')
+@click.argument('steps')
+@click.option('--nolock', '-nl', is_flag=True, default=False,
+              help="use Terraform with the '-lock=false' flag")
+@click.option('--consolidated', '-c',
+              is_flag=True,
+              default=False,
+              help="running the ansible command in the 'meta' folder")
+@click.option('--default-user', '-d',
+              is_flag=True,
+              default=False,
+              help="will execute ssh connexion using the default user of the VM")
+@click.option('--restricted-vms', '-r',
+              default=None,
+              help="restrict ansible command to hosts listed, as a comma-separated list of"
+              " VM names, groups, subnets, globs ('web-*') or regexes ('re:web-[0-9]+')")
+@click.option('--ansible-force-install', '-F',
+              is_flag=True,
+              default=False)
+@click.option('--port', '-P',
+              default='22',
+              help="set a different port for SSH connexion than the default one (22)")
+@click.option('--no-check', '-n',
+              is_flag=True,
+              default=False,
+              help="disable fingerprint check at SSH connection")
+@click.option('--auto-approve', is_flag=True, default=False,
+              help="apply and destroy without asking for an approval (needed with --jobs)")
+@click.option('--dry-run', is_flag=True, default=False,
+              help="for 'tf:import' and 'tf:rm', only display the resources removed from "
+                   "the tfstate")
+@click.option('--force', '-f', is_flag=True, default=False,
+              help="plan and apply the scopes even if unchanged since their last apply")
+@click.option('--drift-check', is_flag=True, default=False,
+              help="plan the scopes unchanged since their last apply instead of skipping them, "
+                   "and fail the scopes whose plan has changes")
+@click.pass_context
+def run(context, steps, nolock, consolidated, default_user, restricted_vms,
+        ansible_force_install, port, no_check, auto_approve, dry_run, force, drift_check):
+    """ Run several actions in a single process, as a comma-separated list
+of steps <COMMAND>:<ACTION> (or service:<NAME>:<STEP>), for instance :
+\n- init:1,init:2,tf:init,tf:apply,ans:1,ans:2,ans:H,ans:3
+\nThe configuration of the scope is loaded once for all the steps
+    """
 
-        if step in allowed_actions["service"].keys():
+    pipeline = parse_pipeline(steps)
+    check_approval(context, [allowed_actions[step[0]][step[1]] for step in pipeline
+                             if step[0] in ["tf", "service"]], auto_approve)
 
-            operation.logger.debug("%s command" %
-                                   allowed_actions["service"][step])
+    execute_operations(context, pipeline_operation, pipeline, nolock, consolidated,
+                       default_user, restricted_vms, ansible_force_install, port, no_check,
+                       auto_approve, dry_run, force, drift_check)
 
-            if allowed_actions["service"][step] == "prepare":
-                prepare(operation, name)
-            else:
-                tf_service_generic(operation, allowed_actions["service"][step], name)
 
-        else:
-            operation.logger.error("Unallowed service %s" % name)
+@click.command('serve', short_help='run a CloudTiger daemon')
+@click.option('--poll-interval', default=5.0, type=float,
+              help="number of seconds between two checks of modified configuration files")
+@click.pass_context
+def serve(context, poll_interval):
+    """ Run a CloudTiger daemon for the project root. The daemon keeps the parsed
+configuration of the project in memory, and runs the commands sent with the
+'--remote' option (or the CLOUDTIGER_REMOTE environment variable) :
+\n- cloudtiger --project-root <PROJECT_ROOT> . serve
+\n- cloudtiger --project-root <PROJECT_ROOT> --remote <SCOPE> <COMMAND> <SUBCOMMAND>
+    """
+
+    from cloudtiger.daemon import serve as serve_daemon
+
+    operation: Operation = context.obj['operations'][0]
+    serve_daemon(operation.logger, operation.project_root, operation.libraries_path,
+                 poll_interval)
 
 
 main.add_command(init)
 main.add_command(tf)
 main.add_command(ans)
 main.add_command(service)
+main.add_command(run)
+main.add_command(serve)
@@ -1,17 +1,18 @@
 """Main module."""
 
-import copy
-import json
 import os
 import sys
 from logging import Logger
 
-import pkg_resources
-import yaml
-from cloudtiger.common_tools import load_yaml, bash_source, merge_dictionaries
+from cloudtiger.common_tools import load_yaml, file_signature
 from cloudtiger.data import available_infra_services
+from cloudtiger.output_store import get_output_store
+from cloudtiger.project import ProjectContext, get_project_context
+from cloudtiger.scope_index import get_scope_index
+from cloudtiger.validation import validate_config
+from cloudtiger.vm_registry import VMRegistry
 
-LIBRARIES_PATH = pkg_resources.resource_filename('cloudtiger', 'libraries')
+LIBRARIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'libraries')
 
 
 class Operation:
@@ -43,12 +44,25 @@ class Operation:
         set to True if you want to apply the '--force' option to Ansible when installing
         the role requirements
     restricted_vms: str
-        specify a list of the VMs when you want to target then specifically when running
+        specify a comma-separated list of VM names, groups, subnets, globs or regular
+        expressions ('re:' prefix) when you want to target VMs specifically when running
         an Ansible action
     ssh_port: str
         the default SSH port for Ansible access
     tf_no_lock: bool
         set to True if you want to run Terraform action with the '-no-lock' option
+    tf_dry_run: bool
+        set to True to only display the resources removed from the Terraform state
+    tf_force: bool
+        set to True to plan and apply the scope even if it is unchanged since its last apply
+    tf_drift_check: bool
+        set to True to plan the scope (instead of skipping it) if it is unchanged since
+        its last apply, and to fail it if the plan has changes
+    tf_auto_approve: bool
+        set to True to run Terraform apply and destroy without asking for an approval
+    project: ProjectContext
+        the files shared by all the scopes of the project (root .env, standard
+        configurations, secrets), loaded once per process
     scope_config_folder: str
         the absolute path to the folder containing the current scope
     scope_config: str
@@ -57,6 +71,13 @@ class Operation:
         the absolute path to the meta_config.yml file of the current meta scope
     scope_config_dict: dict
         the dictionary of the content of config.yml
+    config_errors: list
+        the errors found by the validation of the config.yml (see validation.py)
+    vm_registry: VMRegistry
+        the registry of all the VMs of the scope
+    vms: VMRegistry
+        the registry of the VMs targeted by the operation (all VMs, or the VMs
+        listed in 'restricted_vms')
     used_services: list
         the list of infrastructure services set in config.yml (network, vm, iam, kubernetes, etc)
     provider: str
@@ -67,17 +88,23 @@ class Operation:
         the absolute path to the folder '<PROJECT_ROOT>/scopes/<SCOPE>/inventory
     scope_terraform_folder: str
         the absolute path to the folder '<PROJECT_ROOT>/scopes/<SCOPE>/terraform'
-    standard_config: dict
-        a dictionary of standard VMs and network configurations, merged from CloudTiger
-        sources and gitops folder
+    standard_config: LayeredConfig
+        a read-only dictionary of standard VMs and network configurations, resolved over
+        CloudTiger sources and gitops folder
     vm_type_provider: str
         same value as provider, except if the provider is not listed in the 'standard_config'.
         In this case, will be 'default'
     ssh_no_check: bool
         set to True if you want to deactivate SSH fingerprint when connecting to the VMs
     terraform_vm_data: dict
-        dictionary storing the content of the 'terraform_output.json' file
-        if it exists
+        dictionary storing the VMs of the 'terraform_output.json' file with a known
+        private IP, as read from the terraform output store
+    config_ips: tuple
+        modification time and size of the 'config_ips.yml' file when it was last loaded,
+        and its content
+    changed_files: list
+        the generated files (Terraform files, inventory, config_ips.yml) actually created
+        or modified by the actions of the Operation, unchanged files being left untouched
     datacenter_meta_folder: str
         absolute path to the 'meta' folder of the datacenter (used in combination with the
         'consolidated' option)
@@ -85,7 +112,8 @@ class Operation:
         dictionary storing the content of the 'all_networks.yml' file (used in combination
         with the 'consolidated' option)
     addresses_info: dict
-        dictionary storing the content of the 'all_addresses.yml' file (used in combination
+        dictionary storing the addresses of the VMs of the datacenter, from the terraform
+        output store and the optional 'all_addresses_info.yml' file (used in combination
         with the 'consolidated' option)
 
     Methods
@@ -106,7 +134,7 @@ class Operation:
         with the --consolidated option
     load_ips()
         loads the IPs listed in config_ips.yml into
-        the scope_config_dict in memory
+        the scope_config_dict and the VM registry in memory
     devops_init()
         overrides the ansible action defined in the config.yml to enforce
         the devops init role
@@ -118,7 +146,8 @@ class Operation:
                  scope: str,
                  libraries_path: str,
                  stdout_file,
-                 stderr_file
+                 stderr_file,
+                 project: ProjectContext = None
                  ):
         self.logger = logger
 
@@ -148,6 +177,9 @@ class Operation:
         self.stdout_file = stdout_file
         self.stderr_file = stderr_file
 
+        # files shared with the other Operations of the run, loaded by scope_setup if not set
+        self.project = project
+
         # set default values for an Operation
 
         # consolidated Ansible access"""
@@ -168,15 +200,34 @@ class Operation:
         # Terraform state lock
         self.tf_no_lock = False
 
+        # display the Terraform state changes without applying them
+        self.tf_dry_run = False
+
+        # plan and apply of the scopes unchanged since their last apply
+        self.tf_force = False
+        self.tf_drift_check = False
+
+        # apply and destroy without asking for an approval
+        self.tf_auto_approve = False
+
+        # signature and content of the config_ips.yml file when it was last loaded
+        self.config_ips = None
+
+        # generated files created or modified by the actions of the Operation
+        self.changed_files = []
+
     def scope_setup(self):
 
         """ this function set intermediate internal parameters for the current scope
         """
+        if self.project is None:
+            self.project = get_project_context(self.logger, self.project_root,
+                                               self.libraries_path)
+
         self.logger.debug("Loading .env from project root folder")
 
-        root_env = os.path.join(self.project_root, ".env")
-        if os.path.exists(root_env):
-            bash_source(self.logger, root_env)
+        if self.project.root_env is not None:
+            os.environ.update(self.project.root_env)
         else:
             self.logger.warning("WARNING: cannot read .env file at project root folder:\
                 file does not exist")
@@ -207,6 +258,15 @@ class Operation:
             self.scope_config_dict = {}
         self.scope_config_dict["scope"] = self.scope
 
+        # check the config.yml before any action (meta_config.yml files follow their own format)
+        self.config_errors = []
+        if self.scope_config != self.scope_meta_config:
+            self.config_errors, config_warnings = validate_config(self.scope_config_dict)
+            for warning in config_warnings:
+                self.logger.warning("WARNING: %s : %s" % (self.scope, warning))
+            for error in self.config_errors:
+                self.logger.error("Invalid configuration of %s : %s" % (self.scope, error))
+
         # extract list of used services - check if they are required in the config.yml file
         self.used_services = []
         for service in available_infra_services:
@@ -237,16 +297,8 @@ class Operation:
         # self.scope_data_folder = os.path.join(self.scope_folder, "data")
         # self.scope_dedicated_config_folder = os.path.join(self.scope_folder, "config")
 
-        # set standard VM spec values
-        cloudtiger_standard_file = os.path.join(
-            self.libraries_path, "internal", "standard", "vm_standard.yml")
-        cloudtiger_standard_config = load_yaml(self.logger, cloudtiger_standard_file)
-        local_standard_file = os.path.join(self.project_root, "standard", "standard.yml")
-        if os.path.exists(local_standard_file):
-            local_standard_config = load_yaml(self.logger, local_standard_file)
-        else:
-            local_standard_config = {}
-        self.standard_config = merge_dictionaries(cloudtiger_standard_config, local_standard_config)
+        # set standard VM spec values (shared by all scopes, must not be modified)
+        self.standard_config = self.project.standard_config
 
         # set provider alias for standard configuration
         if self.provider in self.standard_config["vm_types"].keys():
@@ -254,15 +306,9 @@ class Operation:
         else:
             self.vm_type_provider = "default"
 
-        # this function unpacks the map of vms
-        unpacked_vms = [
-            (vm_name, network_name, subnet_name, vm.get("group", "ungrouped").split(","))
-            for network_name, network_subnets in self.scope_config_dict.get('vm', {}).items()
-            for subnet_name, subnet_vms in network_subnets.items()
-            for vm_name, vm in subnet_vms.items()
-            ]
-
-        self.scope_config_dict["unpacked_vms"] = unpacked_vms
+        # we index the VMs of the scope
+        self.vm_registry = VMRegistry.from_config(self.scope_config_dict.get('vm', {}))
+        self.vms = self.vm_registry
 
     def secrets_setup(self):
 
@@ -275,8 +321,9 @@ class Operation:
         provider_account = self.scope_config_dict.get('provider_account', "")
         provider_secret = os.path.join(
             self.project_root, "secrets", self.provider, provider_account + '.env')
-        if os.path.exists(provider_secret):
-            bash_source(self.logger, provider_secret)
+        provider_secret_variables = self.project.get_secrets(self.provider, provider_account)
+        if provider_secret_variables is not None:
+            os.environ.update(provider_secret_variables)
 
         else:
             err = format("Cannot read %s file at project root folder: "
@@ -288,8 +335,9 @@ class Operation:
         for service_name, account_name in services_account.items():
             service_secret = os.path.join(
                 self.project_root, "secrets", service_name, account_name + '.env')
-            if os.path.exists(service_secret):
-                bash_source(self.logger, service_secret)
+            service_secret_variables = self.project.get_secrets(service_name, account_name)
+            if service_secret_variables is not None:
+                os.environ.update(service_secret_variables)
 
             else:
                 err = format("Cannot read %s file at project secrets folder:\
@@ -333,38 +381,27 @@ class Operation:
 
         # restrict Ansible operations on specific VMs
         if isinstance(self.restricted_vms, str):
-            restricted_vms = self.restricted_vms.split(",")
-            self.logger.info("Restricting operation to VMs %s" % self.restricted_vms)
-            restricted_vms_dict = copy.deepcopy(self.scope_config_dict['vm'])
-            for network_name, network_subnets in self.scope_config_dict['vm'].items():
-                for subnet_name, subnet_vms in network_subnets.items():
-                    for vm_name, _ in subnet_vms.items():
-                        if vm_name not in restricted_vms:
-                            restricted_vms_dict[network_name][subnet_name].pop(vm_name)
-            self.scope_config_dict['vm'] = restricted_vms_dict
-            restricted_unpacked_vms = [(vm_name, network_name, subnet_name, group)
-                                       for (vm_name, network_name, subnet_name, group)
-                                       in self.scope_config_dict["unpacked_vms"]
-                                       if vm_name in restricted_vms
-                                       ]
-            self.scope_config_dict["unpacked_vms"] = restricted_unpacked_vms
+            restricted_vms = set()
+            for pattern in self.restricted_vms.split(","):
+                matching_vms = self.vm_registry.match(pattern.strip())
+                if len(matching_vms) == 0:
+                    self.logger.warning("No VM matches '%s'" % pattern)
+                restricted_vms.update(matching_vms)
+            self.vms = self.vm_registry.restrict(restricted_vms)
+            self.logger.info("Restricting operation to %s VMs matching %s"
+                             % (len(self.vms), self.restricted_vms))
 
     def set_terraform_output_info(self):
 
-        """ this function loads the mapping vm/address from the
-        scopes/<SCOPE>/inventory/terraform_output.json file
+        """ this function loads the mapping vm/address from the terraform output store,
+        after ingesting the scopes/<SCOPE>/inventory/terraform_output.json file if it has
+        changed
         """
 
-        terraform_vm_data = {}
-        if os.path.isfile(self.terraform_output):
-            with open(self.terraform_output, 'r') as f:
-                terraform_output_data = json.load(f)
-
-            for vm_name, vm_data in terraform_output_data.get("vms", {}).get("value", {}).items():
-                if vm_data["private_ip"] not in ["", "not_learned_yet"]:
-                    terraform_vm_data[vm_name] = vm_data
+        output_store = get_output_store(self.logger, self.project_root)
+        output_store.sync([self.scope])
 
-        self.terraform_vm_data = terraform_vm_data
+        self.terraform_vm_data = output_store.get_scope_vms(self.scope)
 
     def load_meta_info(self):
 
@@ -372,7 +409,8 @@ class Operation:
         with the --consolidated option
         """
 
-        datacenter_root_folder = os.path.join(self.project_root, 'config', self.scope.split(os.sep)[0])
+        datacenter = self.scope.split(os.sep)[0]
+        datacenter_root_folder = os.path.join(self.project_root, 'config', datacenter)
         datacenter_subroot_folders = os.listdir(datacenter_root_folder)
         self.datacenter_meta_folder = '_meta'
         for folder in datacenter_subroot_folders:
@@ -381,41 +419,49 @@ class Operation:
                 break
 
         networks_info_file = os.path.join(self.datacenter_meta_folder, 'all_networks.yml')
-        with open(networks_info_file, "r") as f:
-            self.network_info = yaml.load(f, Loader=yaml.FullLoader)
-
+        self.network_info = {}
+        if os.path.isfile(networks_info_file):
+            self.network_info = load_yaml(self.logger, networks_info_file)
+
+        # the addresses of the VMs of the datacenter are read from the terraform output store
+        output_store = get_output_store(self.logger, self.project_root)
+        output_store.sync(get_scope_index(self.logger, self.project_root).select(datacenter))
+        vm_ips = {}
+        for _, vm_name, subnet_name, private_ip in output_store.get_datacenter_vms(datacenter):
+            vm_ips.setdefault(subnet_name, {"addresses": {}})["addresses"][vm_name] = private_ip
+
+        # VMs not managed by CloudTiger can still be listed in all_addresses_info.yml
         addresses_info_file = os.path.join(self.datacenter_meta_folder, 'all_addresses_info.yml')
-        with open(addresses_info_file, "r") as f:
-            self.addresses_info = yaml.load(f, Loader=yaml.FullLoader)
+        if os.path.isfile(addresses_info_file):
+            addresses_info = load_yaml(self.logger, addresses_info_file) or {}
+            for subnet_name, subnet_vms in (addresses_info.get('vm_ips', {}) or {}).items():
+                vm_ips.setdefault(subnet_name, {"addresses": {}})["addresses"]\
+                    .update(subnet_vms.get("addresses", {}) or {})
+
+        self.addresses_info = {"vm_ips": vm_ips}
 
     def load_ips(self):
 
         """ this function loads the IPs listed in config_ips.yml into
-        the scope_config_dict in memory
+        the scope_config_dict and the VM registry in memory
         """
 
         scope_ips = os.path.join(self.scope_config_folder, 'config_ips.yml')
         if os.path.exists(scope_ips):
-            with open(scope_ips, 'r') as f:
-                config_ip = yaml.load(f, Loader=yaml.FullLoader)
+            # the file is parsed again only if it has changed since the previous call
+            signature = file_signature(scope_ips)
+            if (self.config_ips is None) or (self.config_ips[0] != signature):
+                self.config_ips = (signature, load_yaml(self.logger, scope_ips))
+            config_ip = self.config_ips[1]
         else:
             self.logger.critical("Missing config_ips.yml file, please run cloudtiger <SCOPE> init 1")
             sys.exit()
 
-        for network_name, network_subnets in self.scope_config_dict["vm"].items():
-            for subnet_name, subnet_vms in network_subnets.items():
-                for vm_name, address in subnet_vms.items():
-                    address = config_ip[network_name][subnet_name]["addresses"][vm_name]
-                    self.scope_config_dict["vm"][network_name][subnet_name][vm_name]["private_ip"] = address
-
-        unpacked_ips = {
-            vm_name: ip_address
-            for network_name, network_subnets in config_ip.items()
-            for subnet_name, subnet_vms in network_subnets.items()
-            for vm_name, ip_address in subnet_vms["addresses"].items()
-        }
-
-        self.scope_unpacked_ips = unpacked_ips
+        for vm in self.vm_registry:
+            address = config_ip[vm.network][vm.subnet]["addresses"][vm.name]
+            vm.config["private_ip"] = address
+            vm.address = address
+            vm.private_ip = address.split(':')[0]
 
     def devops_init(self):
 
@@ -1,16 +1,26 @@
 """ Common Tools for CloudTiger."""
+import atexit
+import hashlib
 import json
 import logging
+import logging.handlers
 import os
+import pickle
+import queue
+import re
+import shlex
 import shutil
+import stat
 import subprocess
 import sys
+import tempfile
 from logging import Logger
 import click
 from collections import OrderedDict
 
 import yaml
-from jinja2 import Template
+
+from cloudtiger.data import DEFAULT_SSH_KEY_TYPE, SSH_RSA_KEY_SIZE, ssh_key_types
 
 
 def merge_dictionaries(dict1: dict, dict2: dict) -> dict:
@@ -35,6 +45,221 @@ def merge_dictionaries(dict1: dict, dict2: dict) -> dict:
     return dict2
 
 
+# a line of a dotenv file, with an optional 'export'
+DOTENV_LINE = re.compile(r'^(export\s+)?([A-Za-z_][A-Za-z0-9_]*)=(.*)$')
+
+# variables set by bash itself, that should not be loaded from a 'source'
+BASH_VARIABLES = ["PWD", "OLDPWD", "SHLVL", "_"]
+
+# the libyaml C loader is much faster than the pure python one
+YAML_LOADER = getattr(yaml, "CFullLoader", yaml.FullLoader)
+
+# yaml files larger than this size (in bytes) get a binary snapshot of their content
+YAML_SNAPSHOT_MIN_SIZE = 64 * 1024
+
+# in-memory cache of parsed files, enabled by long-running processes (see daemon.py)
+FILE_CACHE = {
+    "enabled": False,
+    "entries": {}
+}
+
+# the jinja2 environments of the current process, per templates folder
+JINJA_ENVIRONMENTS = {}
+
+# the fields added to the log records of the current process (see set_log_context)
+LOG_CONTEXT = {
+    "scope": "-",
+    "action": "-",
+    "stream_file": None
+}
+
+# the process and the queue listener of each logger created by create_logger
+LOG_LISTENERS = {}
+
+
+def file_signature(path: str) -> tuple:
+
+    """ this function returns a signature of a file changing each time the file is modified
+
+    :param path: str, the path of the file
+
+    :return: tuple, the modification time and size of the file
+    """
+
+    stat = os.stat(path)
+
+    return stat.st_mtime_ns, stat.st_size
+
+
+def cached_load(path: str, loader, memoize=False):
+
+    """ this function returns the content of a file parsed by 'loader'. When the file cache
+    is enabled (or 'memoize' is set), the parsed content is kept in memory until the file
+    is modified
+
+    :param path: str, the path of the file to parse
+    :param loader: function, the function parsing the file, called with the path
+    :param memoize: bool, set to True to keep the parsed content even if the file cache
+    is not enabled
+
+    :return: the parsed content (a fresh copy that the caller may modify)
+    """
+
+    if not (FILE_CACHE["enabled"] or memoize):
+        return loader(path)
+
+    signature = file_signature(path)
+    entry = FILE_CACHE["entries"].get(path)
+    if (entry is None) or (entry[0] != signature):
+        entry = (signature, loader, pickle.dumps(loader(path)))
+        FILE_CACHE["entries"][path] = entry
+
+    return pickle.loads(entry[2])
+
+
+def refresh_file_cache(logger: Logger) -> int:
+
+    """ this function reloads the cached files modified since they were parsed, and
+    forgets the deleted ones
+
+    :param logger: Logger, a Logger object to log details
+
+    :return: int, the number of cache entries updated
+    """
+
+    nb_updates = 0
+    for path, (signature, loader, _) in list(FILE_CACHE["entries"].items()):
+        if not os.path.exists(path):
+            logger.debug("File %s was removed, dropping it from cache" % path)
+            FILE_CACHE["entries"].pop(path)
+            nb_updates += 1
+            continue
+        if file_signature(path) != signature:
+            logger.debug("File %s was modified, reloading it" % path)
+            FILE_CACHE["entries"].pop(path)
+            try:
+                cached_load(path, loader)
+            except Exception as e:
+                logger.error("Failed to reload file %s : %s" % (path, e))
+            nb_updates += 1
+
+    return nb_updates
+
+
+def source_dotenv(envfile: str) -> dict:
+
+    """ this function runs a 'source' on the dotenv file in a clean bash environment,
+    and returns the variables it defines
+
+    :param envfile: str, the path of the dotenv file to 'source'
+
+    :return: dict, the variables of the environment
+    """
+
+    variables = {}
+    command = format('env -i bash -c "source %s && env"' % envfile)
+    for line in subprocess.getoutput(command).split("\n"):
+        if "=" in line:
+            key, value = line.split("=", 1)
+            if key not in BASH_VARIABLES:
+                variables[key] = value
+
+    return variables
+
+
+def strip_dotenv_comment(value: str) -> str:
+
+    """ this function removes the comment of a dotenv value : as in bash, a '#' starts
+    a comment only outside quotes and after a whitespace (e.g. the passwords 'abc#def'
+    and '#abc' are kept whole)
+
+    :param value: str, the value, after the '=' sign
+
+    :return: str, the value without its comment
+    """
+
+    quote = None
+    escaped = False
+    # an escaped or quoted whitespace does not end a word
+    word_start = False
+    for i, char in enumerate(value):
+        if escaped:
+            escaped = False
+            word_start = False
+            continue
+        if (char == "\\") & (quote != "'"):
+            escaped = True
+        elif quote is not None:
+            if char == quote:
+                quote = None
+        elif char in ["'", '"']:
+            quote = char
+        elif (char == "#") & word_start:
+            return value[:i]
+        word_start = (quote is None) & (not escaped) & char.isspace()
+
+    return value
+
+
+def parse_dotenv(envfile: str):
+
+    """ this function parses a dotenv file made of 'export KEY=value' or 'KEY=value' lines
+    (with optional quotes and comments), without running a shell. As with a 'source' of
+    the file, only the exported variables are returned
+
+    :param envfile: str, the path of the dotenv file to parse
+
+    :return: dict, the exported variables of the dotenv file, or None if the file needs a
+    real shell evaluation (variable expansion, command substitution, etc)
+    """
+
+    variables = {}
+    with open(envfile, "r") as f:
+        for line in f:
+            line = line.strip()
+            if (line == "") or line.startswith("#"):
+                continue
+
+            match = DOTENV_LINE.match(line)
+            if match is None:
+                return None
+            export, key, value = match.groups()
+
+            # expansions are only literal inside single quotes
+            if ("$" in value) or ("`" in value):
+                if not (value.startswith("'") & value.endswith("'") & (value.count("'") == 2)):
+                    return None
+
+            try:
+                value_elts = shlex.split(strip_dotenv_comment(value))
+            except ValueError:
+                return None
+            if len(value_elts) > 1:
+                return None
+            # a variable stays exported when it is assigned again without 'export'
+            if (export is not None) or (key in variables):
+                variables[key] = value_elts[0] if len(value_elts) > 0 else ""
+
+    return variables
+
+
+def read_dotenv(envfile: str) -> dict:
+
+    """ this function returns the variables defined by a dotenv file, parsing it in-process
+    when possible, and sourcing it with bash otherwise
+
+    :param envfile: str, the path of the dotenv file
+
+    :return: dict, the variables defined by the dotenv file
+    """
+
+    variables = parse_dotenv(envfile)
+    if variables is None:
+        variables = source_dotenv(envfile)
+
+    return variables
+
+
 def bash_source(logger: Logger, envfile: str):
 
     """ this function runs a 'source' on the dotenv file, and loads
@@ -47,13 +272,152 @@ def bash_source(logger: Logger, envfile: str):
     logger.debug("Executing a source on dotenv file %s" % envfile)
 
     if os.path.isfile(envfile):
-        command = format('env -i bash -c "source %s && env"' % envfile)
-        for line in subprocess.getoutput(command).split("\n"):
-            if "=" in line:
-                key, value = line.split("=", 1)
-                os.environ[key] = value
+        os.environ.update(cached_load(envfile, read_dotenv, memoize=True))
+
+
+def file_hash(path: str) -> str:
+
+    """ this function returns the sha256 hash of the content of a file
+
+    :param path: str, the path of the file
+
+    :return: str, the hexadecimal hash
+    """
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def write_if_changed(logger: Logger, path: str, content, mode: int = None) -> bool:
+
+    """ this function writes a generated file only if its content has changed, so that
+    the modification time of unchanged files (read by Terraform, Ansible and the CloudTiger
+    caches) is kept. The file is replaced atomically : readers never see a partial file
+
+    :param logger: Logger, a Logger object to log details
+    :param path: str, the path of the file
+    :param content: str or bytes, the content of the file
+    :param mode: int, the permissions of the file (by default, the permissions of the
+    existing file, or the default permissions of new files)
+
+    :return: bool, True if the file was created or modified
+    """
+
+    if isinstance(content, str):
+        content = content.encode()
+
+    if os.path.isfile(path):
+        if (os.path.getsize(path) == len(content)) and \
+                (file_hash(path) == hashlib.sha256(content).hexdigest()):
+            logger.debug("File %s is unchanged" % path)
+            return False
+        if mode is None:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+
+    if mode is None:
+        # default permissions of new files, according to the umask
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(
+        dir=folder, prefix="." + os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as f:
+            f.write(content)
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    logger.debug("File %s written" % path)
+
+    return True
+
+
+def copy_if_changed(logger: Logger, source: str, destination: str,
+                    changed_files: list = None) -> str:
+
+    """ this function copies a file with write_if_changed, keeping its permissions.
+    It can be used as the 'copy_function' of shutil.copytree with functools.partial
+
+    :param logger: Logger, a Logger object to log details
+    :param source: str, the path of the file to copy
+    :param destination: str, the path of the copy
+    :param changed_files: list, the list where the copy is appended if it changed
+
+    :return: str, the path of the copy
+    """
+
+    if os.path.isdir(destination):
+        destination = os.path.join(destination, os.path.basename(source))
 
-def j2(logger: Logger, template_file: str, dictionary: dict, output_file: str):
+    with open(source, "rb") as f:
+        content = f.read()
+
+    if write_if_changed(logger, destination, content, stat.S_IMODE(os.stat(source).st_mode)):
+        if changed_files is not None:
+            changed_files.append(destination)
+
+    return destination
+
+
+def get_jinja_environment(templates_folder: str = None):
+
+    """ this function returns the jinja2 environment of a templates folder, created once
+    per process. The compiled templates are kept in memory by the environment, and on disk
+    by a bytecode cache shared by the CloudTiger processes
+
+    :param templates_folder: str, the folder of the templates (e.g. <LIBRARIES>/internal),
+    None for an environment without loader
+
+    :return: jinja2.Environment, the environment
+    """
+
+    if templates_folder is not None:
+        templates_folder = os.path.abspath(templates_folder)
+
+    if templates_folder not in JINJA_ENVIRONMENTS.keys():
+        from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+        loader = FileSystemLoader(templates_folder) if templates_folder is not None else None
+        JINJA_ENVIRONMENTS[templates_folder] = Environment(
+            loader=loader, bytecode_cache=FileSystemBytecodeCache(), auto_reload=True)
+
+    return JINJA_ENVIRONMENTS[templates_folder]
+
+
+def precompile_templates(logger: Logger, templates_folder: str) -> int:
+
+    """ this function compiles all the jinja2 templates of a templates folder in advance,
+    e.g. before rendering them for many scopes in forked processes
+
+    :param logger: Logger, a Logger object to log details
+    :param templates_folder: str, the folder of the templates (e.g. <LIBRARIES>/internal)
+
+    :return: int, the number of compiled templates
+    """
+
+    environment = get_jinja_environment(templates_folder)
+    template_names = environment.list_templates(extensions=["j2"])
+    for template_name in template_names:
+        environment.get_template(template_name)
+
+    logger.debug("Compiled %s jinja templates of %s" % (len(template_names), templates_folder))
+
+    return len(template_names)
+
+
+def j2(logger: Logger, template_file: str, dictionary: dict, output_file: str,
+       templates_folder: str = None):
 
     """ this function uses a 'template' j2 file, and use variables from 'dictionary'
     to dump the rendered 'output_file'
@@ -62,6 +426,11 @@ def j2(logger: Logger, template_file: str, dictionary: dict, output_file: str):
     :param template_file: str, the path to the jinja2 template file
     :param dictionary: dict, the dictionary to use to interprete the jinja2 template
     :param output_file: str, the path to the interpreted output file
+    :param templates_folder: str, the folder of the templates containing 'template_file'
+    (e.g. <LIBRARIES>/internal), whose compiled templates are reused between calls. If not
+    set, the template is compiled at each call
+
+    :return: bool, True if the output file was created or modified
     """
 
     logger.debug("Rendering template file %s to output file %s with jinja2" 
@@ -77,16 +446,28 @@ def j2(logger: Logger, template_file: str, dictionary: dict, output_file: str):
         logger.debug("Output folder %s does not exist, creating it" % output_dir)
         os.makedirs(output_dir, exist_ok=True)
 
-    with open(template_file, 'r') as f:
-        template = f.read()
-
-    tm = Template(template)
+    template_name = None
+    if templates_folder is not None:
+        template_name = os.path.relpath(os.path.abspath(template_file),
+                                        os.path.abspath(templates_folder))
+        if template_name.startswith(os.pardir + os.sep):
+            template_name = None
+
+    if template_name is not None:
+        # jinja2 template names always use '/' as separator
+        tm = get_jinja_environment(templates_folder).get_template(
+            template_name.replace(os.sep, "/"))
+    else:
+        with open(template_file, 'r') as f:
+            template = f.read()
+        tm = get_jinja_environment().from_string(template)
 
-    with open(output_file, "w") as f:
-        f.write(tm.render(dictionary, env=os.environ))
+    changed = write_if_changed(logger, output_file, tm.render(dictionary, env=os.environ))
 
     logger.debug("Rendering successful")
 
+    return changed
+
 
 def load_json(logger: Logger, jsonfile: str) -> dict:
 
@@ -108,6 +489,85 @@ def load_json(logger: Logger, jsonfile: str) -> dict:
         raise Exception("Cannot read %s file : file does not exist" % jsonfile)
 
 
+def yaml_snapshot_path(yamlfile: str) -> str:
+
+    """ this function returns the path of the snapshot of a parsed yaml file
+
+    :param yamlfile: str, the path of the yaml file
+
+    :return: str, the path of the snapshot, or None if snapshots are disabled
+    """
+
+    snapshot_folder = os.environ.get("CLOUDTIGER_CACHE_DIR",
+                                     os.path.join(os.path.expanduser("~"), ".cache", "cloudtiger"))
+    if snapshot_folder == "":
+        return None
+
+    path_hash = hashlib.sha256(os.path.abspath(yamlfile).encode()).hexdigest()
+
+    return os.path.join(snapshot_folder, "yaml", path_hash + ".pickle")
+
+
+def read_yaml(yamlfile: str):
+
+    """ this function parses a yaml file, with the libyaml C loader if available.
+    The content of large files is also stored as a binary snapshot, reused as long
+    as the file keeps the same size and modification time, or the same content
+
+    :param yamlfile: str, the path of the yaml file to parse
+
+    :return: the content of the yaml file
+    """
+
+    stat = os.stat(yamlfile)
+    snapshot_file = None
+    if stat.st_size >= YAML_SNAPSHOT_MIN_SIZE:
+        snapshot_file = yaml_snapshot_path(yamlfile)
+
+    if snapshot_file is None:
+        with open(yamlfile, 'r') as f:
+            return yaml.load(f, Loader=YAML_LOADER)
+
+    snapshot = None
+    if os.path.isfile(snapshot_file):
+        try:
+            with open(snapshot_file, 'rb') as f:
+                snapshot = pickle.load(f)
+        except Exception:
+            snapshot = None
+
+    if snapshot is not None:
+        if (snapshot["size"] == stat.st_size) & (snapshot["mtime"] == stat.st_mtime_ns):
+            return snapshot["content"]
+
+    with open(yamlfile, 'rb') as f:
+        raw_content = f.read()
+    content_hash = hashlib.sha256(raw_content).hexdigest()
+
+    if (snapshot is not None) and (snapshot["hash"] == content_hash):
+        content = snapshot["content"]
+    else:
+        content = yaml.load(raw_content, Loader=YAML_LOADER)
+
+    # the snapshot is an optimization : failing to write it is not an error
+    try:
+        os.makedirs(os.path.dirname(snapshot_file), exist_ok=True)
+        temp_file = format("%s.%s.tmp" % (snapshot_file, os.getpid()))
+        with open(temp_file, 'wb') as f:
+            pickle.dump({
+                "path": os.path.abspath(yamlfile),
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+                "hash": content_hash,
+                "content": content
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, snapshot_file)
+    except OSError:
+        pass
+
+    return content
+
+
 def load_yaml(logger: Logger, yamlfile: str):
 
     """ this function loads a json file and returns the content as a dictionary
@@ -121,13 +581,29 @@ def load_yaml(logger: Logger, yamlfile: str):
     logger.debug("Loading yaml file %s as dictionary" % yamlfile)
 
     if os.path.exists(yamlfile):
-        with open(yamlfile, 'r') as f:
-            return yaml.load(f, Loader=yaml.FullLoader)
+        return cached_load(yamlfile, read_yaml)
 
     else:
         raise Exception("Cannot read %s file : file does not exist" % yamlfile)
 
 
+def normalize_scope(scope: str) -> str:
+
+    """ this function removes the 'config' folder and trailing separators from a scope path
+
+    :param scope: str, a scope path as written by the user
+
+    :return: str, the scope path relative to the <PROJECT_ROOT>/config folder
+    """
+
+    scope = os.path.normpath(scope)
+    scope_elts = scope.split(os.sep)
+    if (scope_elts[0] == "config") & (len(scope_elts) > 1):
+        scope = os.path.join(*(scope_elts[1:]))
+
+    return scope
+
+
 def bash_action(logger: Logger,
                 command: str,
                 folder: str,
@@ -136,9 +612,12 @@ def bash_action(logger: Logger,
                 error=None,
                 single_output=False,
                 background=False,
-                set_input=None):
+                set_input=None,
+                timeout=None,
+                check=False,
+                on_line=None):
 
-    """ this function wraps a bash command 
+    """ this function wraps a bash command, run by the process supervisor
 
     :param logger: Logger, a Logger object to log details
     :param command: str, the bash command as a string
@@ -151,59 +630,79 @@ def bash_action(logger: Logger,
     :param background: bool, set to True if you want to run the command in the
     background
     :param set_input: str, add a command to apply if the command is expect to prompt a question
+    :param timeout: float, the maximum duration of the command in seconds (no limit if None)
+    :param check: bool, set to True to raise an exception if the command fails
+    :param on_line: function, called with each line of the standard output while the command
+    runs, in addition to the output file (by default, the lines are displayed in the console
+    when there is no output file)
+
+    :return: ProcessResult, the result of the command (None for a background command)
     """
 
-    logger.info("Bash action : %s" % command)
+    # asyncio is only loaded when a command is executed
+    from cloudtiger.supervisor import run_process, supervise
 
-    stdout = subprocess.PIPE
-    stderr = subprocess.STDOUT
+    logger.info("Bash action : %s" % command)
 
-    if output is not None:
-        logger.debug("Standard output sent to %s" % output)
-        if single_output is False:
-            stdout = open(output, "a")
-        else: 
-            logger.debug("Single output")
-            stdout = open(output, "w")
+    if background is True:
+        logger.info("Execution of command in the background :\n%s \nin folder %s\n"
+                    % (command, folder))
+        subprocess.Popen(command, env=env, cwd=folder, shell=True)
+        return None
 
-    if error is not None:
-        logger.debug("Standard error sent to %s" % output)
-        stderr = open(error, "a")
+    stdout = None
+    stderr = None
 
     try:
-        logger.info("Execution of command :\n%s > %s \nin folder %s\n" % (command, output, folder))
-        if background is True:
-            if set_input is not None:
-                result = subprocess.Popen(command, env=env, cwd=folder, shell=True,
-                                          stdin=subprocess.PIPE)
-                result.stdin.write(set_input)
-                result.communicate()
+        if output is not None:
+            logger.debug("Standard output sent to %s" % output)
+            if single_output is False:
+                stdout = open(output, "ab")
             else:
-                subprocess.Popen(command, env=env, cwd=folder, shell=True)
+                logger.debug("Single output")
+                stdout = open(output, "wb")
         else:
-            if set_input is not None:
-                result = subprocess.Popen(command, env=env, cwd=folder,
-                                          stdout=subprocess.PIPE, stderr=stderr,
-                                          shell=True, text=True, stdin=subprocess.PIPE)
-                result.communicate(input=set_input)
-            else:
-                result = subprocess.Popen(command, env=env, cwd=folder, stdout=stdout,
-                                          stderr=stderr, shell=True, text=True)
-            # we print output in console only if no output file has been specified
-            if (output is None) & (result.stdout is not None) & (background is False):
-                while True:
-                    line = result.stdout.readline()
-                    if not line:
-                        break
-                    else:
-                        logger.info(line.replace('\r', '').replace('\n', ''))
-            else:
-                result.wait()
+            # we print output in console only if no output file has been specified. The lines
+            # are not written in the log file, but in the stream file of the scope (if set)
+            if on_line is None:
+                def on_line(line: str):
+                    logger.info(line, extra={"subprocess_stream": True})
+
+            if LOG_CONTEXT["stream_file"] is not None:
+                os.makedirs(os.path.dirname(LOG_CONTEXT["stream_file"]), exist_ok=True)
+                stdout = open(LOG_CONTEXT["stream_file"], "ab")
+
+        if error is not None:
+            logger.debug("Standard error sent to %s" % error)
+            stderr = open(error, "ab")
+
+        logger.info("Execution of command :\n%s > %s \nin folder %s\n" % (command, output, folder))
+        result = supervise(run_process(command, folder, env, stdout, stderr, on_line=on_line,
+                                       timeout=timeout, set_input=set_input))
     except Exception as e:
         logger.error("Error in the execution of command :\n%s" % e)
         raise Exception(e)
+    finally:
+        if stdout is not None:
+            stdout.close()
+        if stderr is not None:
+            stderr.close()
+
+    if result.timed_out:
+        err = format("Bash action timed out after %.1fs : %s" % (result.duration, command))
+    elif result.returncode != 0:
+        err = format("Bash action failed with exit code %s after %.1fs : %s"
+                     % (result.returncode, result.duration, command))
+    else:
+        logger.info("Successful bash action (%.1fs, %s bytes of output)"
+                    % (result.duration, result.stdout_bytes + result.stderr_bytes))
+        return result
+
+    logger.error(err)
+    if check:
+        raise Exception(err)
 
-    logger.info("Successful bash action")
+    return result
 
 
 def find_exec_path(executable):
@@ -215,26 +714,122 @@ def find_exec_path(executable):
     return exec_path
 
 
-def create_logger(logfile='', verbose=False):
+class LogContextFilter(logging.Filter):
+    """
+    A filter adding the scope and the action of LOG_CONTEXT to the log records.
+    """
+
+    def filter(self, record) -> bool:
+        record.scope = LOG_CONTEXT["scope"]
+        record.action = LOG_CONTEXT["action"]
+        return True
+
+
+class SubprocessStreamFilter(logging.Filter):
+    """
+    A filter excluding the lines of output of the subprocesses (see bash_action), that are
+    only displayed in the console and dumped in the stream file of the scope.
+    """
+
+    def filter(self, record) -> bool:
+        return not getattr(record, "subprocess_stream", False)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    A formatter dumping each log record as a JSON object on a single line.
+    """
+
+    def format(self, record) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "scope": getattr(record, "scope", LOG_CONTEXT["scope"]),
+            "action": getattr(record, "action", LOG_CONTEXT["action"]),
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry)
+
+
+def set_log_context(**fields):
+
+    """ this function sets the fields added to the log records of the current process :
+    'scope', 'action', and 'stream_file' (the file receiving the output of the subprocesses
+    run without output file)
+
+    :param fields: the fields to set
+    """
+
+    LOG_CONTEXT.update(fields)
+
+
+def stop_logger(logger: Logger):
 
-    """ this function create a nice logger object """
+    """ this function stops the queue listener of a logger created by create_logger, after
+    it has written all the pending records, and removes the handlers of the logger
+
+    :param logger: Logger, the logger
+    """
+
+    pid, listener = LOG_LISTENERS.pop(logger.name, (None, None))
+    # the thread of the listener only runs in the process which created it
+    if (listener is not None) & (pid == os.getpid()):
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+    logger.handlers.clear()
+
+
+def stop_loggers():
+
+    """ this function stops the queue listeners of all the loggers created by create_logger
+    """
+
+    for name in list(LOG_LISTENERS.keys()):
+        stop_logger(logging.getLogger(name))
+
+
+# the pending log records are written when the process exits
+atexit.register(stop_loggers)
+
+
+def create_logger(logfile='', verbose=False, name=__name__, console=True, json_logs=False):
+
+    """ this function create a nice logger object. The records are sent to a queue, and
+    written to the log file and the console by a background thread, so that logging never
+    blocks the caller
+
+    :param logfile: str, the path of the log file (default: ./cloudtiger.log)
+    :param verbose: bool, set to True for a DEBUG level logger
+    :param name: str, the name of the logger
+    :param console: bool, set to False to log in the log file only
+    :param json_logs: bool, set to True to write the log file as JSON lines
+    """
 
     if logfile == '':
         logfile = os.getcwd()
         logfile = os.path.join(logfile, 'cloudtiger.log')
 
-    logger = logging.getLogger(__name__)
+    logger = logging.getLogger(name)
     if verbose:
         logger.setLevel(logging.DEBUG)
     else:
         logger.setLevel(logging.INFO)
 
+    # a logger created again replaces its previous handlers
+    stop_logger(logger)
+
     # create a file handler
     handler = logging.FileHandler(logfile)
     if verbose:
         handler.setLevel(logging.DEBUG)
     else:
         handler.setLevel(logging.INFO)
+    handler.addFilter(SubprocessStreamFilter())
 
     # create a console handler
     stdout_handler = logging.StreamHandler(sys.stdout)
@@ -245,66 +840,171 @@ def create_logger(logfile='', verbose=False):
 
     # create a logging format
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
+    if json_logs:
+        handler.setFormatter(JsonLinesFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(scope)s - %(action)s - %(message)s'))
+    stdout_handler.setFormatter(formatter)
+
+    # the handlers are run by a queue listener thread
+    handlers = [handler]
+    if console:
+        handlers.append(stdout_handler)
+    else:
+        # the logger should not forward its records to the root logger either
+        logger.propagate = False
 
-    # add the handlers to the logger
-    logger.addHandler(handler)
-    logger.addHandler(stdout_handler)
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(LogContextFilter())
+    logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    LOG_LISTENERS[name] = (os.getpid(), listener)
 
     logger.debug('Logger created')
 
     return logger
 
 
-def create_ssh_keys(logger: Logger, private_ssh_folder: str, public_ssh_folder: str,
-                    stdout_file=None, stderr_file=None, ssh_key_name="id_rsa"):
+def generate_ssh_key_pair(key_type: str = DEFAULT_SSH_KEY_TYPE, comment: str = "") -> tuple:
 
-    """ this function creates a pair (public/private) of ssh keys """
+    """ this function generates a pair of SSH keys in the current process, without passphrase
 
-    logger.debug("Creating folder %s" % private_ssh_folder)
-    os.makedirs(private_ssh_folder, exist_ok=True)
-    os.makedirs(public_ssh_folder, exist_ok=True)
+    :param key_type: str, the type of the key, 'rsa' or 'ed25519'
+    :param comment: str, the comment of the public key
 
-    created_ssh_private_key = os.path.join(private_ssh_folder, ssh_key_name)
-    created_ssh_public_key = os.path.join(private_ssh_folder, ssh_key_name + ".pub")
+    :return: (bytes, bytes), the private key (OpenSSH format) and the public key
+    """
 
-    dest_ssh_public_key = os.path.join(public_ssh_folder, ssh_key_name + ".pub")
+    # cryptography is only loaded when keys are generated
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
 
-    if (not os.path.exists(created_ssh_private_key)) | (not os.path.exists(dest_ssh_public_key)):
-        logger.debug("Public or private key does not exist, let us create a new pair")
+    if key_type == "ed25519":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    elif key_type == "rsa":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=SSH_RSA_KEY_SIZE)
+    else:
+        raise Exception(format("Unknown SSH key type %s, should be one of %s"
+                               % (key_type, ", ".join(ssh_key_types))))
+
+    private_bytes = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.OpenSSH,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    public_bytes = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.OpenSSH,
+        format=serialization.PublicFormat.OpenSSH
+    )
+    if comment != "":
+        public_bytes += b" " + comment.encode()
+
+    return private_bytes, public_bytes + b"\n"
+
+
+def generate_ssh_key_pair_job(key_spec: tuple) -> tuple:
+
+    """ this function generates the pair of SSH keys of a key specification, in a pool process
+
+    :param key_spec: tuple, see create_ssh_keys_batch
 
-        if os.path.exists(created_ssh_private_key):
-            os.remove(created_ssh_private_key)
+    :return: (bytes, bytes), the private key and the public key
+    """
+
+    _, _, ssh_key_name, ssh_key_type = key_spec
+
+    return generate_ssh_key_pair(ssh_key_type, ssh_key_name)
+
+
+def ssh_keys_exist(private_ssh_folder: str, public_ssh_folder: str, ssh_key_name: str) -> bool:
+
+    """ this function checks if a pair of SSH keys has already been created
+
+    :param private_ssh_folder: str, the folder of the private key
+    :param public_ssh_folder: str, the folder of the public key
+    :param ssh_key_name: str, the name of the private key
+
+    :return: bool, True if both keys exist
+    """
+
+    return os.path.exists(os.path.join(private_ssh_folder, ssh_key_name)) & \
+        os.path.exists(os.path.join(public_ssh_folder, ssh_key_name + ".pub"))
 
-        if os.path.exists(dest_ssh_public_key):
-            os.remove(dest_ssh_public_key)
 
-        logger.debug("Creating SSH key pair")
-        env = {"PRIVATE_FOLDER": private_ssh_folder, "KEY_NAME": ssh_key_name}
+def write_ssh_keys(logger: Logger, private_ssh_folder: str, public_ssh_folder: str,
+                   ssh_key_name: str, key_pair: tuple):
 
-        command = "ssh-keygen -q -t rsa -f $PRIVATE_FOLDER/$KEY_NAME -N ''"
+    """ this function writes a pair of SSH keys atomically, the private key being only
+    readable by the current user
+
+    :param logger: Logger, a Logger object to log details
+    :param private_ssh_folder: str, the folder of the private key
+    :param public_ssh_folder: str, the folder of the public key
+    :param ssh_key_name: str, the name of the private key
+    :param key_pair: (bytes, bytes), the private key and the public key
+    """
 
-        bash_action(logger, command, os.getcwd(), env, stdout_file, stderr_file)
+    private_bytes, public_bytes = key_pair
+    write_if_changed(logger, os.path.join(private_ssh_folder, ssh_key_name), private_bytes, 0o600)
+    write_if_changed(logger, os.path.join(public_ssh_folder, ssh_key_name + ".pub"),
+                     public_bytes, 0o644)
 
-        # ensure keys are created
-        if not os.path.exists(created_ssh_private_key):
-            err = format("The private ssh key pair %s has not been created : "
-                         "error" % created_ssh_private_key)
-            logger.error(err)
-            raise Exception(err)
 
-        if not os.path.exists(created_ssh_public_key):
-            err = format("The public ssh key pair %s has not been created : "
-                         "error" % created_ssh_public_key)
-            logger.error(err)
-            raise Exception(err)
+def create_ssh_keys(logger: Logger, private_ssh_folder: str, public_ssh_folder: str,
+                    ssh_key_name="id_rsa", ssh_key_type=DEFAULT_SSH_KEY_TYPE):
 
-        shutil.move(created_ssh_public_key, dest_ssh_public_key)
-        logger.debug("SSH key pair moved successfully")
+    """ this function creates a pair (public/private) of ssh keys, if they do not exist yet
+
+    :param logger: Logger, a Logger object to log details
+    :param private_ssh_folder: str, the folder of the private key
+    :param public_ssh_folder: str, the folder of the public key
+    :param ssh_key_name: str, the name of the private key
+    :param ssh_key_type: str, the type of the key, 'rsa' or 'ed25519'
+    """
+
+    if not ssh_keys_exist(private_ssh_folder, public_ssh_folder, ssh_key_name):
+        logger.debug("Public or private key does not exist, let us create a new pair")
+        logger.debug("Creating %s SSH key pair" % ssh_key_type)
+        write_ssh_keys(logger, private_ssh_folder, public_ssh_folder, ssh_key_name,
+                       generate_ssh_key_pair(ssh_key_type, ssh_key_name))
+        logger.debug("SSH key pair created successfully")
 
     else:
         logger.debug("An SSH key pair already exists")
 
+
+def create_ssh_keys_batch(logger: Logger, key_specs: list, jobs: int = None) -> int:
+
+    """ this function creates the missing pairs of SSH keys of many scopes, generated by
+    a pool of processes
+
+    :param logger: Logger, a Logger object to log details
+    :param key_specs: list, the (private folder, public folder, key name, key type) of
+    each pair of keys
+    :param jobs: int, the number of processes (by default, the number of CPUs)
+
+    :return: int, the number of pairs created
+    """
+
+    import concurrent.futures
+
+    missing_specs = [key_spec for key_spec in key_specs if not ssh_keys_exist(*key_spec[:3])]
+    if len(missing_specs) == 0:
+        return 0
+
+    logger.info("Creating %s SSH key pairs" % len(missing_specs))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        for key_spec, key_pair in zip(missing_specs,
+                                      executor.map(generate_ssh_key_pair_job, missing_specs)):
+            write_ssh_keys(logger, *key_spec[:3], key_pair)
+
+    return len(missing_specs)
+
+
 def get_credentials(provider_helper, credential_dir, append=False):
 
     """ This function will use multiple prompt to collect credentials for the 
@@ -0,0 +1,278 @@
+"""Long-running CloudTiger daemon serving commands on a local Unix socket."""
+import array
+import importlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import time
+import traceback
+from logging import Logger
+
+from cloudtiger.common_tools import (
+    FILE_CACHE,
+    cached_load,
+    load_yaml,
+    precompile_templates,
+    read_dotenv,
+    refresh_file_cache,
+    stop_loggers
+)
+from cloudtiger.project import get_project_context
+
+SOCKET_NAME = ".cloudtiger.sock"
+
+# the client sends its standard input, output and error to the daemon
+FORWARDED_FDS = [0, 1, 2]
+
+# modules preloaded by the daemon, so that commands do not pay for their import
+PRELOADED_MODULES = [
+    "cloudtiger.cli",
+    "cloudtiger.init",
+    "cloudtiger.ans",
+    "cloudtiger.tf",
+    "cloudtiger.service",
+    "ansible.inventory.manager",
+    "ansible.parsing.dataloader"
+]
+
+
+def socket_path(project_root: str) -> str:
+
+    """ this function returns the path of the daemon socket for a project root
+
+    :param project_root: str, the root folder ("gitops") of the project
+
+    :return: str, the path of the socket
+    """
+
+    return os.path.join(os.path.abspath(project_root), SOCKET_NAME)
+
+
+def forward_command(project_root: str, args: list) -> int:
+
+    """ this function sends a CloudTiger command to the daemon of the project root, along
+    with the current working directory, the environment and the standard streams, and waits
+    for its completion
+
+    :param project_root: str, the root folder ("gitops") of the project
+    :param args: list, the arguments of the CloudTiger command
+
+    :return: int, the exit code of the command
+    """
+
+    daemon_socket = socket_path(project_root)
+    if not os.path.exists(daemon_socket):
+        sys.exit(format("No CloudTiger daemon is listening on %s, start one with "
+                        "'cloudtiger --project-root %s . serve'" % (daemon_socket, project_root)))
+
+    request = {
+        "args": args,
+        "cwd": os.getcwd(),
+        "env": dict(os.environ)
+    }
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(daemon_socket)
+        client.sendmsg([b"R"], [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                                 array.array("i", FORWARDED_FDS))])
+        client.sendall(json.dumps(request).encode() + b"\n")
+        response = client.makefile("rb").readline()
+
+    if len(response) == 0:
+        sys.exit("The CloudTiger daemon closed the connection without answering")
+
+    return json.loads(response)["exit_code"]
+
+
+def run_command(request: dict, fds: list) -> int:
+
+    """ this function runs a forwarded CloudTiger command in the (forked) daemon process,
+    as if it was run by the client
+
+    :param request: dict, the arguments, working directory and environment of the client
+    :param fds: list, the standard input, output and error of the client
+
+    :return: int, the exit code of the command
+    """
+
+    import click
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    for fd, target in zip(fds, FORWARDED_FDS):
+        os.dup2(fd, target)
+        os.close(fd)
+
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+    os.environ.pop("CLOUDTIGER_REMOTE", None)
+
+    # the command creates its own logger handlers
+    stop_loggers()
+
+    from cloudtiger.cli import main
+
+    try:
+        main.main(args=request["args"], prog_name="cloudtiger", standalone_mode=False)
+        exit_code = 0
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            exit_code = e.code
+        elif e.code is None:
+            exit_code = 0
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except click.ClickException as e:
+        e.show()
+        exit_code = e.exit_code
+    except click.Abort:
+        print("Aborted!", file=sys.stderr)
+        exit_code = 1
+    except Exception:
+        traceback.print_exc()
+        exit_code = 1
+
+    # the forked process exits without running the exit handlers
+    stop_loggers()
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    return exit_code
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    """
+    A handler running one forwarded CloudTiger command.
+    """
+
+    def handle(self):
+        fds_size = len(FORWARDED_FDS) * array.array("i").itemsize
+        _, ancdata, _, _ = self.request.recvmsg(1, socket.CMSG_LEN(fds_size))
+        fds = array.array("i")
+        for level, kind, data in ancdata:
+            if (level == socket.SOL_SOCKET) & (kind == socket.SCM_RIGHTS):
+                fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+
+        request = json.loads(self.rfile.readline())
+        exit_code = run_command(request, list(fds))
+        self.wfile.write(json.dumps({"exit_code": exit_code}).encode() + b"\n")
+
+
+class CloudTigerServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """
+    A Unix socket server forking a process for each command, so that every command
+    starts from the state preloaded in the daemon and cannot alter it.
+    """
+
+    def __init__(self, logger: Logger, server_address: str, poll_interval: float):
+        self.logger = logger
+        self.poll_interval = poll_interval
+        self.last_refresh = time.time()
+        super().__init__(server_address, CommandHandler)
+
+    def service_actions(self):
+        super().service_actions()
+        if time.time() - self.last_refresh > self.poll_interval:
+            nb_updates = refresh_file_cache(self.logger)
+            if nb_updates > 0:
+                self.logger.info("Reloaded %s modified files" % nb_updates)
+            self.last_refresh = time.time()
+
+
+def preload_project(logger: Logger, project_root: str, libraries_path: str):
+
+    """ this function parses the configuration files of the project into the file cache
+
+    :param logger: Logger, a Logger object to log details
+    :param project_root: str, the root folder ("gitops") of the project
+    :param libraries_path: str, the path to the folder of Ansible and Terraform libraries
+    """
+
+    # the root .env and the standard files are shared by the commands through the
+    # project context, loaded again by a command only if one of them has changed
+    get_project_context(logger, project_root, libraries_path)
+
+    # the jinja templates of the library are compiled once for all the commands
+    precompile_templates(logger, os.path.join(libraries_path, "internal"))
+
+    yaml_files = []
+    for root, _, files in os.walk(os.path.join(project_root, "config")):
+        for file in ["config.yml", "meta_config.yml", "config_ips.yml"]:
+            if file in files:
+                yaml_files.append(os.path.join(root, file))
+
+    dotenv_files = []
+    for root, _, files in os.walk(os.path.join(project_root, "secrets")):
+        dotenv_files.extend(os.path.join(root, file) for file in files if file.endswith(".env"))
+
+    for yaml_file in yaml_files:
+        if os.path.isfile(yaml_file):
+            try:
+                load_yaml(logger, yaml_file)
+            except Exception as e:
+                logger.error("Failed to preload file %s : %s" % (yaml_file, e))
+
+    for dotenv_file in dotenv_files:
+        if os.path.isfile(dotenv_file):
+            cached_load(dotenv_file, read_dotenv, memoize=True)
+
+    logger.info("Preloaded %s configuration files" % len(FILE_CACHE["entries"]))
+
+
+def stop_daemon(signum, frame):
+
+    """ this function stops the daemon when it receives a SIGTERM signal """
+
+    raise KeyboardInterrupt()
+
+
+def serve(logger: Logger, project_root: str, libraries_path: str, poll_interval: float):
+
+    """ this function runs the CloudTiger daemon for a project root until interrupted
+
+    :param logger: Logger, a Logger object to log details
+    :param project_root: str, the root folder ("gitops") of the project
+    :param libraries_path: str, the path to the folder of Ansible and Terraform libraries
+    :param poll_interval: float, the number of seconds between two checks of modified files
+    """
+
+    daemon_socket = socket_path(project_root)
+    if os.path.exists(daemon_socket):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(daemon_socket)
+                sys.exit(format("A CloudTiger daemon is already listening on %s" % daemon_socket))
+            except ConnectionRefusedError:
+                logger.debug("Removing stale socket %s" % daemon_socket)
+                os.remove(daemon_socket)
+
+    for module in PRELOADED_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logger.warning("Cannot preload module %s : %s" % (module, e))
+
+    FILE_CACHE["enabled"] = True
+    preload_project(logger, project_root, libraries_path)
+
+    signal.signal(signal.SIGTERM, stop_daemon)
+    server = CloudTigerServer(logger, daemon_socket, poll_interval)
+    logger.info("CloudTiger daemon listening on %s" % daemon_socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopping CloudTiger daemon")
+    finally:
+        server.server_close()
+        if os.path.exists(daemon_socket):
+            os.remove(daemon_socket)
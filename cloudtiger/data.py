@@ -5,6 +5,27 @@ This file stores some common data structures
 DEFAULT_ANSIBLE_PYTHON_INTERPRETER = "python3"
 DEFAULT_SSH_PORT = "22"
 
+# type and size of the dedicated SSH keys generated for the scopes (see 'ssh_key_type')
+DEFAULT_SSH_KEY_TYPE = "rsa"
+SSH_RSA_KEY_SIZE = 3072
+ssh_key_types = ["rsa", "ed25519"]
+
+# folder of the project root where CloudTiger stores its caches and indexes
+CACHE_FOLDER = ".cloudtiger"
+
+# Terraform providers shared by the scopes : plugin cache (in CACHE_FOLDER), filesystem mirror
+# (in the project root) and the Terraform CLI configuration using them (in CACHE_FOLDER)
+TF_PLUGIN_CACHE_FOLDER = "terraform_plugins"
+TF_PROVIDER_MIRROR_FOLDER = "terraform_mirror"
+TF_CLI_CONFIG_FILE = "terraform.rc"
+
+# file of the Terraform folder of a scope storing the fingerprint of its last applied inputs
+TF_FINGERPRINT_FILE = "cloudtiger_fingerprint.json"
+
+# Terraform actions asking for an approval, which nobody can give to the scopes run in
+# parallel (--jobs) : they need the '--auto-approve' option
+TF_APPROVAL_ACTIONS = ["apply", "destroy"]
+
 available_infra_services = [
     "kubernetes",
     "network",
@@ -200,8 +221,12 @@ allowed_actions = {
         "plan": 'plan',
         "import": "import",
         "I": "import",
+        "bulk_import": "bulk_import",
+        "BI": "bulk_import",
         "console": "console",
-        "rm": "rm"
+        "rm": "rm",
+        "mirror": "mirror",
+        "M": "mirror"
     },
     "ans": {
         "inventory": "create_inventory",
@@ -268,3 +293,119 @@ common_environment_tags = {
     "sandbox": "sandbox",
     "sdbx": "sandbox"
 }
+
+# schemas of the entries of a config.yml, checked by validation.py before running any action.
+# A schema sets the expected 'type' of a value, and optionally :
+# - 'choices' : the allowed values
+# - 'keys' : the schemas of the known keys of a dictionary
+# - 'required' : the mandatory keys of a dictionary
+# - 'values' : the schema of all the values of a dictionary
+# - 'items' : the schema of all the items of a list
+config_schemas = {
+    "global": {
+        "provider": {"type": str, "choices": list(terraform_vm_resource_name.keys()) + ["admin"]},
+        "provider_account": {"type": str},
+        "region": {"type": str},
+        "ssh_key_name": {"type": str},
+        "dedicated_ssh_keys": {"type": bool},
+        "ssh_key_type": {"type": str, "choices": ssh_key_types},
+        "use_tf_backend": {"type": bool},
+        "use_proxy": {"type": bool},
+        "default_os_user": {"type": str},
+        "depends_on": {"type": list, "items": {"type": str}},
+        "services_account": {"type": dict, "values": {"type": str}},
+        "custom_ssh_parameters": {"type": dict, "keys": {
+            "ssh_ports": {"type": dict},
+            "usernames": {"type": dict, "values": {"type": str}},
+            "all": {"type": dict}
+        }},
+        "ansible": {"type": list, "items": {
+            "type": dict,
+            "required": ["type"],
+            "keys": {
+                "name": {"type": str},
+                "type": {"type": str, "choices": ["role", "playbook", "command"]},
+                "hosts": {"type": str},
+                "roles": {"type": list, "items": {"type": dict, "required": ["source"]}},
+                "params": {"type": dict}
+            }
+        }}
+    },
+    "network": {
+        "type": dict,
+        "values": {
+            "type": dict,
+            "required": ["subnets"],
+            "keys": {
+                "network_cidr": {"type": str},
+                "prefix": {"type": str},
+                "datacenter": {"type": str},
+                "private_subnets_escape_public_subnet": {"type": str},
+                "subnets": {"type": dict, "values": {
+                    "type": dict,
+                    "keys": {
+                        "availability_zone": {"type": str},
+                        "cidr_block": {"type": str},
+                        "gateway_ip_address": {"type": str},
+                        "nameservers": {"type": list, "items": {"type": str}},
+                        "unmanaged": {"type": bool},
+                        "managed_ips": {"type": bool},
+                        "vlan_id": {"type": (int, str)}
+                    }
+                }}
+            }
+        }
+    },
+    "vm": {
+        "type": dict,
+        "values": {"type": dict, "values": {"type": dict, "values": {
+            "type": dict,
+            "keys": {
+                "group": {"type": str},
+                "type": {"type": str},
+                "prefix": {"type": str},
+                "availability_zone": {"type": str},
+                "system_image": {"type": str},
+                "subnet_type": {"type": str, "choices": ["private", "public"]},
+                "private_ip": {"type": str},
+                "os_user": {"type": str},
+                "size": {"type": dict, "keys": {
+                    "memory": {"type": int},
+                    "nb_sockets": {"type": int},
+                    "nb_vcpu_per_socket": {"type": int}
+                }},
+                "volumes": {"type": dict, "values": {"type": dict}},
+                "ingress_rules": {"type": list, "items": {"type": str}},
+                "ingress_cidr": {"type": dict, "values": {"type": list}},
+                "egress_rules": {"type": list, "items": {"type": str}},
+                "egress_cidr": {"type": dict},
+                "instance_profile": {"type": str},
+                "extra_parameters": {"type": dict}
+            }
+        }}}
+    },
+    "kubernetes": {
+        "type": dict,
+        "values": {
+            "type": dict,
+            "keys": {
+                "network": {"type": str},
+                "subnetworks": {"type": list, "items": {"type": str}},
+                "zones": {"type": list, "items": {"type": str}},
+                "k8s_node_groups": {"type": dict, "values": {"type": dict}}
+            }
+        }
+    },
+    "policy": {"type": dict, "values": {"type": dict}},
+    "profile": {"type": dict, "values": {"type": dict, "required": ["role_name"]}},
+    "role": {"type": dict, "values": {"type": dict}}
+}
+
+# keys of the networks and subnets that are mandatory for a provider
+provider_required_network_keys = {
+    "aws": {"network": ["network_cidr"], "subnet": ["cidr_block"]},
+    "azure": {"network": ["network_cidr"], "subnet": ["cidr_block"]},
+    "gcp": {"network": ["network_cidr"], "subnet": ["cidr_block"]},
+    "vsphere": {"network": ["datacenter"], "subnet": []},
+    "nutanix": {"network": [], "subnet": []}
+}
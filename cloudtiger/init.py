@@ -1,19 +1,26 @@
 """ Initial operations needed for CloudTiger """
 from genericpath import exists
+import functools
 import json
 import os
 import shutil
 import subprocess
 import sys
+from logging import Logger
 
 import click
 import base64
-import netaddr
 import yaml
 
 from cloudtiger.cloudtiger import Operation
-from cloudtiger.common_tools import load_yaml, j2, create_ssh_keys, read_user_choice, get_credentials
-from cloudtiger.data import available_infra_services, terraform_vm_resource_name, provider_secrets_helper
+from cloudtiger.common_tools import load_yaml, j2, create_ssh_keys, read_user_choice, get_credentials, \
+    copy_if_changed, write_if_changed, create_ssh_keys_batch
+from cloudtiger.data import available_infra_services, terraform_vm_resource_name, provider_secrets_helper, \
+    DEFAULT_SSH_KEY_TYPE
+from cloudtiger.layered_config import LayeredConfig
+from cloudtiger.output_store import get_output_store
+from cloudtiger.project import STANDARD_FILES
+from cloudtiger.scope_index import get_scope_index
 
 def config(operation: Operation):
 
@@ -102,6 +109,47 @@ def folder(operation: Operation):
     shutil.copytree(gitops_template, operation.scope, dirs_exist_ok=True)
 
 
+def dedicated_ssh_keys_spec(operation: Operation) -> tuple:
+
+    """ this function returns the location and type of the dedicated pair of SSH keys of
+    the scope, if needed by the config.yml
+
+    :param operation: Operation, the current Operation
+
+    :return: tuple, the (private folder, public folder, key name, key type) of the pair of
+    keys, None if the scope does not use dedicated keys
+    """
+
+    if not operation.scope_config_dict.get("dedicated_ssh_keys", False):
+        return None
+
+    private_ssh_folder = os.path.join(operation.project_root, "secrets", "ssh",
+                                      operation.scope, "private")
+    public_ssh_folder = os.path.join(operation.project_root, "secrets", "ssh",
+                                     operation.scope, "public")
+    ssh_key_name = operation.scope_config_dict.get("ssh_key_name",
+                                                   operation.scope.replace(os.sep, "_"))
+    ssh_key_type = operation.scope_config_dict.get("ssh_key_type", DEFAULT_SSH_KEY_TYPE)
+
+    return private_ssh_folder, public_ssh_folder, ssh_key_name, ssh_key_type
+
+
+def prepare_ssh_keys(logger: Logger, operations: list):
+
+    """ this function creates at once the missing dedicated pairs of SSH keys of several
+    scopes, generated by a pool of processes
+
+    :param logger: Logger, a Logger object to log details
+    :param operations: list, the list of Operation of the run
+    """
+
+    key_specs = [
+        dedicated_ssh_keys_spec(operation) for operation in operations
+        if hasattr(operation, "scope_config_dict")
+    ]
+    create_ssh_keys_batch(logger, [key_spec for key_spec in key_specs if key_spec is not None])
+
+
 def set_ssh_keys(operation: Operation):
 
     """ this function creates a dedicated pair of SSH keys for the scope if needed
@@ -110,21 +158,12 @@ def set_ssh_keys(operation: Operation):
     :param operation: Operation, the current Operation
     """
 
-    private_ssh_folder = ""
-    public_ssh_folder = ""
-    ssh_key_name = ""
-
     # first option, dedicated ssh keys pair wanted
-    if operation.scope_config_dict.get("dedicated_ssh_keys", False):
-        private_ssh_folder = os.path.join(operation.project_root, "secrets", "ssh",
-                                          operation.scope, "private")
-        public_ssh_folder = os.path.join(operation.project_root, "secrets", "ssh",
-                                         operation.scope, "public")
-        ssh_key_name = operation.scope_config_dict.get("ssh_key_name", 
-                                                       operation.scope.replace(os.sep, "_"))
-
+    key_spec = dedicated_ssh_keys_spec(operation)
+    if key_spec is not None:
+        private_ssh_folder, public_ssh_folder, ssh_key_name, ssh_key_type = key_spec
         create_ssh_keys(operation.logger, private_ssh_folder, public_ssh_folder,
-                        ssh_key_name=ssh_key_name)
+                        ssh_key_name=ssh_key_name, ssh_key_type=ssh_key_type)
 
     else:
         # second option, we use the CLOUDTIGER_SSH_KEY_PATH only
@@ -150,21 +189,29 @@ def configure_ip(operation: Operation):
     :param operation: Operation, the current Operation
     """
 
+    import netaddr
+
     # listing all the subnets that need to be crawled for available IPs
 
     subnets_to_crawl = {}
-    for network_name, network_subnets in operation.scope_config_dict.get('vm', {}).items():
-        for subnet_name, subnet_vms in network_subnets.items():
-            subnets_to_crawl[network_name] = []
-            for vm_name, vm in subnet_vms.items():
-                has_subnet_managed_ips = operation.scope_config_dict["network"][network_name]\
-                    ["subnets"][subnet_name].get("managed_ips", False)
-                if has_subnet_managed_ips & ("private_ip" not in vm.keys()):
-                    subnets_to_crawl[network_name].append(subnet_name)
-                    break
+    for vm in operation.vm_registry:
+        if vm.subnet in subnets_to_crawl.get(vm.network, []):
+            continue
+        has_subnet_managed_ips = operation.scope_config_dict["network"][vm.network]\
+            ["subnets"][vm.subnet].get("managed_ips", False)
+        if has_subnet_managed_ips & ("private_ip" not in vm.config.keys()):
+            subnets_to_crawl.setdefault(vm.network, []).append(vm.subnet)
 
     # we 'fping' the subnets to find available IPs
     available_ips = {}
+    # the IPs owned by the VMs of the scopes of the datacenter, which share its subnets
+    owned_ips = set()
+    if len(subnets_to_crawl) > 0:
+        datacenter = operation.scope.split(os.sep)[0]
+        output_store = get_output_store(operation.logger, operation.project_root)
+        output_store.sync(get_scope_index(operation.logger, operation.project_root)
+                          .select(datacenter))
+        owned_ips = output_store.get_datacenter_ips(datacenter)
     for network_name, network_subnets in subnets_to_crawl.items():
         available_ips[network_name] = {}
         for subnet_name in network_subnets:
@@ -200,47 +247,39 @@ def configure_ip(operation: Operation):
             else:
                 forbiddend_addresses_pool = []
 
+            # an unreachable IP may still be owned by a stopped VM of another scope
+            owned_addresses = [ip for ip in all_available_ips if ip in owned_ips]
+            if len(owned_addresses) > 0:
+                operation.logger.info("Skipping IPs owned by VMs of other scopes : %s"
+                                      % ", ".join(owned_addresses))
+
             available_ips[network_name][subnet_name] = [
-                ip for ip in all_available_ips if ip not in forbiddend_addresses_pool
+                ip for ip in all_available_ips
+                if (ip not in forbiddend_addresses_pool) & (ip not in owned_addresses)
                 ]
 
     # we load the IPs already set for the current scope
     operation.set_terraform_output_info()
 
     # we update the config_ips using the available IPs for the VMs missing an attributed IP
-    updated_config_ip = {
-        network_name: {
-            subnet_name: {
-                "addresses": {
-                    vm_name: vm.get("private_ip", 
-                                    operation.terraform_vm_data\
-                                        .get(
-                                            vm_name,
-                                            {"private_ip":"not_learned_yet"})["private_ip"])
-                    for vm_name, vm in subnet_vms.items()
-                }
-            }
-            for subnet_name, subnet_vms in network_subnets.items()
-        }
-        for network_name, network_subnets in operation.scope_config_dict.get("vm", {}).items()
-    }
-
-    for network_name, network_subnets in updated_config_ip.items():
-        for subnet_name, subnet_vms in network_subnets.items():
-            for vm_name, address in subnet_vms["addresses"].items():
-                if address == "not_learned_yet":
-                    has_subnet_managed_ips = operation.scope_config_dict["network"][network_name]\
-                        ["subnets"][subnet_name].get("managed_ips", False)
-                    if has_subnet_managed_ips:
-                        updated_config_ip[network_name][subnet_name]["addresses"][vm_name] = \
-                            available_ips[network_name][subnet_name].pop()
-                    else:
-                        updated_config_ip[network_name][subnet_name]["addresses"][vm_name] = \
-                            "not_learned_yet"
+    updated_config_ip = {}
+    for vm in operation.vm_registry:
+        address = vm.config.get("private_ip",
+                                operation.terraform_vm_data\
+                                    .get(vm.name, {"private_ip": "not_learned_yet"})["private_ip"])
+        if address == "not_learned_yet":
+            has_subnet_managed_ips = operation.scope_config_dict["network"][vm.network]\
+                ["subnets"][vm.subnet].get("managed_ips", False)
+            if has_subnet_managed_ips:
+                address = available_ips[vm.network][vm.subnet].pop()
+        updated_config_ip.setdefault(vm.network, {})\
+            .setdefault(vm.subnet, {"addresses": {}})["addresses"][vm.name] = address
 
     scope_ips = os.path.join(operation.scope_config_folder, 'config_ips.yml')
-    with open(scope_ips, 'w') as f:
-        yaml.dump(updated_config_ip, f)
+    if write_if_changed(operation.logger, scope_ips, yaml.dump(updated_config_ip)):
+        operation.changed_files.append(scope_ips)
+    else:
+        operation.logger.info("The IPs of the scope are unchanged")
 
 
 def prepare_scope_folder(operation: Operation):
@@ -256,9 +295,16 @@ def prepare_scope_folder(operation: Operation):
     os.makedirs(operation.scope_terraform_folder, exist_ok=True)
 
     # copying standard terraform folder
-    template_folder = os.path.join(operation.libraries_path, "internal", "terraform_providers")
+    # the jinja templates are rendered from the library, not copied
+    templates_folder = os.path.join(operation.libraries_path, "internal")
+    template_folder = os.path.join(templates_folder, "terraform_providers")
     operation.logger.debug("Creating scope from terraform template folder : %s" % template_folder)
-    shutil.copytree(template_folder, operation.scope_terraform_folder, dirs_exist_ok=True)
+    # the generated files are only written when their content changes
+    copy_function = functools.partial(copy_if_changed, operation.logger,
+                                      changed_files=operation.changed_files)
+    nb_changed_files = len(operation.changed_files)
+    shutil.copytree(template_folder, operation.scope_terraform_folder, dirs_exist_ok=True,
+                    ignore=shutil.ignore_patterns("*.j2"), copy_function=copy_function)
 
     # copying needed provider's modules into project root
     operation.logger.debug("Creating Terraform modules folder from libraries folder : %s"
@@ -268,7 +314,7 @@ def prepare_scope_folder(operation: Operation):
     target_modules = os.path.join(
         operation.project_root, "terraform", "providers", operation.provider)
     os.makedirs(target_modules, exist_ok=True)
-    shutil.copytree(tf_modules, target_modules, dirs_exist_ok=True)
+    shutil.copytree(tf_modules, target_modules, dirs_exist_ok=True, copy_function=copy_function)
 
     # loading attributed IPs from config_ips.yml
     operation.load_ips()
@@ -278,34 +324,35 @@ def prepare_scope_folder(operation: Operation):
 
     for service in available_infra_services:
         if service in operation.used_services:
-            j2(operation.logger, os.path.join(operation.scope_folder,
-                                              "terraform", "services", service + ".tfvars.j2"),
-               operation.scope_config_dict,
-               os.path.join(operation.scope_folder, "terraform", "services", service + ".tfvars"))
-        os.remove(os.path.join(operation.scope_folder, "terraform", "services",
-                               service + ".tfvars.j2"))
+            tf_file_path = os.path.join(operation.scope_folder, "terraform", "services",
+                                        service + ".tfvars")
+            if j2(operation.logger,
+                  os.path.join(template_folder, "services", service + ".tfvars.j2"),
+                  operation.scope_config_dict, tf_file_path, templates_folder):
+                operation.changed_files.append(tf_file_path)
 
     for tf_file in ["outputs.tf", "modules.tf", "provider.tf", "terraform.tfvars"]:
-        tf_template_path = os.path.join(operation.scope_folder, "terraform", tf_file + ".j2")
+        tf_template_path = os.path.join(template_folder, tf_file + ".j2")
         tf_file_path = os.path.join(operation.project_root, "scopes",
                                     operation.scope, "terraform", tf_file)
-        j2(operation.logger, tf_template_path, operation.scope_config_dict, tf_file_path)
-        os.remove(tf_template_path)
+        if j2(operation.logger, tf_template_path, operation.scope_config_dict, tf_file_path,
+              templates_folder):
+            operation.changed_files.append(tf_file_path)
 
-    for yaml_file in ["firewall_standard", "vm_standard", "disk_standard"]:
-        yaml_file_path = os.path.join(operation.libraries_path, "internal", "standard",
-                                      yaml_file + ".yml")
+    for yaml_file in STANDARD_FILES:
         tf_file_dest = os.path.join(operation.project_root, "scopes", operation.scope,
                                     "terraform", yaml_file + ".auto.tfvars.json")
-        yaml_file_content = load_yaml(operation.logger, yaml_file_path)
+        yaml_file_content = operation.project.standard_files[yaml_file]
         # we supercharge the vm_standard file with extra entries from
         # <GITOPS_FOLDER>/standard/standard.yml
         if yaml_file == "vm_standard":
-            yaml_file_content = operation.standard_config
-        with open(tf_file_dest, "w") as f:
-            json.dump(yaml_file_content, f, indent=4)
+            yaml_file_content = operation.standard_config.to_dict()
+        if write_if_changed(operation.logger, tf_file_dest,
+                            json.dumps(yaml_file_content, indent=4)):
+            operation.changed_files.append(tf_file_dest)
 
-    operation.logger.info("Successfully created and set scope folder")
+    operation.logger.info("Successfully created and set scope folder (%s file(s) changed)"
+                          % (len(operation.changed_files) - nb_changed_files))
 
 
 def prepare_platform_action(
@@ -336,11 +383,17 @@ def prepare_platform_action(
     platform_common_values["addresses_pool_offset"] = addresses_pool_offset
 
     # we prepare a config.yaml from jinja template
-    subfolder_values = dict(platform_common_values, **platform)
-    subfolder_values = dict(subfolder_values, **(operation.standard_config))
-    subfolder_values["vm_class"] = "nonprod"
+    # the values are read through the layers without copying them, a layer replacing
+    # the top-level values of the lower ones
+    vm_class = "nonprod"
     if os.sep + 'prod' in platform_parent_folder:
-        subfolder_values["vm_class"] = "prod"
+        vm_class = "prod"
+    subfolder_values = LayeredConfig([
+        ("meta_config", platform_common_values),
+        ("platform", platform),
+        ("standard", operation.standard_config),
+        ("scope", {"vm_class": vm_class})
+    ], deep=False)
 
     environment = platform_common_values.get("environment", "")
     if environment != "":
@@ -442,15 +495,16 @@ def init_meta_distribute(operation: Operation):
     :param operation: Operation, the current Operation
     """
 
+    import netaddr
+
     # we check if the meta_config already exists
     meta_config = {'infra':dict()}
     meta_config_path = os.path.join(operation.scope_config_folder, "meta_config.yml")
     if os.path.isfile(meta_config_path):
-        with open(meta_config_path, "r") as f:
-            try:
-                meta_config = yaml.load(f, Loader=yaml.FullLoader)
-            except Exception as e:
-                operation.logger.error("Failed to open meta_config file % with error %s".format(meta_config_path, e))
+        try:
+            meta_config = load_yaml(operation.logger, meta_config_path)
+        except Exception as e:
+            operation.logger.error("Failed to open meta_config file % with error %s".format(meta_config_path, e))
 
     # we set the addresses pool
     # cidr_block = ipaddress.summarize_address_range(
@@ -488,21 +542,19 @@ def init_meta_aggregate(operation: Operation):
     :param operation: Operation, the current Operation
     """
 
-    # we loop through the config folder
+    # we loop through the scopes inside the config folder
     meta_config = {'ansible':dict()}
-    for (root, _, files) in os.walk(operation.scope_config_folder):
-        if 'config.yml' in files:
-            subconfig_path = os.path.join(root, 'config.yml')
-            subconfig_scope = os.path.join(*(subconfig_path.split(os.sep)\
-                [len(operation.scope_config_folder.split(os.sep)):-1]))
-            # print(subconfig_scope)
-            with open(subconfig_path, 'r') as f:
-                try:
-                    subconfig_data = yaml.load(f, Loader=yaml.FullLoader)
-                except Exception as e:
-                    operation.logger.error(
-                        "Failed to open file % with error %s".format(subconfig_path, e))
-            meta_config['ansible'][subconfig_scope] = subconfig_data.get('ansible')
+    scope_index = get_scope_index(operation.logger, operation.project_root)
+    for indexed_scope in scope_index.select(operation.scope):
+        subconfig_path = os.path.join(operation.project_root, 'config', indexed_scope,
+                                      'config.yml')
+        subconfig_scope = os.path.relpath(indexed_scope, operation.scope)
+        try:
+            subconfig_data = load_yaml(operation.logger, subconfig_path)
+        except Exception as e:
+            operation.logger.error(
+                "Failed to open file % with error %s".format(subconfig_path, e))
+        meta_config['ansible'][subconfig_scope] = subconfig_data.get('ansible')
 
     # we write the meta_config.yml
     meta_config_path = os.path.join(operation.scope_config_folder, "meta_config.yml")
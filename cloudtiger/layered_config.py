@@ -0,0 +1,114 @@
+"""Read-only configuration resolved over several layers of dictionaries."""
+from collections.abc import Mapping
+
+
+class LayeredConfig(Mapping):
+    """
+    A class to read a stack of configuration layers (e.g. library defaults, project
+    standard, meta_config, scope config) as a single dictionary, without copying nor
+    modifying them. A key is resolved on first access in the highest layer defining it,
+    and the result is cached. In deep mode, the dictionaries found for a key in several
+    layers are merged recursively, as done by common_tools.merge_dictionaries; otherwise
+    the value of the highest layer is used as a whole, as done by dict(low, **high).
+
+    The layers must not be modified once the LayeredConfig is used.
+
+    Attributes
+    ----------
+    layers: list
+        the (name, dictionary) of each layer, from the lowest to the highest priority
+    deep: bool
+        set to True to merge the dictionaries of the layers recursively
+    resolved: dict
+        the already resolved keys, with the name of the layer supplying their value
+
+    Methods
+    -------
+    resolve()
+        return the value of a key and the name of the layer supplying it
+    provenance()
+        return the name of the layer supplying the value of a path of keys
+    to_dict()
+        return the resolved configuration as plain dictionaries
+    """
+
+    def __init__(self, layers: list, deep: bool = True):
+        self.layers = [(name, layer) for name, layer in layers if isinstance(layer, Mapping)]
+        self.deep = deep
+        self.resolved = {}
+
+    def resolve(self, key) -> tuple:
+
+        """ this function returns the value of a key, and the name of the layer supplying it.
+        In deep mode, a dictionary defined by several layers is returned as a LayeredConfig
+        of these layers
+
+        :param key: the key to resolve
+
+        :return: (str, value), the name of the supplying layer and the value
+        """
+
+        if key not in self.resolved.keys():
+            found = [(name, layer[key]) for name, layer in self.layers if key in layer]
+            if len(found) == 0:
+                raise KeyError(key)
+            name, value = found[-1]
+
+            if self.deep & isinstance(value, Mapping):
+                # a dictionary hides the values of lower layers that are not dictionaries
+                sublayers = []
+                for sublayer in reversed(found):
+                    if not isinstance(sublayer[1], Mapping):
+                        break
+                    sublayers.insert(0, sublayer)
+                if len(sublayers) > 1:
+                    value = LayeredConfig(sublayers, deep=True)
+
+            self.resolved[key] = (name, value)
+
+        return self.resolved[key]
+
+    def provenance(self, *path) -> str:
+
+        """ this function returns the name of the layer supplying the value of a path of
+        keys, e.g. provenance("vm_types", "aws"). When the value is a dictionary merged
+        from several layers, the highest one is returned
+
+        :param path: the successive keys leading to the value
+
+        :return: str, the name of the layer
+        """
+
+        name, value = self.resolve(path[0])
+        if (len(path) > 1) & isinstance(value, LayeredConfig):
+            return value.provenance(*path[1:])
+
+        return name
+
+    def to_dict(self) -> dict:
+
+        """ this function returns the resolved configuration as plain dictionaries, e.g.
+        for a json or yaml dump
+
+        :return: dict, the resolved configuration
+        """
+
+        return {
+            key: value.to_dict() if isinstance(value, LayeredConfig) else value
+            for key, value in self.items()
+        }
+
+    def __getitem__(self, key):
+        return self.resolve(key)[1]
+
+    def __contains__(self, key) -> bool:
+        return any(key in layer for _, layer in self.layers)
+
+    def __iter__(self):
+        return iter(dict.fromkeys(key for _, layer in self.layers for key in layer))
+
+    def __len__(self) -> int:
+        return len(dict.fromkeys(key for _, layer in self.layers for key in layer))
+
+    def __repr__(self) -> str:
+        return format("LayeredConfig(%s)" % ", ".join(name for name, _ in self.layers))
@@ -0,0 +1,259 @@
+"""Local SQLite store of the Terraform outputs of all the scopes of a project."""
+import json
+import os
+import sqlite3
+from logging import Logger
+
+from cloudtiger.common_tools import file_signature
+from cloudtiger.data import CACHE_FOLDER
+
+OUTPUT_STORE_VERSION = 1
+
+# the output stores opened by the current process, per project root
+OPENED_STORES = {}
+
+OUTPUT_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scopes (
+    scope TEXT PRIMARY KEY,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS vms (
+    scope TEXT NOT NULL,
+    name TEXT NOT NULL,
+    private_ip TEXT,
+    public_ip TEXT,
+    network_name TEXT,
+    subnet TEXT,
+    vm_group TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (scope, name)
+);
+CREATE INDEX IF NOT EXISTS vms_name ON vms (name);
+CREATE INDEX IF NOT EXISTS vms_private_ip ON vms (private_ip);
+CREATE INDEX IF NOT EXISTS vms_public_ip ON vms (public_ip);
+"""
+
+# the values of 'private_ip' in the terraform outputs of VMs without a known address
+UNKNOWN_ADDRESSES = ["", "not_learned_yet"]
+
+
+class TerraformOutputStore:
+    """
+    A class to store the VMs found in the 'terraform output -json' of every scope of a
+    project in <PROJECT_ROOT>/.cloudtiger/terraform_outputs.sqlite, indexed by scope,
+    VM name, private IP and public IP.
+
+    Attributes
+    ----------
+    logger: Logger
+        a Logger object to log store updates
+    project_root: str
+        the root folder ("gitops") of the project
+    store_file: str
+        the path of the SQLite database
+    connection: sqlite3.Connection
+        the connection to the database
+
+    Methods
+    -------
+    ingest()
+        replace the VMs of a scope by the VMs of its terraform_output.json file
+    sync()
+        ingest the terraform_output.json files modified since their last ingestion
+    get_scope_vms()
+        return the VMs of a scope
+    get_vm()
+        return the terraform output of a VM
+    get_datacenter_vms()
+        return the VMs of all the scopes of a datacenter
+    get_datacenter_ips()
+        return the IP addresses owned by the VMs of all the scopes of a datacenter
+    find_by_ip()
+        return the VMs owning an IP address
+    """
+
+    def __init__(self, logger: Logger, project_root: str):
+        self.logger = logger
+        self.project_root = project_root
+        self.store_file = os.path.join(project_root, CACHE_FOLDER, "terraform_outputs.sqlite")
+        os.makedirs(os.path.dirname(self.store_file), exist_ok=True)
+
+        self.connection = sqlite3.connect(self.store_file, timeout=30)
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != OUTPUT_STORE_VERSION:
+            self.logger.debug("Creating terraform output store %s" % self.store_file)
+            with self.connection:
+                self.connection.executescript(
+                    "DROP TABLE IF EXISTS scopes; DROP TABLE IF EXISTS vms;")
+                self.connection.executescript(OUTPUT_STORE_SCHEMA)
+                self.connection.execute("PRAGMA user_version = %s" % OUTPUT_STORE_VERSION)
+
+    def terraform_output_file(self, scope: str) -> str:
+
+        """ this function returns the path of the terraform output file of a scope
+
+        :param scope: str, the scope path relative to the 'config' folder
+
+        :return: str, the path to scopes/<SCOPE>/inventory/terraform_output.json
+        """
+
+        return os.path.join(self.project_root, "scopes", scope, "inventory",
+                            "terraform_output.json")
+
+    def ingest(self, scope: str, terraform_output_file: str = None):
+
+        """ this function replaces the VMs of a scope in the store by the VMs of its
+        terraform output file. If the file does not exist, the scope is removed
+
+        :param scope: str, the scope path relative to the 'config' folder
+        :param terraform_output_file: str, the path of the output of 'terraform output -json'
+        (by default scopes/<SCOPE>/inventory/terraform_output.json)
+        """
+
+        if terraform_output_file is None:
+            terraform_output_file = self.terraform_output_file(scope)
+
+        with self.connection:
+            self.connection.execute("DELETE FROM vms WHERE scope = ?", (scope,))
+            self.connection.execute("DELETE FROM scopes WHERE scope = ?", (scope,))
+            if not os.path.isfile(terraform_output_file):
+                self.logger.debug("No terraform output for scope %s" % scope)
+                return
+
+            mtime, size = file_signature(terraform_output_file)
+            with open(terraform_output_file, "r") as f:
+                terraform_output_data = json.load(f)
+
+            vms = (terraform_output_data.get("vms", {}) or {}).get("value", {}) or {}
+            self.connection.executemany(
+                "INSERT INTO vms VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (scope, vm_name, vm_data.get("private_ip"), vm_data.get("public_ip"),
+                     vm_data.get("network_name"), vm_data.get("subnet"), vm_data.get("group"),
+                     json.dumps(vm_data))
+                    for vm_name, vm_data in vms.items()
+                ]
+            )
+            self.connection.execute("INSERT INTO scopes VALUES (?, ?, ?)", (scope, mtime, size))
+
+        self.logger.debug("Stored terraform output of %s VMs for scope %s" % (len(vms), scope))
+
+    def sync(self, scopes: list):
+
+        """ this function ingests the terraform output files of some scopes if they have
+        changed since their last ingestion
+
+        :param scopes: list, the scope paths relative to the 'config' folder
+        """
+
+        ingested = {
+            scope: (mtime, size)
+            for scope, mtime, size in self.connection.execute("SELECT * FROM scopes")
+        }
+        for scope in scopes:
+            terraform_output_file = self.terraform_output_file(scope)
+            signature = None
+            if os.path.isfile(terraform_output_file):
+                signature = file_signature(terraform_output_file)
+            if signature != ingested.get(scope):
+                self.ingest(scope, terraform_output_file)
+
+    def get_scope_vms(self, scope: str) -> dict:
+
+        """ this function returns the VMs of a scope having a known private IP
+
+        :param scope: str, the scope path relative to the 'config' folder
+
+        :return: dict, the terraform output of each VM name
+        """
+
+        rows = self.connection.execute(
+            "SELECT name, data FROM vms WHERE scope = ? AND private_ip NOT IN (?, ?)",
+            (scope, *UNKNOWN_ADDRESSES)
+        )
+
+        return {vm_name: json.loads(data) for vm_name, data in rows}
+
+    def get_vm(self, scope: str, vm_name: str) -> dict:
+
+        """ this function returns the terraform output of a VM
+
+        :param scope: str, the scope path relative to the 'config' folder
+        :param vm_name: str, the name of the VM in the terraform output
+
+        :return: dict, the terraform output of the VM, None if the VM is unknown
+        """
+
+        row = self.connection.execute(
+            "SELECT data FROM vms WHERE scope = ? AND name = ?", (scope, vm_name)).fetchone()
+
+        return json.loads(row[0]) if row is not None else None
+
+    def get_datacenter_vms(self, datacenter: str) -> list:
+
+        """ this function returns the VMs of all the scopes of a datacenter having a
+        known private IP
+
+        :param datacenter: str, the first folder of the scopes of the datacenter
+
+        :return: list, the (scope, VM name, subnet, private IP) of each VM
+        """
+
+        return self.connection.execute(
+            "SELECT scope, name, subnet, private_ip FROM vms "
+            "WHERE (scope = ? OR substr(scope, 1, ?) = ?) AND private_ip NOT IN (?, ?) "
+            "ORDER BY scope, name",
+            (datacenter, len(datacenter) + 1, datacenter + os.sep, *UNKNOWN_ADDRESSES)
+        ).fetchall()
+
+    def get_datacenter_ips(self, datacenter: str) -> set:
+
+        """ this function returns the IP addresses owned by the VMs of all the scopes of a
+        datacenter, as private or public IP
+
+        :param datacenter: str, the first folder of the scopes of the datacenter
+
+        :return: set, the IP addresses
+        """
+
+        rows = self.connection.execute(
+            "SELECT private_ip FROM vms WHERE scope = ? OR substr(scope, 1, ?) = ? "
+            "UNION SELECT public_ip FROM vms WHERE scope = ? OR substr(scope, 1, ?) = ?",
+            (datacenter, len(datacenter) + 1, datacenter + os.sep) * 2
+        )
+
+        return set(address for address, in rows if address not in [None, *UNKNOWN_ADDRESSES])
+
+    def find_by_ip(self, address: str) -> list:
+
+        """ this function returns the VMs owning an IP address, as private or public IP
+
+        :param address: str, the IP address
+
+        :return: list, the (scope, VM name) of each VM owning the address
+        """
+
+        return self.connection.execute(
+            "SELECT scope, name FROM vms WHERE private_ip = ? "
+            "UNION SELECT scope, name FROM vms WHERE public_ip = ?",
+            (address, address)
+        ).fetchall()
+
+
+def get_output_store(logger: Logger, project_root: str) -> TerraformOutputStore:
+
+    """ this function returns the terraform output store of a project, opened once per
+    process (a SQLite connection cannot be shared with forked processes)
+
+    :param logger: Logger, a Logger object to log details
+    :param project_root: str, the root folder ("gitops") of the project
+
+    :return: TerraformOutputStore, the terraform output store
+    """
+
+    store_key = (os.path.abspath(project_root), os.getpid())
+    if store_key not in OPENED_STORES.keys():
+        OPENED_STORES[store_key] = TerraformOutputStore(logger, project_root)
+
+    return OPENED_STORES[store_key]
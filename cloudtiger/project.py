@@ -0,0 +1,169 @@
+"""Project-wide data shared by all the Operations of a CloudTiger run."""
+import os
+from logging import Logger
+
+from cloudtiger.common_tools import (
+    cached_load,
+    file_signature,
+    load_yaml,
+    read_dotenv
+)
+from cloudtiger.layered_config import LayeredConfig
+
+# the standard files of the CloudTiger libraries, dumped in the terraform folder of each scope
+STANDARD_FILES = ["firewall_standard", "vm_standard", "disk_standard"]
+
+# the project contexts already loaded by the current process, per project root and libraries
+LOADED_CONTEXTS = {}
+
+
+class ProjectContext:
+    """
+    A class to load once the files shared by all the scopes of a project : the root .env,
+    the standard configurations and the secrets of each account. A ProjectContext is
+    shared by all the Operations of a run, which must not modify its content.
+
+    Attributes
+    ----------
+    logger: Logger
+        a Logger object to log loading steps
+    project_root: str
+        the root folder ("gitops") of the project
+    libraries_path: str
+        the path to the folder of Ansible and Terraform libraries
+    root_env: dict
+        the variables of the .env file of the project root, None if the file does not exist
+    standard_files: dict
+        the content of the standard files of the libraries (firewall_standard, vm_standard
+        and disk_standard)
+    standard_config: LayeredConfig
+        the standard VMs and network configurations, resolved over the vm_standard file
+        of the libraries and <PROJECT_ROOT>/standard/standard.yml
+    secrets: dict
+        the variables of each secrets file, per (provider or service, account)
+    signatures: dict
+        the modification time and size of each loaded file, None if it did not exist
+
+    Methods
+    -------
+    load()
+        load the root .env and the standard configurations
+    get_secrets()
+        return the variables of the secrets file of an account
+    is_stale()
+        check if some loaded file has been modified since it was loaded
+    """
+
+    def __init__(self, logger: Logger, project_root: str, libraries_path: str):
+        self.logger = logger
+        self.project_root = project_root
+        self.libraries_path = libraries_path
+        self.root_env = None
+        self.standard_files = {}
+        self.standard_config = LayeredConfig([])
+        self.secrets = {}
+        self.signatures = {}
+
+    def track(self, path: str) -> bool:
+
+        """ this function records the signature of a file about to be loaded
+
+        :param path: str, the path of the file
+
+        :return: bool, True if the file exists
+        """
+
+        if os.path.isfile(path):
+            self.signatures[path] = file_signature(path)
+            return True
+
+        self.signatures[path] = None
+        return False
+
+    def load(self):
+
+        """ this function loads the root .env and the standard configurations of the project
+        """
+
+        self.logger.debug("Loading project files from %s" % self.project_root)
+
+        root_env = os.path.join(self.project_root, ".env")
+        if self.track(root_env):
+            self.root_env = cached_load(root_env, read_dotenv, memoize=True)
+
+        for standard_file in STANDARD_FILES:
+            standard_file_path = os.path.join(
+                self.libraries_path, "internal", "standard", standard_file + ".yml")
+            self.track(standard_file_path)
+            self.standard_files[standard_file] = load_yaml(self.logger, standard_file_path)
+
+        local_standard_file = os.path.join(self.project_root, "standard", "standard.yml")
+        if self.track(local_standard_file):
+            local_standard_config = load_yaml(self.logger, local_standard_file) or {}
+        else:
+            local_standard_config = {}
+        self.standard_config = LayeredConfig([
+            ("library", self.standard_files["vm_standard"]),
+            ("project", local_standard_config)
+        ])
+
+    def get_secrets(self, secrets_folder: str, account: str) -> dict:
+
+        """ this function returns the variables of the secrets file of an account, loading
+        it the first time it is needed
+
+        :param secrets_folder: str, the provider or service owning the account
+        :param account: str, the name of the account
+
+        :return: dict, the variables of <PROJECT_ROOT>/secrets/<FOLDER>/<ACCOUNT>.env,
+        None if the file does not exist
+        """
+
+        if (secrets_folder, account) not in self.secrets.keys():
+            secrets_file = os.path.join(self.project_root, "secrets", secrets_folder,
+                                        account + ".env")
+            self.logger.debug("Loading secrets file %s" % secrets_file)
+            secrets = None
+            if self.track(secrets_file):
+                secrets = cached_load(secrets_file, read_dotenv, memoize=True)
+            self.secrets[(secrets_folder, account)] = secrets
+
+        return self.secrets[(secrets_folder, account)]
+
+    def is_stale(self) -> bool:
+
+        """ this function checks if a file loaded by the context has been created, modified
+        or removed since it was loaded
+
+        :return: bool, True if the context should be loaded again
+        """
+
+        for path, signature in self.signatures.items():
+            current_signature = file_signature(path) if os.path.isfile(path) else None
+            if current_signature != signature:
+                self.logger.debug("Project file %s has changed" % path)
+                return True
+
+        return False
+
+
+def get_project_context(logger: Logger, project_root: str, libraries_path: str) -> ProjectContext:
+
+    """ this function returns the context of a project, loaded once per process and
+    loaded again only if one of its files has changed
+
+    :param logger: Logger, a Logger object to log details
+    :param project_root: str, the root folder ("gitops") of the project
+    :param libraries_path: str, the path to the folder of Ansible and Terraform libraries
+
+    :return: ProjectContext, the up-to-date project context
+    """
+
+    context_key = (os.path.abspath(project_root), os.path.abspath(libraries_path))
+    project_context = LOADED_CONTEXTS.get(context_key)
+    if (project_context is None) or project_context.is_stale():
+        project_context = ProjectContext(logger, *context_key)
+        project_context.load()
+        LOADED_CONTEXTS[context_key] = project_context
+
+    return project_context
@@ -0,0 +1,324 @@
+"""Execution of CloudTiger operations over several scopes."""
+import concurrent.futures
+import logging
+import os
+import sys
+import traceback
+from logging import Logger
+
+from cloudtiger.common_tools import (
+    create_logger,
+    load_yaml,
+    normalize_scope,
+    set_log_context,
+    stop_logger
+)
+
+
+def scope_log_folder(operation) -> str:
+
+    """ this function returns the folder where the logs and outputs of an operation
+    are dumped when running scopes in parallel
+
+    :param operation: Operation, the current Operation
+
+    :return: str, the path to the <PROJECT_ROOT>/scopes/<SCOPE>/logs folder
+    """
+
+    return os.path.join(operation.project_root, "scopes", operation.scope, "logs")
+
+
+def set_operation_log_context(operation):
+
+    """ this function sets the scope of the log records of the current process, and the
+    file receiving the output of its subprocesses, scopes/<SCOPE>/logs/stream.log
+
+    :param operation: Operation, the current Operation
+    """
+
+    stream_file = None
+    if hasattr(operation, "scope_config_dict"):
+        stream_file = os.path.join(scope_log_folder(operation), "stream.log")
+
+    set_log_context(scope=operation.scope, stream_file=stream_file)
+
+
+def run_scoped_operation(worker, operation, args: tuple, log_level: int,
+                         json_logs: bool = False):
+
+    """ this function runs a worker on a single operation inside a pool process.
+    The operation gets its own logger, output and error files, and any error is
+    caught and returned instead of being raised
+
+    :param worker: function, the function to apply on the operation
+    :param operation: Operation, the current Operation
+    :param args: tuple, the extra arguments of the worker
+    :param log_level: int, the logging level of the parent logger
+    :param json_logs: bool, set to True to write the log file as JSON lines
+
+    :return: (str, str), the scope and the error message (None if successful)
+    """
+
+    log_folder = scope_log_folder(operation)
+    os.makedirs(log_folder, exist_ok=True)
+
+    operation.logger = create_logger(
+        logfile=os.path.join(log_folder, "cloudtiger.log"),
+        verbose=(log_level <= logging.DEBUG),
+        name="cloudtiger.scope." + operation.scope.replace(os.sep, "."),
+        console=False,
+        json_logs=json_logs
+    )
+    operation.stdout_file = os.path.join(log_folder, "output.log")
+    operation.stderr_file = os.path.join(log_folder, "error.log")
+
+    # nobody can answer a prompt in a pool process : the commands reading their input get
+    # an end of file at once, instead of waiting forever
+    stdin = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(stdin, 0)
+    os.close(stdin)
+    sys.stdin = open(0, "r", closefd=False)
+
+    set_operation_log_context(operation)
+
+    try:
+        # the parent process has sourced the secrets of every scope, we make sure
+        # the secrets of the current scope are the ones in the environment
+        if hasattr(operation, "scope_config_dict"):
+            operation.secrets_setup()
+        worker(operation, *args)
+    except BaseException as e:
+        error = format("%s: %s" % (type(e).__name__, e))
+        operation.logger.error("Operation failed on scope %s\n%s"
+                               % (operation.scope, traceback.format_exc()))
+        return operation.scope, error
+    finally:
+        # the pool process may exit without running the exit handlers
+        stop_logger(operation.logger)
+
+    return operation.scope, None
+
+
+def load_meta_dependencies(logger: Logger, operation, meta_cache: dict) -> set:
+
+    """ this function collects the dependencies of a scope declared in the 'dependencies'
+    entry of the meta_config.yml files of its parent folders. In a meta_config.yml, scopes
+    are relative to the folder of the meta_config.yml :
+
+    dependencies:
+      <SUBSCOPE>: [<PARENT_SUBSCOPE>, ...]
+
+    :param logger: Logger, a Logger object to log details
+    :param operation: Operation, the current Operation
+    :param meta_cache: dict, the already loaded 'dependencies' entries per meta scope
+
+    :return: set, the parents of the scope
+    """
+
+    parents = set()
+    scope_elts = operation.scope.split(os.sep)
+    for depth in range(len(scope_elts)):
+        meta_scope = os.path.join(*scope_elts[:depth]) if depth > 0 else ""
+        if meta_scope not in meta_cache.keys():
+            meta_config_path = os.path.join(operation.project_root, "config", meta_scope,
+                                            "meta_config.yml")
+            meta_cache[meta_scope] = {}
+            if os.path.isfile(meta_config_path):
+                try:
+                    meta_config = load_yaml(logger, meta_config_path)
+                    meta_cache[meta_scope] = (meta_config or {}).get("dependencies", {}) or {}
+                except Exception as e:
+                    logger.error("Failed to read dependencies from %s : %s"
+                                 % (meta_config_path, e))
+        subscope = os.path.relpath(operation.scope, meta_scope or ".")
+        for parent in meta_cache[meta_scope].get(subscope, []) or []:
+            parents.add(normalize_scope(os.path.join(meta_scope, parent)))
+
+    return parents
+
+
+def build_dependencies(logger: Logger, operations: list) -> dict:
+
+    """ this function builds the dependency graph between the scopes of a run. A scope
+    depends on :
+    - the scopes listed in the 'depends_on' entry of its config.yml
+    - the scopes listed for it in the 'dependencies' entry of a parent meta_config.yml
+    - the <datacenter>/_meta scope of its datacenter (= the first folder of the scope path)
+    - the network-only scopes of the same provider defining the networks its VMs use
+
+    Dependencies on scopes that are not part of the run are ignored.
+
+    :param logger: Logger, a Logger object to log details
+    :param operations: list, the list of Operation of the run
+
+    :return: dict, the set of parent scopes for each scope
+    """
+
+    scopes = [operation.scope for operation in operations]
+    meta_cache = {}
+    dependencies = {}
+
+    # we list the networks defined by network-only scopes
+    network_scopes = {}
+    for operation in operations:
+        config = getattr(operation, "scope_config_dict", {})
+        if ("network" in config.keys()) & ("vm" not in config.keys()):
+            for network_name in (config["network"] or {}).keys():
+                network_scopes.setdefault((operation.provider, network_name), set())\
+                    .add(operation.scope)
+
+    for operation in operations:
+        config = getattr(operation, "scope_config_dict", {})
+        parents = set(normalize_scope(parent) for parent in config.get("depends_on", []) or [])
+        parents.update(load_meta_dependencies(logger, operation, meta_cache))
+
+        meta_scope = os.path.join(operation.scope.split(os.sep)[0], "_meta")
+        if meta_scope in scopes:
+            parents.add(meta_scope)
+
+        for network_name in (config.get("vm", {}) or {}).keys():
+            parents.update(network_scopes.get((operation.provider, network_name), set()))
+
+        parents.discard(operation.scope)
+        for parent in parents:
+            if parent not in scopes:
+                logger.debug("Scope %s depends on scope %s, which is not part of the run"
+                             % (operation.scope, parent))
+        dependencies[operation.scope] = set(parent for parent in parents if parent in scopes)
+
+    return dependencies
+
+
+def sort_operations(operations: list, dependencies: dict) -> list:
+
+    """ this function sorts the operations so that each scope comes after its parents,
+    keeping the original order otherwise
+
+    :param operations: list, the list of Operation of the run
+    :param dependencies: dict, the set of parent scopes for each scope
+
+    :return: list, the sorted list of Operation
+    """
+
+    sorted_operations = []
+    done = set()
+    remaining = list(operations)
+    while len(remaining) > 0:
+        ready = [operation for operation in remaining
+                 if dependencies[operation.scope].issubset(done)]
+        if len(ready) == 0:
+            cycle = ", ".join(operation.scope for operation in remaining)
+            raise Exception("Circular dependencies between scopes : %s" % cycle)
+        for operation in ready:
+            sorted_operations.append(operation)
+            done.add(operation.scope)
+            remaining.remove(operation)
+
+    return sorted_operations
+
+
+def run_operations(logger: Logger, operations: list, worker, args: tuple = (), jobs: int = 1,
+                   json_logs: bool = False):
+
+    """ this function applies a worker on a list of operations, in an order compatible with
+    the dependencies between their scopes. With several jobs, the operations run in a pool
+    of processes, and each operation starts as soon as all its parents are done
+
+    :param logger: Logger, a Logger object to log details
+    :param operations: list, the list of Operation to process
+    :param worker: function, the function to apply on each operation, called with
+    the operation followed by 'args'
+    :param args: tuple, the extra arguments of the worker
+    :param jobs: int, the maximum number of operations running at the same time
+    :param json_logs: bool, set to True to write the log files of the scopes as JSON lines
+
+    :return: dict, the error message of each failed or skipped scope
+    """
+
+    if len(operations) <= 1:
+        for operation in operations:
+            set_operation_log_context(operation)
+            worker(operation, *args)
+        return {}
+
+    dependencies = build_dependencies(logger, operations)
+    operations = sort_operations(operations, dependencies)
+
+    if jobs <= 1:
+        for operation in operations:
+            set_operation_log_context(operation)
+            worker(operation, *args)
+        return {}
+
+    logger.info("Running %s scopes with %s parallel jobs" % (len(operations), jobs))
+
+    children = {operation.scope: [] for operation in operations}
+    for scope, parents in dependencies.items():
+        for parent in parents:
+            children[parent].append(scope)
+    waiting = {scope: set(parents) for scope, parents in dependencies.items()}
+    operations_by_scope = {operation.scope: operation for operation in operations}
+
+    failures = {}
+    nb_done = 0
+    log_level = logger.getEffectiveLevel()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+
+        def submit(scope):
+            logger.info("Starting scope %s" % scope)
+            return executor.submit(run_scoped_operation, worker, operations_by_scope[scope],
+                                   args, log_level, json_logs)
+
+        running = {
+            submit(operation.scope): operation.scope
+            for operation in operations if len(waiting[operation.scope]) == 0
+        }
+
+        while len(running) > 0:
+            done, _ = concurrent.futures.wait(
+                running.keys(), return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                running.pop(future)
+                scope, error = future.result()
+                nb_done += 1
+                if error is None:
+                    logger.info("Scope %s done (%s/%s)" % (scope, nb_done, len(operations)))
+                    for child in children[scope]:
+                        waiting[child].discard(scope)
+                        if (len(waiting[child]) == 0) & (child not in failures.keys()):
+                            running[submit(child)] = child
+                else:
+                    logger.error("Scope %s failed (%s/%s) : %s"
+                                 % (scope, nb_done, len(operations), error))
+                    failures[scope] = error
+                    # the scopes depending on a failed scope are not executed
+                    descendants = list(children[scope])
+                    while len(descendants) > 0:
+                        descendant = descendants.pop()
+                        if descendant not in failures.keys():
+                            failures[descendant] = format("skipped, depends on failed scope %s"
+                                                          % scope)
+                            nb_done += 1
+                            descendants.extend(children[descendant])
+
+    summarize_failures(logger, operations, failures)
+
+    return failures
+
+
+def summarize_failures(logger: Logger, operations: list, failures: dict):
+
+    """ this function logs a summary of a multi-scope run
+
+    :param logger: Logger, a Logger object to log details
+    :param operations: list, the list of Operation processed
+    :param failures: dict, the error message of each failed scope
+    """
+
+    logger.info("%s scopes succeeded, %s failed"
+                % (len(operations) - len(failures), len(failures)))
+
+    for operation in operations:
+        if operation.scope in failures.keys():
+            logger.error("- %s : %s (see %s)" % (operation.scope, failures[operation.scope],
+                                                 scope_log_folder(operation)))
@@ -0,0 +1,241 @@
+"""Persistent index of the scopes of a CloudTiger project."""
+import fnmatch
+import hashlib
+import json
+import os
+from logging import Logger
+
+from cloudtiger.common_tools import load_yaml, normalize_scope, write_if_changed
+from cloudtiger.data import CACHE_FOLDER, available_api_services, available_infra_services
+
+SCOPE_INDEX_VERSION = 1
+
+# the scope indexes already refreshed by the current process, per project root
+LOADED_INDEXES = {}
+
+
+class ScopeIndex:
+    """
+    A class to list the scopes of a CloudTiger project without walking and parsing the
+    whole 'config' folder at each run. The index is stored in
+    <PROJECT_ROOT>/.cloudtiger/scope_index.json, and kept up to date using the
+    modification times of the folders and of the config.yml files.
+
+    Attributes
+    ----------
+    logger: Logger
+        a Logger object to log index updates
+    project_root: str
+        the root folder ("gitops") of the project
+    index_file: str
+        the path of the json file storing the index
+    folders: dict
+        for each folder of the 'config' folder, its modification time, its subfolders
+        and whether it contains a config.yml file
+    scopes: dict
+        for each scope, its provider, its services, its number of VMs and the
+        modification time, size and hash of its config.yml file
+
+    Methods
+    -------
+    refresh()
+        update the index with the folders and config.yml files modified since the last run
+    select()
+        list the scopes inside a folder matching some criteria
+    """
+
+    def __init__(self, logger: Logger, project_root: str):
+        self.logger = logger
+        self.project_root = project_root
+        self.config_root = os.path.join(project_root, "config")
+        self.index_file = os.path.join(project_root, CACHE_FOLDER, "scope_index.json")
+        self.folders = {}
+        self.scopes = {}
+        self.modified = False
+
+        if os.path.isfile(self.index_file):
+            try:
+                with open(self.index_file, "r") as f:
+                    index = json.load(f)
+                if index.get("version") == SCOPE_INDEX_VERSION:
+                    self.folders = index["folders"]
+                    self.scopes = index["scopes"]
+            except Exception as e:
+                self.logger.warning("Cannot read scope index %s, rebuilding it : %s"
+                                    % (self.index_file, e))
+
+    def refresh(self):
+
+        """ this function updates the index with the folders and config.yml files modified
+        since the last run, then saves it
+        """
+
+        seen_folders = set()
+        seen_scopes = set()
+        pending = [""]
+        while len(pending) > 0:
+            folder = pending.pop()
+            seen_folders.add(folder)
+            folder_path = os.path.join(self.config_root, folder)
+            try:
+                folder_mtime = os.stat(folder_path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+
+            # the content of a folder is listed again only if it has changed
+            folder_entry = self.folders.get(folder)
+            if (folder_entry is None) or (folder_entry["mtime"] != folder_mtime):
+                subfolders = []
+                has_config = False
+                for entry in os.scandir(folder_path):
+                    if entry.is_dir():
+                        subfolders.append(entry.name)
+                    elif entry.name == "config.yml":
+                        has_config = True
+                folder_entry = {
+                    "mtime": folder_mtime,
+                    "subfolders": sorted(subfolders),
+                    "has_config": has_config
+                }
+                self.folders[folder] = folder_entry
+                self.modified = True
+
+            if folder_entry["has_config"]:
+                scope = folder if folder != "" else "."
+                seen_scopes.add(scope)
+                self.refresh_scope(scope)
+
+            pending.extend(os.path.join(folder, subfolder)
+                           for subfolder in folder_entry["subfolders"])
+
+        for folder in set(self.folders.keys()) - seen_folders:
+            self.folders.pop(folder)
+            self.modified = True
+        for scope in set(self.scopes.keys()) - seen_scopes:
+            self.logger.debug("Scope %s has been removed" % scope)
+            self.scopes.pop(scope)
+            self.modified = True
+
+        if self.modified:
+            self.save()
+
+    def refresh_scope(self, scope: str):
+
+        """ this function updates the index entry of a scope if its config.yml file
+        has changed
+
+        :param scope: str, the scope path relative to the 'config' folder
+        """
+
+        config_file = os.path.join(self.config_root, scope, "config.yml")
+        try:
+            stat = os.stat(config_file)
+        except FileNotFoundError:
+            return
+
+        scope_entry = self.scopes.get(scope)
+        if scope_entry is not None:
+            if (scope_entry["mtime"] == stat.st_mtime_ns) & (scope_entry["size"] == stat.st_size):
+                return
+
+        self.logger.debug("Indexing scope %s" % scope)
+        with open(config_file, "rb") as f:
+            config_hash = hashlib.sha256(f.read()).hexdigest()
+
+        try:
+            config = load_yaml(self.logger, config_file) or {}
+        except Exception as e:
+            self.logger.error("Cannot parse %s : %s" % (config_file, e))
+            config = {}
+
+        self.scopes[scope] = {
+            "provider": config.get("provider", "admin"),
+            "services": [service for service in available_infra_services + available_api_services
+                         if service in config.keys()],
+            "nb_vms": sum(
+                len(subnet_vms or {})
+                for network_subnets in (config.get("vm", {}) or {}).values()
+                for subnet_vms in (network_subnets or {}).values()
+            ),
+            "config_hash": config_hash,
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size
+        }
+        self.modified = True
+
+    def save(self):
+
+        """ this function writes the index into its json file """
+
+        # each process writes its own temporary file, then replaces the index atomically
+        write_if_changed(self.logger, self.index_file, json.dumps({
+            "version": SCOPE_INDEX_VERSION,
+            "folders": self.folders,
+            "scopes": self.scopes
+        }))
+        self.modified = False
+
+    def select(self, folder: str = ".", criteria: list = None) -> list:
+
+        """ this function lists the scopes inside a folder matching all the criteria.
+        A criterion is a string 'key=pattern', where key is one of :
+        - provider : the provider of the scope
+        - service : one of the services of the scope
+        - name : the path of the scope
+
+        :param folder: str, the folder containing the scopes (relative to the project root
+        or to the 'config' folder)
+        :param criteria: list, the list of criteria
+
+        :return: list, the sorted paths of the matching scopes, relative to the 'config' folder
+        """
+
+        folder = normalize_scope(folder)
+        if folder == "config":
+            folder = "."
+
+        filters = []
+        for criterion in criteria or []:
+            if "=" not in criterion:
+                raise Exception("Badly formatted scope criterion %s, expected "
+                                "'key=pattern'" % criterion)
+            key, pattern = criterion.split("=", 1)
+            if key not in ["provider", "service", "name"]:
+                raise Exception("Unknown scope criterion %s, available criteria are "
+                                "provider, service and name" % key)
+            filters.append((key, pattern))
+
+        selected_scopes = []
+        for scope, scope_entry in self.scopes.items():
+            if (folder != ".") & (scope != folder) & (not scope.startswith(folder + os.sep)):
+                continue
+            values = {
+                "provider": [scope_entry["provider"]],
+                "service": scope_entry["services"],
+                "name": [scope]
+            }
+            if all(
+                any(fnmatch.fnmatch(value, pattern) for value in values[key])
+                for key, pattern in filters
+            ):
+                selected_scopes.append(scope)
+
+        return sorted(selected_scopes)
+
+
+def get_scope_index(logger: Logger, project_root: str) -> ScopeIndex:
+
+    """ this function returns the scope index of a project, refreshed once per process
+
+    :param logger: Logger, a Logger object to log details
+    :param project_root: str, the root folder ("gitops") of the project
+
+    :return: ScopeIndex, the up-to-date scope index
+    """
+
+    if project_root not in LOADED_INDEXES.keys():
+        scope_index = ScopeIndex(logger, project_root)
+        scope_index.refresh()
+        LOADED_INDEXES[project_root] = scope_index
+
+    return LOADED_INDEXES[project_root]
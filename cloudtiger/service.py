@@ -1,10 +1,13 @@
 """ CloudTiger functions for using Terraform with non-infrastructure services."""
+import functools
 import json
 import os
 import shutil
 
 from cloudtiger.cloudtiger import Operation
-from cloudtiger.common_tools import bash_action, j2
+from cloudtiger.common_tools import bash_action, copy_if_changed, j2, write_if_changed
+from cloudtiger.data import TF_APPROVAL_ACTIONS
+from cloudtiger.tf_plugins import setup_terraform_plugins
 
 
 def prepare(operation: Operation, service):
@@ -22,7 +25,11 @@ def prepare(operation: Operation, service):
     template_folder = os.path.join(operation.libraries_path, "internal",
                                    "terraform_services", service)
     operation.logger.debug("Creating service folder from template : %s" % template_folder)
-    shutil.copytree(template_folder, service_folder, dirs_exist_ok=True)
+    # the generated files are only written when their content changes
+    copy_function = functools.partial(copy_if_changed, operation.logger,
+                                      changed_files=operation.changed_files)
+    shutil.copytree(template_folder, service_folder, dirs_exist_ok=True,
+                    ignore=shutil.ignore_patterns("*.j2"), copy_function=copy_function)
 
     # copying needed provider's modules into project root
     operation.logger.debug(
@@ -31,22 +38,23 @@ def prepare(operation: Operation, service):
                               service)
     target_modules = os.path.join(operation.project_root, "terraform", "services", service)
     os.makedirs(target_modules, exist_ok=True)
-    shutil.copytree(tf_modules, target_modules, dirs_exist_ok=True)
+    shutil.copytree(tf_modules, target_modules, dirs_exist_ok=True, copy_function=copy_function)
 
     # copying input for the service from the config.yml file in the
     # scopes/<SCOPE>/<SERVICE>/service_config.yml file
     service_config_file = os.path.join(operation.scope_folder, service,
                                        "service_config.auto.tfvars.json")
-    with open(service_config_file, "w") as f:
-        json.dump({service + "_config": operation.scope_config_dict[service]}, f, indent=4)
+    if write_if_changed(operation.logger, service_config_file,
+                        json.dumps({service + "_config": operation.scope_config_dict[service]},
+                                   indent=4)):
+        operation.changed_files.append(service_config_file)
 
     # setting the main.tf for the service called
-    template_file = os.path.join(service_folder, "main.tf.j2")
-    j2(operation.logger, template_file, operation.scope_config_dict,
-       os.path.join(service_folder, "main.tf"))
-
-    if os.path.exists(template_file):
-        os.remove(template_file)
+    template_file = os.path.join(template_folder, "main.tf.j2")
+    main_tf_file = os.path.join(service_folder, "main.tf")
+    if j2(operation.logger, template_file, operation.scope_config_dict, main_tf_file,
+          os.path.join(operation.libraries_path, "internal")):
+        operation.changed_files.append(main_tf_file)
 
 
 def tf_service_generic(operation, tf_action, service):
@@ -59,6 +67,9 @@ def tf_service_generic(operation, tf_action, service):
 
     operation.logger.info("Executing Terraform command %s", tf_action)
 
+    # the providers are shared by the scopes of the project
+    setup_terraform_plugins(operation)
+
     service_folder = os.path.join(operation.scope_folder, service)
     terraform_service_output = os.path.join(operation.scope_folder, service,
                                             "terraform_" + service + "_output.json")
@@ -68,10 +79,14 @@ def tf_service_generic(operation, tf_action, service):
 
     if tf_action not in ["output", "list", "import"]:
         command = format("terraform %s" % tf_action)
+        if (tf_action in TF_APPROVAL_ACTIONS) & operation.tf_auto_approve:
+            command += " -auto-approve -input=false"
 
-        bash_action(operation.logger, command, service_folder, os.environ, operation.stdout_file)
+        bash_action(operation.logger, command, service_folder, os.environ, operation.stdout_file,
+                    check=True)
 
     if tf_action in ["apply", "refresh", "output", "plan"]:
         os.makedirs(os.path.join(operation.scope_folder, service), exist_ok=True)
         command = "terraform output -json"
-        bash_action(operation.logger, command, service_folder, os.environ, terraform_service_output)
+        bash_action(operation.logger, command, service_folder, os.environ, terraform_service_output,
+                    check=True)
@@ -1,34 +1,225 @@
-import base64
+"""Client of the Nutanix v3 API, to find the UUID of the VMs to import."""
 import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
 
 import requests
 
 from cloudtiger.cloudtiger import Operation
+from cloudtiger.common_tools import write_if_changed
 
+NUTANIX_API_PORT = 9440
 
-def get_vm_nutanix_uuid(operation: Operation, vm_name):
+# maximum number of entities returned by a 'list' call of the Nutanix v3 API
+NUTANIX_PAGE_LENGTH = 500
+
+# number of pages requested at the same time
+NUTANIX_JOBS = 4
+
+# time (in seconds) during which the list of VMs cached on disk is used
+NUTANIX_CACHE_TTL = 3600
+
+# time (in seconds) given to the Nutanix API to answer
+NUTANIX_TIMEOUT = 60
+
+# the Nutanix clients of the current process, per endpoint
+NUTANIX_CLIENTS = {}
 
-    """ this function calls the nutanix API to get the uuid of a VM """
-    url = format("https://%s:9440/api/nutanix/v3/%s/list" % (operation.provider_secret.get("TF_VAR_nutanix_endpoint", "nutanix_endpoint"), "vms"))
 
-    nutanix_auth = base64.b64encode((operation.provider_secret.get("TF_VAR_nutanix_user", "missing_user") + ':' + operation.provider_secret.get("TF_VAR_nutanix_password", "missing_password")).encode('ascii')).decode('ascii')
+class NutanixClient:
+    """
+    A class to query the Nutanix v3 API through a single HTTP session, and to map the names
+    of the VMs to their UUID.
 
-    headers = {
-            "Authorization" : "Basic " + nutanix_auth,
+    Attributes
+    ----------
+    logger: Logger
+        a Logger object to log details
+    base_url: str
+        the URL of the v3 API, e.g. https://<ENDPOINT>:9440/api/nutanix/v3
+    session: requests.Session
+        the HTTP session, keeping the connections (and TLS handshakes) between calls
+    page_length: int
+        the number of VMs requested per page
+    jobs: int
+        the number of pages requested at the same time
+    cache_file: str
+        the JSON file where the UUIDs of the VMs are cached (no cache if None)
+    cache_ttl: float
+        the time (in seconds) during which the cache file is used
+    vm_uuids: dict
+        the UUID of each VM, by name, once listed
+
+    Methods
+    -------
+    list_vms_page()
+        list a page of VMs
+    list_vms()
+        list all the VMs
+    get_vm_uuids()
+        return the UUID of each VM, from the cache file if it is recent enough
+    get_vm_uuid()
+        return the UUID of a VM
+    """
+
+    def __init__(self, logger: Logger, base_url: str, user: str, password: str,
+                 page_length: int = NUTANIX_PAGE_LENGTH, jobs: int = NUTANIX_JOBS,
+                 cache_file: str = None, cache_ttl: float = NUTANIX_CACHE_TTL):
+        self.logger = logger
+        self.base_url = base_url.rstrip("/")
+        self.page_length = page_length
+        self.jobs = jobs
+        self.cache_file = cache_file
+        self.cache_ttl = cache_ttl
+        self.vm_uuids = None
+
+        self.session = requests.Session()
+        self.session.auth = (user, password)
+        self.session.headers.update({
             "Content-type": "application/json",
             "Accept": "application/json"
-        }
+        })
+        # one connection per concurrent page
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(jobs, 1))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def list_vms_page(self, offset: int) -> dict:
+
+        """ this function lists a page of VMs
+
+        :param offset: int, the index of the first VM of the page
+
+        :return: dict, the answer of the API ('metadata' and 'entities')
+        """
+
+        url = self.base_url + "/vms/list"
+        payload = {"kind": "vm", "length": self.page_length, "offset": offset}
+        self.logger.debug("API query %s with payload %s" % (url, payload))
+
+        r = self.session.post(url, data=json.dumps(payload), timeout=NUTANIX_TIMEOUT)
+        if r.status_code != 200:
+            err = format("Nutanix API query %s failed with status %s : %s"
+                         % (url, r.status_code, r.text[:200]))
+            self.logger.error(err)
+            raise Exception(err)
+
+        return r.json()
+
+    def list_vms(self) -> list:
+
+        """ this function lists all the VMs, the pages after the first one being
+        requested concurrently
+
+        :return: list, the VM entities
+        """
+
+        start = time.perf_counter()
+        first_page = self.list_vms_page(0)
+        entities = list(first_page.get("entities", []))
+        total = first_page.get("metadata", {}).get("total_matches", len(entities))
+
+        offsets = list(range(self.page_length, total, self.page_length))
+        if len(offsets) > 0:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                for page in executor.map(self.list_vms_page, offsets):
+                    entities.extend(page.get("entities", []))
+
+        self.logger.info("Listed %s Nutanix VMs in %s page(s) (%.1fs)"
+                         % (len(entities), len(offsets) + 1, time.perf_counter() - start))
 
-    payload = format('{"kind":"vm","length":1,"offset":0,"filter":"vm_name==%s"}' % vm_name)
+        return entities
 
-    operation.logger.info("API query %s with payload %s" % (url, payload))
+    def get_vm_uuids(self, refresh: bool = False) -> dict:
 
-    r = requests.post(url, headers=headers, data=payload)
+        """ this function returns the UUID of each VM, listed once and cached in the cache file
 
-    content = json.loads(r.content)
+        :param refresh: bool, set to True to list the VMs again, even if the cache is recent
 
-    # operation.logger.info(content)
+        :return: dict, the UUID of each VM, by name
+        """
 
-    uuid = content["entities"][0]["metadata"]["uuid"]
+        if (self.vm_uuids is not None) & (not refresh):
+            return self.vm_uuids
+
+        if (not refresh) and (self.cache_file is not None) and os.path.isfile(self.cache_file):
+            if time.time() - os.path.getmtime(self.cache_file) < self.cache_ttl:
+                try:
+                    with open(self.cache_file, "r") as f:
+                        self.vm_uuids = json.load(f)
+                    self.logger.debug("Nutanix VMs loaded from %s" % self.cache_file)
+                    return self.vm_uuids
+                except ValueError:
+                    self.logger.warning("Ignoring corrupted cache file %s" % self.cache_file)
+
+        vm_uuids = {}
+        for entity in self.list_vms():
+            vm_name = entity.get("spec", {}).get("name", entity.get("status", {}).get("name"))
+            if vm_name in vm_uuids:
+                # the first VM is kept, as the filtered queries did
+                self.logger.warning("Several Nutanix VMs are named %s" % vm_name)
+                continue
+            vm_uuids[vm_name] = entity["metadata"]["uuid"]
+        self.vm_uuids = vm_uuids
+
+        if self.cache_file is not None:
+            # each process writes its own temporary file, then replaces the cache atomically
+            if not write_if_changed(self.logger, self.cache_file, json.dumps(vm_uuids)):
+                # the age of the cache is the age of the file
+                os.utime(self.cache_file)
+
+        return self.vm_uuids
+
+    def get_vm_uuid(self, vm_name: str) -> str:
+
+        """ this function returns the UUID of a VM, listing the VMs again if the VM is not
+        in the cache (e.g. if it was created after the cache)
+
+        :param vm_name: str, the name of the VM
+
+        :return: str, the UUID of the VM
+        """
+
+        vm_uuids = self.get_vm_uuids()
+        if vm_name not in vm_uuids:
+            vm_uuids = self.get_vm_uuids(refresh=True)
+        if vm_name not in vm_uuids:
+            err = format("No Nutanix VM named %s" % vm_name)
+            self.logger.error(err)
+            raise Exception(err)
+
+        return vm_uuids[vm_name]
+
+
+def get_nutanix_client(operation: Operation) -> NutanixClient:
+
+    """ this function returns the Nutanix client of the endpoint of the scope, created once
+    per process, with the credentials loaded from the provider secrets
+
+    :param operation: Operation, the current Operation
+
+    :return: NutanixClient, the client
+    """
+
+    endpoint = os.environ.get("TF_VAR_nutanix_endpoint", "nutanix_endpoint")
+    if endpoint not in NUTANIX_CLIENTS:
+        cache_file = os.path.join(operation.project_root, ".cloudtiger",
+                                  "nutanix_vms_%s.json" % re.sub(r"[^A-Za-z0-9.-]", "_", endpoint))
+        NUTANIX_CLIENTS[endpoint] = NutanixClient(
+            operation.logger,
+            format("https://%s:%s/api/nutanix/v3" % (endpoint, NUTANIX_API_PORT)),
+            os.environ.get("TF_VAR_nutanix_user", "missing_user"),
+            os.environ.get("TF_VAR_nutanix_password", "missing_password"),
+            cache_file=cache_file)
+
+    return NUTANIX_CLIENTS[endpoint]
+
+
+def get_vm_nutanix_uuid(operation: Operation, vm_name):
+
+    """ this function calls the nutanix API to get the uuid of a VM """
 
-    return uuid
+    return get_nutanix_client(operation).get_vm_uuid(vm_name)
@@ -0,0 +1,240 @@
+"""Asyncio supervisor of the child processes (terraform, ansible, ssh) run by CloudTiger."""
+import asyncio
+import os
+import signal
+import sys
+import time
+
+# time (in seconds) given to a process to exit after a SIGTERM, before a SIGKILL
+TERMINATE_GRACE_PERIOD = 10
+
+# size of the chunks read from the outputs of the processes
+READ_CHUNK_SIZE = 65536
+
+
+class ProcessResult:
+    """
+    A class to store the result of a child process.
+
+    Attributes
+    ----------
+    command: str
+        the shell command executed
+    returncode: int
+        the exit code of the process (negative if killed by a signal)
+    duration: float
+        the wall-clock duration of the process, in seconds
+    stdout_bytes: int
+        the number of bytes written by the process on its standard output
+    stderr_bytes: int
+        the number of bytes written by the process on its standard error (0 if the standard
+        error is merged into the standard output)
+    timed_out: bool
+        True if the process was killed because it exceeded its timeout
+    """
+
+    __slots__ = ("command", "returncode", "duration", "stdout_bytes", "stderr_bytes",
+                 "timed_out")
+
+    def __init__(self, command: str, returncode: int, duration: float, stdout_bytes: int = 0,
+                 stderr_bytes: int = 0, timed_out: bool = False):
+        self.command = command
+        self.returncode = returncode
+        self.duration = duration
+        self.stdout_bytes = stdout_bytes
+        self.stderr_bytes = stderr_bytes
+        self.timed_out = timed_out
+
+    @property
+    def success(self) -> bool:
+        return (self.returncode == 0) & (not self.timed_out)
+
+    def __repr__(self) -> str:
+        return format("ProcessResult(%r, returncode=%s, duration=%.2f)"
+                      % (self.command, self.returncode, self.duration))
+
+
+async def pump(stream, writer=None, on_line=None) -> int:
+
+    """ this function copies the output of a process to a writer, and/or passes each
+    of its lines to a callback, until the process closes it
+
+    :param stream: asyncio.StreamReader, the output of the process
+    :param writer: a binary file object where the output is written
+    :param on_line: function, called with each line of the output (as a str, without
+    the line ending)
+
+    :return: int, the number of bytes read
+    """
+
+    nb_bytes = 0
+    pending = b""
+    while True:
+        chunk = await stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        nb_bytes += len(chunk)
+        if writer is not None:
+            writer.write(chunk)
+        if on_line is not None:
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                on_line(line.decode(errors="replace").replace("\r", ""))
+
+    if (on_line is not None) & (len(pending) > 0):
+        on_line(pending.decode(errors="replace").replace("\r", ""))
+
+    return nb_bytes
+
+
+def signal_process(process, signal_number: int):
+
+    """ this function sends a signal to a process, and to its whole process group if the
+    process leads its own session (so that the commands started by the shell are reached too)
+
+    :param process: asyncio.subprocess.Process, the process
+    :param signal_number: int, the signal
+    """
+
+    try:
+        if os.getpgid(process.pid) == process.pid:
+            os.killpg(process.pid, signal_number)
+        else:
+            process.send_signal(signal_number)
+    except ProcessLookupError:
+        pass
+
+
+async def stop_process(process):
+
+    """ this function terminates a process, and kills it if it does not exit after
+    TERMINATE_GRACE_PERIOD seconds
+
+    :param process: asyncio.subprocess.Process, the process
+    """
+
+    if process.returncode is not None:
+        return
+    signal_process(process, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), TERMINATE_GRACE_PERIOD)
+    except asyncio.TimeoutError:
+        signal_process(process, signal.SIGKILL)
+        await process.wait()
+
+
+async def run_process(command: str,
+                      folder: str,
+                      env: dict,
+                      stdout=None,
+                      stderr=None,
+                      merge_stderr: bool = True,
+                      on_line=None,
+                      timeout: float = None,
+                      set_input: str = None) -> ProcessResult:
+
+    """ this function runs a shell command and pumps its outputs without blocking the
+    event loop. The process is stopped if it exceeds its timeout or if the coroutine
+    is cancelled
+
+    :param command: str, the shell command
+    :param folder: str, the folder where the command is executed
+    :param env: dict, the environment of the command
+    :param stdout: a binary file object where the standard output is written
+    :param stderr: a binary file object where the standard error is written
+    :param merge_stderr: bool, set to True to send the standard error to the standard output
+    (when 'stderr' is not set)
+    :param on_line: function, called with each line of the standard output
+    :param timeout: float, the maximum duration of the command in seconds (no limit if None)
+    :param set_input: str, the text written on the standard input of the command
+
+    :return: ProcessResult, the result of the command
+    """
+
+    start = time.perf_counter()
+    stderr_mode = asyncio.subprocess.PIPE
+    if (stderr is None) & merge_stderr:
+        stderr_mode = asyncio.subprocess.STDOUT
+
+    # a command reading a terminal (e.g. the confirmation of 'terraform apply') must stay in
+    # the foreground process group; otherwise it gets its own session, so that a timeout
+    # stops all the processes started by the shell
+    interactive = (set_input is None) and (sys.stdin is not None) and sys.stdin.isatty()
+    process = await asyncio.create_subprocess_shell(
+        command, cwd=folder, env=env,
+        stdin=asyncio.subprocess.PIPE if set_input is not None else None,
+        stdout=asyncio.subprocess.PIPE, stderr=stderr_mode,
+        start_new_session=not interactive)
+
+    async def communicate():
+        if set_input is not None:
+            process.stdin.write(set_input.encode())
+            await process.stdin.drain()
+            process.stdin.close()
+        pumps = [pump(process.stdout, stdout, on_line)]
+        if process.stderr is not None:
+            pumps.append(pump(process.stderr, stderr))
+        nb_bytes = await asyncio.gather(*pumps)
+        await process.wait()
+        return nb_bytes[0], sum(nb_bytes[1:])
+
+    timed_out = False
+    try:
+        stdout_bytes, stderr_bytes = await asyncio.wait_for(communicate(), timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+        stdout_bytes = stderr_bytes = 0
+        await stop_process(process)
+    except asyncio.CancelledError:
+        await stop_process(process)
+        raise
+
+    return ProcessResult(command, process.returncode, time.perf_counter() - start,
+                         stdout_bytes, stderr_bytes, timed_out)
+
+
+async def run_processes(commands: list, jobs: int = None) -> list:
+
+    """ this function runs several commands at the same time
+
+    :param commands: list, the keyword arguments of run_process for each command
+    :param jobs: int, the maximum number of commands running at the same time
+    (by default, the number of CPUs)
+
+    :return: list, the ProcessResult of each command, in the order of the commands
+    """
+
+    semaphore = asyncio.Semaphore(jobs or os.cpu_count() or 1)
+
+    async def run_limited(command_kwargs: dict) -> ProcessResult:
+        async with semaphore:
+            return await run_process(**command_kwargs)
+
+    return await asyncio.gather(*[run_limited(command_kwargs) for command_kwargs in commands])
+
+
+def supervise(coroutine):
+
+    """ this function runs a coroutine of this module in a new event loop, and stops
+    the remaining processes on interruption
+
+    :param coroutine: the coroutine, e.g. run_process(...) or run_processes(...)
+
+    :return: the result of the coroutine
+    """
+
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(coroutine)
+    try:
+        return loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        # the cancellation stops the child processes
+        task.cancel()
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        raise
+    finally:
+        loop.close()
@@ -1,11 +1,248 @@
 """CloudTiger functions for running Terraform actions."""
 import json
 import os
+import shlex
 
 from cloudtiger.cloudtiger import Operation
 from cloudtiger.common_tools import bash_action
-from cloudtiger.data import terraform_vm_resource_name
-from cloudtiger.specific.nutanix import get_vm_nutanix_uuid
+from cloudtiger.data import (
+    TF_APPROVAL_ACTIONS,
+    TF_PROVIDER_MIRROR_FOLDER,
+    terraform_vm_resource_name
+)
+from cloudtiger.output_store import get_output_store
+from cloudtiger.tf_fingerprint import (
+    applied_fingerprint,
+    forget_fingerprint,
+    record_fingerprint,
+    scope_fingerprint
+)
+from cloudtiger.tf_plan import TerraformPlanStream
+from cloudtiger.tf_plugins import (
+    log_provider_installs,
+    plugin_cache_lock,
+    provider_install_counter,
+    setup_terraform_plugins
+)
+
+# the 'import' blocks and the plan generated by the 'bulk_import' action, removed afterwards
+TF_IMPORT_FILE = "cloudtiger_imports.tf"
+TF_IMPORT_PLAN = "cloudtiger_imports.tfplan"
+
+# maximum length of the addresses passed to a single 'terraform state rm', far below the
+# command line limits of the shells
+TF_STATE_RM_MAX_LENGTH = 32768
+
+
+def vm_resource_address(operation: Operation, vm_name: str) -> str:
+
+    """ this function returns the address of the Terraform resource of a VM
+
+    :param operation: Operation, the current Operation
+    :param vm_name: str, the name of the VM in the config.yml
+
+    :return: str, the address, e.g. module.vm["<VM_NAME>"].vsphere_virtual_machine.virtual_machine
+    """
+
+    return format('module.vm["%s"].%s.virtual_machine'
+                  % (vm_name, terraform_vm_resource_name[operation.provider]))
+
+
+def list_state_resources(operation: Operation) -> list:
+
+    """ this function lists the addresses of the resources of the Terraform state
+
+    :param operation: Operation, the current Operation
+
+    :return: list, the addresses of the resources
+    """
+
+    resources = []
+    bash_action(operation.logger, "terraform state list", operation.scope_terraform_folder,
+                os.environ, check=True, on_line=resources.append)
+
+    return [resource for resource in resources if resource.strip() != ""]
+
+
+def tf_state_rm(operation: Operation, addresses: list):
+
+    """ this function removes resources from the Terraform state, with as few 'terraform state
+    rm' commands as the command line length allows, as each one locks and rewrites the state
+
+    :param operation: Operation, the current Operation
+    :param addresses: list, the addresses of the resources
+    """
+
+    if len(addresses) == 0:
+        operation.logger.info("No resource to remove from the tfstate")
+        return
+
+    options = ""
+    if operation.tf_dry_run:
+        options += " -dry-run"
+    if operation.tf_no_lock:
+        options += " -lock=false"
+
+    chunks = [[]]
+    chunk_length = 0
+    for address in addresses:
+        argument = shlex.quote(address)
+        if (chunk_length + len(argument) > TF_STATE_RM_MAX_LENGTH) & (len(chunks[-1]) > 0):
+            chunks.append([])
+            chunk_length = 0
+        chunks[-1].append(argument)
+        chunk_length += len(argument) + 1
+
+    operation.logger.info("%s %s resources from tfstate in %s command(s)"
+                          % ("Dry run : removing" if operation.tf_dry_run else "Removing",
+                             len(addresses), len(chunks)))
+    for chunk in chunks:
+        command = format("terraform state rm%s %s" % (options, " ".join(chunk)))
+        bash_action(operation.logger, command, operation.scope_terraform_folder,
+                    os.environ, operation.stdout_file, check=True)
+
+
+def vm_import_ids(operation: Operation, vms: list) -> list:
+
+    """ this function returns the ID of VMs for a Terraform import, according to the provider
+
+    :param operation: Operation, the current Operation
+    :param vms: list, the (name, configuration) of the VMs
+
+    :return: list, the (name, import ID) of the VMs
+    """
+
+    if operation.provider == "nutanix":
+        from cloudtiger.specific.nutanix import get_vm_nutanix_uuid
+        return [(vm_name, get_vm_nutanix_uuid(operation, vm_name)) for (vm_name, _) in vms]
+
+    if operation.provider == "vsphere":
+        return [
+            (vm_name, "/".join(["", vm["datacenter"],
+                                "vm",
+                                vm["extra_parameters"]["folder"],
+                                vm.get("vm_name", vm_name)]))
+            for (vm_name, vm) in vms]
+
+    return [(vm_name, vm_name) for (vm_name, _) in vms]
+
+
+def import_block(address: str, import_id: str) -> str:
+
+    """ this function returns a Terraform 'import' block
+
+    :param address: str, the address of the imported resource
+    :param import_id: str, the ID of the resource for the provider
+
+    :return: str, the 'import' block
+    """
+
+    # a JSON string is a valid HCL string, once the template sequences are escaped
+    hcl_id = json.dumps(import_id).replace("${", "$${").replace("%{", "%%{")
+
+    return format("import {\n  to = %s\n  id = %s\n}\n" % (address, hcl_id))
+
+
+def tf_bulk_import(operation: Operation):
+
+    """ this function imports all the VMs of the config.yml missing from the Terraform state,
+    with 'import' blocks (Terraform >= 1.5) planned and applied at once
+
+    :param operation: Operation, the current Operation
+    """
+
+    state_resources = set(list_state_resources(operation))
+
+    vms = []
+    for vm in operation.vm_registry:
+        if vm_resource_address(operation, vm.name) in state_resources:
+            operation.logger.info("VM %s is already in the tfstate" % vm.name)
+        else:
+            vms.append((vm.name, vm.config))
+
+    if len(vms) == 0:
+        operation.logger.info("No VM to import")
+        return
+
+    import_ids = vm_import_ids(operation, vms)
+    import_file = os.path.join(operation.scope_terraform_folder, TF_IMPORT_FILE)
+    with open(import_file, "w") as f:
+        f.write("\n".join(import_block(vm_resource_address(operation, vm_name), import_id)
+                          for (vm_name, import_id) in import_ids))
+    operation.logger.info("Importing %s VMs with %s" % (len(import_ids), import_file))
+
+    # only the imported VMs (and their dependencies) are planned
+    command = format("terraform plan -json -out=%s %s %s" % (
+        TF_IMPORT_PLAN,
+        " ".join(["--var-file=services/" + service + ".tfvars"
+                  for service in operation.used_services]),
+        " ".join(["-target='%s'" % vm_resource_address(operation, vm_name)
+                  for (vm_name, _) in import_ids])))
+    if operation.tf_no_lock:
+        command += " -lock=false"
+
+    plan_stream = TerraformPlanStream(
+        operation.logger, os.path.join(operation.scope_terraform_folder, "tf_nice_import.json"))
+    apply_stream = None
+    try:
+        try:
+            plan_result = bash_action(
+                operation.logger, command, operation.scope_terraform_folder, os.environ,
+                os.path.join(operation.scope_terraform_folder, "tf_import.json"),
+                single_output=True, on_line=plan_stream.on_line)
+        finally:
+            plan_stream.close()
+
+        if not plan_result.success:
+            err = "Failed to plan the import of the VMs"
+        elif len(plan_stream.resource_changes) > 0:
+            # an import only writes the state : the plan is not applied if it modifies
+            # any resource (e.g. a VM whose configuration differs from the config.yml)
+            for (action, address) in plan_stream.resource_changes:
+                operation.logger.error("The import would %s %s" % (action, address))
+            err = format("The import would modify %s resource(s), fix their configuration "
+                         "or import them with 'tf import'" % len(plan_stream.resource_changes))
+        else:
+            err = None
+            command = "terraform apply -json%s %s" % (
+                " -lock=false" if operation.tf_no_lock else "", TF_IMPORT_PLAN)
+            apply_stream = TerraformPlanStream(
+                operation.logger,
+                os.path.join(operation.scope_terraform_folder, "tf_nice_import_apply.json"))
+            try:
+                apply_result = bash_action(
+                    operation.logger, command, operation.scope_terraform_folder, os.environ,
+                    os.path.join(operation.scope_terraform_folder, "tf_import_apply.json"),
+                    single_output=True, on_line=apply_stream.on_line)
+            finally:
+                apply_stream.close()
+            if not apply_result.success:
+                err = "Failed to apply the import of the VMs"
+    finally:
+        for generated_file in [TF_IMPORT_FILE, TF_IMPORT_PLAN]:
+            if os.path.exists(os.path.join(operation.scope_terraform_folder, generated_file)):
+                os.remove(os.path.join(operation.scope_terraform_folder, generated_file))
+
+    # report of the import of each VM
+    failed_resources = dict(plan_stream.failed_resources)
+    if apply_stream is not None:
+        failed_resources.update(apply_stream.failed_resources)
+    nb_imported = 0
+    for (vm_name, import_id) in import_ids:
+        address = vm_resource_address(operation, vm_name)
+        if address in failed_resources:
+            operation.logger.error("Failed to import VM %s (%s) : %s"
+                                   % (vm_name, import_id, failed_resources[address]))
+        elif (address in plan_stream.imports) & (apply_stream is not None) & (err is None):
+            operation.logger.info("Imported VM %s (%s)" % (vm_name, import_id))
+            nb_imported += 1
+        else:
+            operation.logger.warning("VM %s (%s) was not imported" % (vm_name, import_id))
+    operation.logger.info("%s/%s VMs imported" % (nb_imported, len(import_ids)))
+
+    if err is not None:
+        operation.logger.error(err)
+        raise Exception(err)
 
 
 def tf_generic(operation: Operation, tf_action):
@@ -17,10 +254,34 @@ def tf_generic(operation: Operation, tf_action):
 
     operation.logger.info("Executing Terraform command %s", tf_action)
 
-    # if tf action is not output, import or rm, we need to provide the tfvars files
-    # as extra parameters
+    # the providers are shared by the scopes of the project
+    setup_terraform_plugins(operation)
+
+    # the plan and apply of a scope are skipped if its inputs are unchanged since
+    # its last successful apply
+    fingerprint = None
+    if tf_action in ["plan", "apply"]:
+        fingerprint = scope_fingerprint(operation)
+        if (not operation.tf_force) & (fingerprint == applied_fingerprint(operation)):
+            if not operation.tf_drift_check:
+                operation.logger.info("Scope %s unchanged since its last apply, skipping "
+                                      "'terraform %s' (use --force or --drift-check to run it)"
+                                      % (operation.scope, tf_action))
+                return
+            if tf_action == "apply":
+                operation.logger.info("Scope %s unchanged since its last apply, checking "
+                                      "drift with 'terraform plan'" % operation.scope)
+                tf_action = "plan"
+
+    # the state is modified outside of an apply : the next plan and apply are not skipped,
+    # even if the command fails after modifying the state
+    if (tf_action in ["destroy", "import", "bulk_import", "rm"]) & (not operation.tf_dry_run):
+        forget_fingerprint(operation)
+
+    # if tf action is not output, import, bulk_import, rm or mirror, we need to provide the
+    # tfvars files as extra parameters
     # to the terraform command
-    if tf_action not in ["output", "import", "rm"]:
+    if tf_action not in ["output", "import", "bulk_import", "rm", "mirror"]:
 
         command = format("terraform %s %s" % (tf_action, " ".join(
             ["--var-file=services/" + service + ".tfvars" for service in operation.used_services]
@@ -38,78 +299,76 @@ def tf_generic(operation: Operation, tf_action):
                               ))
             command += format(' -backend-config="schema_name=%s"' % operation.scope)
 
-        # if we are running a 'plan', we dump the output inside a dedicated json file
+        # if we are running a 'plan', we dump the output inside a dedicated json file,
+        # and process its events while the plan runs
         if tf_action == "plan":
             command += " -json"
+            # with --drift-check, 'terraform plan' exits with code 2 if the plan has changes
+            if operation.tf_drift_check:
+                command += " -detailed-exitcode"
             test_tf_plan_file = os.path.join(operation.scope_terraform_folder, "tf_plan.json")
-            if os.path.exists(test_tf_plan_file):
-                os.remove(test_tf_plan_file)
-            bash_action(operation.logger, command, operation.scope_terraform_folder,
-                        os.environ, test_tf_plan_file)
-            with open(test_tf_plan_file, "r") as f:
-                test_tf_plan = f.read().split("\n")
-            test_tf_plan = {
-                "line_" + str(i): json.loads(test_tf_plan[i])
-                for i in range(len(test_tf_plan)) if test_tf_plan[i] != ""
-            }
-            # test_tf_plan = load_json(operation.logger, test_tf_plan_file)
             nice_test_tf_plan_file = os.path.join(
                 operation.scope_terraform_folder, "tf_nice_plan.json")
-            with open(nice_test_tf_plan_file, "w") as f:
-                json.dump(test_tf_plan, f, indent=4)
+            plan_stream = TerraformPlanStream(operation.logger, nice_test_tf_plan_file)
+            try:
+                result = bash_action(operation.logger, command, operation.scope_terraform_folder,
+                                     os.environ, test_tf_plan_file, single_output=True,
+                                     check=not operation.tf_drift_check,
+                                     on_line=plan_stream.on_line)
+            finally:
+                plan_stream.close()
+            if operation.tf_drift_check and (result.returncode == 2) and not result.timed_out:
+                err = format("Drift detected on scope %s : the plan has changes, see %s"
+                             % (operation.scope, nice_test_tf_plan_file))
+                operation.logger.error(err)
+                raise Exception(err)
+            if result.timed_out or (result.returncode != 0):
+                err = format("Terraform plan failed on scope %s" % operation.scope)
+                operation.logger.error(err)
+                raise Exception(err)
+        elif tf_action == "init":
+            if operation.tf_no_lock:
+                command += " -lock=false"
+
+            # we count the providers found in the shared cache, filled by a single
+            # 'terraform init' at a time
+            on_line, counters = provider_install_counter(operation.logger,
+                                                         operation.stdout_file is None)
+            with plugin_cache_lock(operation):
+                bash_action(operation.logger, command, operation.scope_terraform_folder,
+                            os.environ, operation.stdout_file, check=True, on_line=on_line)
+            log_provider_installs(operation.logger, counters)
         else:
             if operation.tf_no_lock:
                 command += " -lock=false"
+            if (tf_action in TF_APPROVAL_ACTIONS) & operation.tf_auto_approve:
+                command += " -auto-approve -input=false"
 
             bash_action(operation.logger, command, operation.scope_terraform_folder,
-                        os.environ, operation.stdout_file)
+                        os.environ, operation.stdout_file, check=True)
 
     # 'import' is a non-terraform CLI, custom command, that remove all VMs of the
     # config.yml from the state if they are in the state, then reimport them.
     # It is useful for importing VMs created independently into Cloudtiger
     if tf_action == "import":
 
-        # listing existing vm in state
-        temp_vm_list_file = os.path.join(operation.scope_terraform_folder, "temp_vm_list_file.txt")
-        command = "terraform state list"
-        bash_action(operation.logger, command, operation.scope_terraform_folder,
-                    os.environ, output=temp_vm_list_file)
-
         # purging state from vms
-        with open(temp_vm_list_file, "r") as f:
-            res_list = f.read().split('\n')
-            for res in res_list:
-                mother_module = res.split('[')[0]
-                if (mother_module == "module.vm") & (len(res) > len(mother_module)):
-                    res = res.replace('"', '\\"')
-                    command = "terraform state rm " + res  # + ' -lock=false'
-                    operation.logger.info('Purging VM %s from tfstate' % res)
-                    bash_action(operation.logger, command, operation.scope_terraform_folder,
-                                os.environ, output=operation.stdout_file)
-
-        if os.path.exists(temp_vm_list_file):
-            os.remove(temp_vm_list_file)
+        purged_resources = []
+        for res in list_state_resources(operation):
+            mother_module = res.split('[')[0]
+            if (mother_module == "module.vm") & (len(res) > len(mother_module)):
+                operation.logger.info('Purging VM %s from tfstate' % res)
+                purged_resources.append(res)
+        tf_state_rm(operation, purged_resources)
 
         # importing vms into state
-        vms = [(vm_name, vm) for network_name, network_content
-               in operation.scope_config_dict["vm"].items()
-               for subnet_name, subnet_content in network_content.items()
-               for vm_name, vm in subnet_content.items()]
+        vms = [(vm.name, vm.config) for vm in operation.vm_registry]
 
         # get the detailed name of the vms for the import, according to the provider
-        vms_import_name = vms
-        if operation.provider == "nutanix":
-            vms_import_name = [(vm_name, get_vm_nutanix_uuid(operation, vm_name))
-                               for (vm_name, vm) in vms]
+        vms_import_name = vm_import_ids(operation, vms)
         if operation.provider == "vsphere":
-            vms_import_name = [
-                (vm_name, "/".join(["", vm["datacenter"],
-                                    "vm",
-                                    vm["extra_parameters"]["folder"].replace(" ", "\ "),
-                                    vm.get("vm_name", vm_name)]))
-                for (vm_name, vm) in vms]
-        if operation.provider not in ["nutanix", "vsphere"]:
-            vms_import_name = [(vm_name, vm_name) for (vm_name, _) in vms]
+            vms_import_name = [(vm_name, vm_import_name.replace(" ", "\\ "))
+                               for (vm_name, vm_import_name) in vms_import_name]
 
         # creating the list of import commands for all vms
         commands = [
@@ -123,28 +382,61 @@ def tf_generic(operation: Operation, tf_action):
             for (vm_name, vm_import_name) in vms_import_name
         ]
 
-        # importing vms
+        # importing vms : as they have been purged from the state, we try to import all of
+        # them before failing on the failed imports
+        nb_failed = 0
         for command in commands:
-            bash_action(operation.logger, command, operation.scope_terraform_folder,
-                        os.environ, operation.stdout_file)
+            if operation.tf_dry_run:
+                operation.logger.info("Dry run : %s" % command)
+                continue
+            result = bash_action(operation.logger, command, operation.scope_terraform_folder,
+                                 os.environ, operation.stdout_file)
+            if result.timed_out or (result.returncode != 0):
+                nb_failed += 1
+        if nb_failed > 0:
+            err = format("%s/%s VMs could not be imported on scope %s, see the errors above"
+                         % (nb_failed, len(commands), operation.scope))
+            operation.logger.error(err)
+            raise Exception(err)
 
-    if tf_action == "rm":
-        commands = [
-            format("terraform state rm module.vm[\\\"%s\\\"].%s.virtual_machine" %
-                   (vm_name, terraform_vm_resource_name[operation.provider]))
-            for (vm_name, vm_import_name) in vms_import_name
-        ]
+    # 'mirror' copies the providers of the scope into the filesystem mirror of the project,
+    # used by the next 'init' of all the scopes instead of the registries
+    if tf_action == "mirror":
+        command = format("terraform providers mirror %s" % shlex.quote(
+            os.path.join(os.path.abspath(operation.project_root), TF_PROVIDER_MIRROR_FOLDER)))
+        bash_action(operation.logger, command, operation.scope_terraform_folder,
+                    os.environ, operation.stdout_file, check=True)
 
-        for command in commands:
-            bash_action(operation.logger, command, operation.scope_terraform_folder,
-                        os.environ, operation.stdout_file)
+    # 'bulk_import' imports the VMs of the config.yml missing from the state with a single
+    # plan and apply of generated 'import' blocks
+    if tf_action == "bulk_import":
+        tf_bulk_import(operation)
+
+    # 'rm' removes the VMs of the config.yml from the state, without destroying them
+    if tf_action == "rm":
+        state_resources = set(list_state_resources(operation))
+        removed_resources = []
+        for vm in operation.vm_registry:
+            address = vm_resource_address(operation, vm.name)
+            if address in state_resources:
+                removed_resources.append(address)
+            else:
+                operation.logger.info("VM %s is not in the tfstate" % vm.name)
+        tf_state_rm(operation, removed_resources)
 
     # at the end of a terraform apply/refresh/output command, we execute a 'terraform output'
     if tf_action in ["apply", "refresh", "output"]:
         os.makedirs(operation.scope_inventory_folder, exist_ok=True)
         command = "terraform output -json"
         bash_action(operation.logger, command, operation.scope_terraform_folder, os.environ,
-                    operation.terraform_output, single_output=True)
+                    operation.terraform_output, single_output=True, check=True)
+
+        # the VMs of the output are stored in the project terraform output store
+        get_output_store(operation.logger, operation.project_root)\
+            .ingest(operation.scope, operation.terraform_output)
+
+    if tf_action == "apply":
+        record_fingerprint(operation, fingerprint)
 
     if tf_action == "destroy":
         if operation.provider == "vsphere":
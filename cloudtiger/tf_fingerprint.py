@@ -0,0 +1,147 @@
+"""Fingerprint of the Terraform inputs of a scope, to skip the scopes unchanged since their
+last successful apply."""
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import time
+
+from cloudtiger.cloudtiger import Operation
+from cloudtiger.common_tools import file_hash, write_if_changed
+from cloudtiger.data import TF_FINGERPRINT_FILE
+
+# the files of the scope Terraform folder read by Terraform
+TF_INPUT_PATTERNS = ["*.tf", "*.tfvars", "*.tfvars.json", ".terraform.lock.hcl",
+                     "services/*.tfvars"]
+
+# the local modules called by the Terraform files, e.g. source = "../../../terraform/..."
+LOCAL_MODULE_SOURCE = re.compile(r'^\s*source\s*=\s*"(\.\.?/[^"]*)"', re.MULTILINE)
+
+
+def input_files(folder: str) -> list:
+
+    """ this function lists the Terraform inputs of a scope : its Terraform and variable files,
+    and the files of the local modules they call (recursively)
+
+    :param folder: str, the Terraform folder of the scope
+
+    :return: list, the paths of the files
+    """
+
+    files = []
+    for root, dirs, filenames in os.walk(folder):
+        dirs[:] = [d for d in dirs if d != ".terraform"]
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            relative_path = os.path.relpath(path, folder).replace(os.path.sep, "/")
+            if any(fnmatch.fnmatch(relative_path, pattern) for pattern in TF_INPUT_PATTERNS):
+                files.append(path)
+
+    modules = set()
+    pending = [path for path in files if path.endswith(".tf")]
+    while len(pending) > 0:
+        tf_file = pending.pop()
+        with open(tf_file, "r") as f:
+            sources = LOCAL_MODULE_SOURCE.findall(f.read())
+        for source in sources:
+            module = os.path.normpath(os.path.join(os.path.dirname(tf_file), source))
+            if (module in modules) or (not os.path.isdir(module)):
+                continue
+            modules.add(module)
+            for root, dirs, filenames in os.walk(module):
+                dirs[:] = [d for d in dirs if d != ".terraform"]
+                for filename in filenames:
+                    files.append(os.path.join(root, filename))
+                    if filename.endswith(".tf"):
+                        pending.append(os.path.join(root, filename))
+
+    return sorted(set(files))
+
+
+def scope_fingerprint(operation: Operation) -> str:
+
+    """ this function returns the fingerprint of the Terraform inputs of a scope : its files,
+    the files of its local modules and the TF_VAR_* environment variables (credentials
+    loaded from the secrets)
+
+    :param operation: Operation, the current Operation
+
+    :return: str, the hexadecimal fingerprint
+    """
+
+    digest = hashlib.sha256()
+    folder = operation.scope_terraform_folder
+    for path in input_files(folder):
+        digest.update(os.path.relpath(path, folder).encode())
+        digest.update(b"\0")
+        digest.update(file_hash(path).encode())
+        digest.update(b"\n")
+
+    for name in sorted(os.environ):
+        if name.startswith("TF_VAR_"):
+            digest.update(name.encode())
+            digest.update(b"\0")
+            digest.update(os.environ[name].encode())
+            digest.update(b"\n")
+
+    return digest.hexdigest()
+
+
+def fingerprint_file(operation: Operation) -> str:
+
+    """ this function returns the path of the fingerprint file of a scope
+
+    :param operation: Operation, the current Operation
+
+    :return: str, the path of the file
+    """
+
+    return os.path.join(operation.scope_terraform_folder, TF_FINGERPRINT_FILE)
+
+
+def applied_fingerprint(operation: Operation) -> str:
+
+    """ this function returns the fingerprint of the inputs of the last successful apply of
+    a scope
+
+    :param operation: Operation, the current Operation
+
+    :return: str, the fingerprint (None if unknown)
+    """
+
+    if not os.path.isfile(fingerprint_file(operation)):
+        return None
+    try:
+        with open(fingerprint_file(operation), "r") as f:
+            return json.load(f).get("fingerprint")
+    except ValueError:
+        operation.logger.warning("Ignoring corrupted file %s" % fingerprint_file(operation))
+        return None
+
+
+def record_fingerprint(operation: Operation, fingerprint: str):
+
+    """ this function records the fingerprint of the inputs of a successful apply
+
+    :param operation: Operation, the current Operation
+    :param fingerprint: str, the fingerprint of the inputs
+    """
+
+    write_if_changed(operation.logger, fingerprint_file(operation), json.dumps({
+        "fingerprint": fingerprint,
+        "applied_at": time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    }, indent=4))
+
+
+def forget_fingerprint(operation: Operation):
+
+    """ this function removes the fingerprint of a scope, whose state has been changed
+    outside of an apply
+
+    :param operation: Operation, the current Operation
+    """
+
+    if os.path.exists(fingerprint_file(operation)):
+        operation.logger.debug("Removing %s" % fingerprint_file(operation))
+        os.remove(fingerprint_file(operation))
@@ -0,0 +1,180 @@
+"""Streaming processor of the events of 'terraform plan -json' and 'terraform apply -json'."""
+import json
+import re
+from logging import Logger
+
+# the counters of the change summary increased by each planned action
+PLAN_ACTION_COUNTERS = {
+    "create": ["add"],
+    "update": ["change"],
+    "delete": ["destroy"],
+    "replace": ["add", "destroy"]
+}
+
+# the planned actions leaving the existing resources untouched
+READ_ONLY_ACTIONS = ["noop", "read"]
+
+# the instance keys of a module address, e.g. '["vm_name"]' in 'module.vm["vm_name"]'
+MODULE_INSTANCE_KEY = re.compile(r'\[[^\]]*\]')
+
+ROOT_MODULE = "(root)"
+
+
+class TerraformPlanStream:
+    """
+    A class to process the events of 'terraform plan -json' (or 'terraform apply -json')
+    while the command runs : it displays the planned and applied changes, writes the events
+    into an indented JSON file and counts the changes per module, without keeping the events
+    in memory.
+
+    Attributes
+    ----------
+    logger: Logger
+        a Logger object to display the plan progress
+    nice_plan_file: str
+        the path of the indented JSON file of the events, as {"line_<N>": <EVENT>}
+    nice_plan: file
+        the indented JSON file, while the plan runs
+    nb_lines: int
+        the number of lines received
+    nb_events: int
+        the number of events written into the indented JSON file
+    module_changes: dict
+        the number of resources to add, change and destroy per module
+    summary: dict
+        the change summary of Terraform ('add', 'change', 'remove'), once received
+    errors: list
+        the summaries of the error diagnostics
+    imports: dict
+        the import ID of each resource planned for import, by resource address
+    failed_resources: dict
+        the error message of each resource that failed, by resource address
+    resource_changes: list
+        the (action, address) of the planned changes modifying a resource (i.e. not
+        a 'noop', an import or a data source 'read')
+
+    Methods
+    -------
+    on_line()
+        process a line of the output of the plan
+    close()
+        finish the indented JSON file and log the change summary
+    """
+
+    def __init__(self, logger: Logger, nice_plan_file: str):
+        self.logger = logger
+        self.nice_plan_file = nice_plan_file
+        self.nice_plan = open(nice_plan_file, "w")
+        self.nice_plan.write("{")
+        self.nb_lines = 0
+        self.nb_events = 0
+        self.module_changes = {}
+        self.summary = None
+        self.errors = []
+        self.imports = {}
+        self.failed_resources = {}
+        self.resource_changes = []
+
+    def on_line(self, line: str):
+
+        """ this function processes a line of the output of 'terraform plan/apply -json'
+
+        :param line: str, the line, without line ending
+        """
+
+        line_index = self.nb_lines
+        self.nb_lines += 1
+        if line == "":
+            return
+
+        try:
+            event = json.loads(line)
+        except ValueError:
+            # e.g. a crash of terraform before the JSON output starts
+            self.logger.warning(line)
+            return
+
+        # same content as json.dump of the whole plan with indent=4, written event by event
+        self.nice_plan.write("%s\n    \"line_%s\": %s" % (
+            "," if self.nb_events > 0 else "", line_index,
+            json.dumps(event, indent=4).replace("\n", "\n    ")))
+        self.nb_events += 1
+
+        event_type = event.get("type")
+        if event_type == "planned_change":
+            self.planned_change(event["change"])
+        elif event_type == "resource_drift":
+            self.logger.info("Drift : %s %s" % (event["change"]["resource"]["addr"],
+                                                event["change"]["action"]))
+        elif event_type == "change_summary":
+            self.summary = event["changes"]
+        elif event_type == "diagnostic":
+            diagnostic = event["diagnostic"]
+            if diagnostic.get("severity") == "error":
+                self.errors.append(diagnostic.get("summary", ""))
+                if "address" in diagnostic:
+                    self.failed_resources[diagnostic["address"]] = diagnostic.get("summary", "")
+                self.logger.error("%s : %s" % (diagnostic.get("summary", ""),
+                                               diagnostic.get("detail", "")))
+            else:
+                self.logger.warning("%s : %s" % (diagnostic.get("summary", ""),
+                                                 diagnostic.get("detail", "")))
+        elif event_type == "apply_complete":
+            self.logger.info("Applied : %s %s" % (event["hook"]["action"],
+                                                  event["hook"]["resource"]["addr"]))
+        elif event_type == "apply_errored":
+            self.failed_resources[event["hook"]["resource"]["addr"]] = event.get("@message", "")
+            self.logger.error(event.get("@message", ""))
+        elif event_type == "refresh_complete":
+            self.logger.debug(event.get("@message", ""))
+
+    def planned_change(self, change: dict):
+
+        """ this function displays a planned change and counts it for its module
+
+        :param change: dict, the 'change' entry of a 'planned_change' event
+        """
+
+        resource = change["resource"]
+        action = change["action"]
+        if (action != "noop") | ("importing" not in change):
+            self.logger.info("Plan : %s %s" % (action, resource["addr"]))
+
+        module = MODULE_INSTANCE_KEY.sub("", resource.get("module", "")) or ROOT_MODULE
+        counters = self.module_changes.setdefault(
+            module, {"add": 0, "change": 0, "destroy": 0, "import": 0})
+        for counter in PLAN_ACTION_COUNTERS.get(action, []):
+            counters[counter] += 1
+        if action not in READ_ONLY_ACTIONS:
+            self.resource_changes.append((action, resource["addr"]))
+
+        # since Terraform 1.5, the resources of 'import' blocks are flagged in their change
+        if "importing" in change:
+            self.imports[resource["addr"]] = change["importing"].get("id", "")
+            self.logger.info("Plan : import %s (%s)" % (resource["addr"],
+                                                        change["importing"].get("id", "")))
+            counters["import"] += 1
+
+    def close(self) -> dict:
+
+        """ this function finishes the indented JSON file, and logs the number of resources
+        to add, change and destroy per module
+
+        :return: dict, the number of resources to add, change and destroy per module
+        """
+
+        self.nice_plan.write("\n}" if self.nb_events > 0 else "}")
+        self.nice_plan.close()
+
+        for module, counters in sorted(self.module_changes.items()):
+            self.logger.info("%s : %s to add, %s to change, %s to destroy%s"
+                             % (module, counters["add"], counters["change"],
+                                counters["destroy"],
+                                ", %s to import" % counters["import"]
+                                if counters["import"] > 0 else ""))
+        if self.summary is not None:
+            self.logger.info("Plan : %s to add, %s to change, %s to destroy"
+                             % (self.summary.get("add", 0), self.summary.get("change", 0),
+                                self.summary.get("remove", 0)))
+
+        return self.module_changes
@@ -0,0 +1,220 @@
+"""Terraform providers shared by the scopes of a project : plugin cache and filesystem mirror."""
+import contextlib
+import fcntl
+import json
+import os
+import re
+from logging import Logger
+
+from cloudtiger.cloudtiger import Operation
+from cloudtiger.common_tools import file_hash, write_if_changed
+from cloudtiger.data import (
+    CACHE_FOLDER,
+    TF_CLI_CONFIG_FILE,
+    TF_PLUGIN_CACHE_FOLDER,
+    TF_PROVIDER_MIRROR_FOLDER
+)
+
+# the configuration of the Terraform CLI of the user, merged into the generated one
+USER_CLI_CONFIG_FILE = os.path.join("~", ".terraformrc")
+
+# a 'provider_installation' block, which a CLI configuration can only have once
+PROVIDER_INSTALLATION_BLOCK = re.compile(r"^\s*provider_installation\s*\{", re.MULTILINE)
+
+# the lock of the plugin cache, and the markers of the providers already in the cache
+PLUGIN_CACHE_LOCK = ".cloudtiger.lock"
+PLUGIN_CACHE_MARKER = ".cloudtiger_%s_%s"
+
+# the lines of 'terraform init' telling where each provider comes from
+PROVIDER_INSTALL_LINES = {
+    "cache": re.compile(r"^- Using .* from the shared cache directory"),
+    "installed": re.compile(r"^- Using previously-installed "),
+    "mirror_or_download": re.compile(r"^- Installed ")
+}
+
+
+def mirrored_providers(mirror_folder: str) -> list:
+
+    """ this function lists the providers of a filesystem mirror, stored as
+    <HOSTNAME>/<NAMESPACE>/<TYPE>/...
+
+    :param mirror_folder: str, the path of the mirror
+
+    :return: list, the sources of the providers, e.g. registry.terraform.io/hashicorp/aws
+    """
+
+    providers = []
+    for hostname in sorted(os.listdir(mirror_folder)):
+        hostname_folder = os.path.join(mirror_folder, hostname)
+        if not os.path.isdir(hostname_folder):
+            continue
+        for namespace in sorted(os.listdir(hostname_folder)):
+            namespace_folder = os.path.join(hostname_folder, namespace)
+            if not os.path.isdir(namespace_folder):
+                continue
+            for provider_type in sorted(os.listdir(namespace_folder)):
+                if os.path.isdir(os.path.join(namespace_folder, provider_type)):
+                    providers.append("/".join([hostname, namespace, provider_type]))
+
+    return providers
+
+
+def terraform_cli_config(mirror_folder: str, providers: list) -> str:
+
+    """ this function returns a Terraform CLI configuration installing the mirrored providers
+    from the mirror only (so that they never need the network), and the other ones from
+    their registry
+
+    :param mirror_folder: str, the path of the mirror
+    :param providers: list, the sources of the mirrored providers
+
+    :return: str, the content of the configuration
+    """
+
+    # JSON strings and lists are valid HCL values
+    return format("provider_installation {\n"
+                  "  filesystem_mirror {\n"
+                  "    path    = %s\n"
+                  "    include = %s\n"
+                  "  }\n"
+                  "  direct {\n"
+                  "    exclude = %s\n"
+                  "  }\n"
+                  "}\n" % (json.dumps(mirror_folder), json.dumps(providers),
+                           json.dumps(providers)))
+
+
+def setup_terraform_plugins(operation: Operation):
+
+    """ this function sets the environment of the Terraform commands, so that the providers
+    are downloaded once in the plugin cache of the project, and installed from the filesystem
+    mirror of the project if it exists. The values set by the user are kept
+
+    :param operation: Operation, the current Operation
+    """
+
+    project_root = os.path.abspath(operation.project_root)
+
+    if "TF_PLUGIN_CACHE_DIR" not in os.environ:
+        plugin_cache = os.path.join(project_root, CACHE_FOLDER, TF_PLUGIN_CACHE_FOLDER)
+        os.makedirs(plugin_cache, exist_ok=True)
+        os.environ["TF_PLUGIN_CACHE_DIR"] = plugin_cache
+        # otherwise, Terraform >= 1.4 only uses the cache for the providers already recorded
+        # in the lock file of the scope, i.e. never for a new scope
+        os.environ.setdefault("TF_PLUGIN_CACHE_MAY_BREAK_DEPENDENCY_LOCK_FILE", "true")
+    operation.logger.debug("Terraform plugin cache : %s" % os.environ["TF_PLUGIN_CACHE_DIR"])
+
+    cli_config_file = os.path.join(project_root, CACHE_FOLDER, TF_CLI_CONFIG_FILE)
+    if os.environ.get("TF_CLI_CONFIG_FILE", cli_config_file) != cli_config_file:
+        operation.logger.debug("Using the Terraform CLI configuration %s"
+                               % os.environ["TF_CLI_CONFIG_FILE"])
+        return
+
+    mirror_folder = os.path.join(project_root, TF_PROVIDER_MIRROR_FOLDER)
+    providers = mirrored_providers(mirror_folder) if os.path.isdir(mirror_folder) else []
+    if len(providers) == 0:
+        os.environ.pop("TF_CLI_CONFIG_FILE", None)
+        return
+
+    # the generated configuration replaces the one of the user : we keep its settings
+    # (credentials, etc), unless it already chooses how to install the providers
+    user_cli_config = ""
+    user_cli_config_file = os.path.expanduser(USER_CLI_CONFIG_FILE)
+    if os.path.isfile(user_cli_config_file):
+        with open(user_cli_config_file, "r") as f:
+            user_cli_config = f.read()
+        if PROVIDER_INSTALLATION_BLOCK.search(user_cli_config):
+            operation.logger.warning("The mirror %s is not used, as %s has its own "
+                                     "provider_installation" % (mirror_folder,
+                                                                user_cli_config_file))
+            os.environ.pop("TF_CLI_CONFIG_FILE", None)
+            return
+
+    cli_config = terraform_cli_config(mirror_folder, providers)
+    if user_cli_config.strip() != "":
+        cli_config = user_cli_config.rstrip("\n") + "\n\n" + cli_config
+
+    os.makedirs(os.path.dirname(cli_config_file), exist_ok=True)
+    # the configuration of the user may hold registry credentials
+    write_if_changed(operation.logger, cli_config_file, cli_config, mode=0o600)
+    os.environ["TF_CLI_CONFIG_FILE"] = cli_config_file
+    operation.logger.debug("Terraform providers mirrored in %s : %s"
+                           % (mirror_folder, ", ".join(providers)))
+
+
+@contextlib.contextmanager
+def plugin_cache_lock(operation: Operation):
+
+    """ this function returns a context in which a 'terraform init' can write into the
+    plugin cache, which does not support concurrent writes : the first 'terraform init'
+    of each provider (and version of the CloudTiger library) runs alone, the next ones
+    only read the cache and run concurrently
+
+    :param operation: Operation, the current Operation
+    """
+
+    plugin_cache = os.environ.get("TF_PLUGIN_CACHE_DIR")
+    provider_template = os.path.join(operation.libraries_path, "internal",
+                                     "terraform_providers", "provider.tf.j2")
+    if (plugin_cache is None) or (not os.path.isfile(provider_template)):
+        yield
+        return
+
+    # the versions of the providers are set by the provider.tf template of the library
+    marker = os.path.join(plugin_cache, PLUGIN_CACHE_MARKER
+                          % (operation.provider, file_hash(provider_template)[:16]))
+    if os.path.exists(marker):
+        yield
+        return
+
+    os.makedirs(plugin_cache, exist_ok=True)
+    with open(os.path.join(plugin_cache, PLUGIN_CACHE_LOCK), "w") as lock:
+        operation.logger.debug("Waiting for the lock of the plugin cache %s" % plugin_cache)
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.path.exists(marker):
+                # filled by another process while we were waiting
+                fcntl.flock(lock, fcntl.LOCK_UN)
+                yield
+                return
+            yield
+            with open(marker, "w"):
+                pass
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def provider_install_counter(logger: Logger, log_lines: bool):
+
+    """ this function returns a callback counting the origin of the providers in the output
+    of 'terraform init', and the counters it fills
+
+    :param logger: Logger, a Logger object to display the lines
+    :param log_lines: bool, set to True to display the lines (when there is no output file)
+
+    :return: (function, dict), the callback and the number of providers per origin
+    """
+
+    counters = {origin: 0 for origin in PROVIDER_INSTALL_LINES}
+
+    def on_line(line: str):
+        for origin, pattern in PROVIDER_INSTALL_LINES.items():
+            if pattern.match(line):
+                counters[origin] += 1
+        if log_lines:
+            logger.info(line, extra={"subprocess_stream": True})
+
+    return on_line, counters
+
+
+def log_provider_installs(logger: Logger, counters: dict):
+
+    """ this function logs the origin of the providers installed by 'terraform init'
+
+    :param logger: Logger, a Logger object to log details
+    :param counters: dict, the number of providers per origin
+    """
+
+    logger.info("Terraform providers : %s from the shared cache, %s already installed, "
+                "%s installed from the mirror or downloaded"
+                % (counters["cache"], counters["installed"], counters["mirror_or_download"]))
@@ -0,0 +1,211 @@
+"""Pre-flight validation of the config.yml of a scope."""
+import copy
+import ipaddress
+
+from cloudtiger.data import config_schemas, provider_required_network_keys
+
+# the validators already compiled by the current process, per provider
+COMPILED_VALIDATORS = {}
+
+TYPE_NAMES = {
+    str: "a string",
+    int: "an integer",
+    bool: "a boolean",
+    list: "a list",
+    dict: "a dictionary"
+}
+
+
+def type_name(expected_type) -> str:
+
+    """ this function returns a readable name for a type, or a tuple of types
+
+    :param expected_type: type or tuple, the expected type(s)
+
+    :return: str, the name of the type(s)
+    """
+
+    if isinstance(expected_type, tuple):
+        return " or ".join(type_name(single_type) for single_type in expected_type)
+
+    return TYPE_NAMES.get(expected_type, expected_type.__name__)
+
+
+def compile_schema(schema: dict):
+
+    """ this function compiles a schema (see config_schemas in data.py) into a function
+    checking a value against it
+
+    :param schema: dict, the schema
+
+    :return: function, called with the value, its path in the config.yml and the list
+    where errors are appended
+    """
+
+    expected_type = schema["type"]
+    expected_types = expected_type if isinstance(expected_type, tuple) else (expected_type,)
+    choices = schema.get("choices")
+    required = schema.get("required", [])
+    keys = {key: compile_schema(subschema) for key, subschema in schema.get("keys", {}).items()}
+    values = compile_schema(schema["values"]) if "values" in schema.keys() else None
+    items = compile_schema(schema["items"]) if "items" in schema.keys() else None
+
+    def check(value, path: str, errors: list):
+        # booleans are integers for python, not for a config.yml
+        if (not isinstance(value, expected_types)) | \
+                (isinstance(value, bool) & (bool not in expected_types)):
+            errors.append(format("%s should be %s, got %r" % (path, type_name(expected_type), value)))
+            return
+        if (choices is not None) and (value not in choices):
+            errors.append(format("%s should be one of %s, got %r" % (path, ", ".join(choices), value)))
+        if isinstance(value, dict):
+            for key in required:
+                if key not in value.keys():
+                    errors.append(format("%s is missing the mandatory key '%s'" % (path, key)))
+            for key, subvalue in value.items():
+                if (key in keys.keys()) & (subvalue is not None):
+                    keys[key](subvalue, path + "." + str(key), errors)
+                elif values is not None:
+                    if subvalue is None:
+                        errors.append(format("%s.%s should not be empty" % (path, key)))
+                    else:
+                        values(subvalue, path + "." + str(key), errors)
+        if isinstance(value, list) & (items is not None):
+            for index, item in enumerate(value):
+                items(item, "%s[%s]" % (path, index), errors)
+
+    return check
+
+
+def get_config_validator(provider: str):
+
+    """ this function returns the compiled validator of the config.yml of a provider,
+    compiled once per process
+
+    :param provider: str, the provider of the scope
+
+    :return: function, checking a config.yml, see compile_schema
+    """
+
+    if provider not in COMPILED_VALIDATORS.keys():
+        schema = {"type": dict, "keys": dict(config_schemas["global"])}
+        for service, service_schema in config_schemas.items():
+            if service != "global":
+                schema["keys"][service] = service_schema
+
+        required_network_keys = provider_required_network_keys.get(provider)
+        if required_network_keys is not None:
+            network_schema = copy.deepcopy(config_schemas["network"])
+            network_schema["values"]["required"] += required_network_keys["network"]
+            network_schema["values"]["keys"]["subnets"]["values"]["required"] = \
+                list(required_network_keys["subnet"])
+            schema["keys"]["network"] = network_schema
+
+        COMPILED_VALIDATORS[provider] = compile_schema(schema)
+
+    return COMPILED_VALIDATORS[provider]
+
+
+def check_consistency(config: dict, errors: list, warnings: list):
+
+    """ this function cross-checks the entries of a config.yml : subnets of VMs and
+    Kubernetes clusters against networks, IPs against CIDR blocks, and SSH bastions
+    when using a proxy
+
+    :param config: dict, the content of the config.yml
+    :param errors: list, the list where errors are appended
+    :param warnings: list, the list where warnings are appended
+    """
+
+    networks = config.get("network", {}) or {}
+    vms = config.get("vm", {}) or {}
+
+    for network_name, network in networks.items():
+        for subnet_name, subnet in (network.get("subnets", {}) or {}).items():
+            subnet = subnet or {}
+            path = format("network.%s.subnets.%s" % (network_name, subnet_name))
+            if "cidr_block" in subnet.keys():
+                try:
+                    ipaddress.ip_network(subnet["cidr_block"], strict=False)
+                except ValueError as e:
+                    errors.append(format("%s.cidr_block is not a valid CIDR block : %s"
+                                         % (path, e)))
+            elif subnet.get("managed_ips", False):
+                errors.append(format("%s needs a cidr_block to find IPs for its VMs" % path))
+
+    for network_name, network_subnets in vms.items():
+        if network_name not in networks.keys():
+            # the network may be defined by another scope of the same provider
+            warnings.append(format("vm.%s : network %s is not defined in this scope"
+                                   % (network_name, network_name)))
+            continue
+        network = networks[network_name]
+        subnets = network.get("subnets", {}) or {}
+
+        for subnet_name, subnet_vms in network_subnets.items():
+            if subnet_name not in subnets.keys():
+                errors.append(format("vm.%s.%s : subnet %s is not defined in network %s"
+                                     % (network_name, subnet_name, subnet_name, network_name)))
+                continue
+            cidr_block = (subnets[subnet_name] or {}).get("cidr_block")
+            try:
+                subnet_network = ipaddress.ip_network(cidr_block, strict=False) \
+                    if cidr_block is not None else None
+            except ValueError:
+                subnet_network = None
+
+            for vm_name, vm in subnet_vms.items():
+                private_ip = vm.get("private_ip")
+                if (private_ip is None) | (subnet_network is None):
+                    continue
+                path = format("vm.%s.%s.%s.private_ip" % (network_name, subnet_name, vm_name))
+                try:
+                    if ipaddress.ip_address(private_ip) not in subnet_network:
+                        errors.append(format("%s : %s is not in the CIDR block %s of subnet %s"
+                                             % (path, private_ip, cidr_block, subnet_name)))
+                except ValueError as e:
+                    errors.append(format("%s is not a valid IP address : %s" % (path, e)))
+
+        # private VMs are reached through a bastion of the 'escape public subnet'
+        if config.get("use_proxy", False):
+            escape_public_subnet = network.get("private_subnets_escape_public_subnet")
+            if escape_public_subnet is None:
+                errors.append(format("network.%s needs a private_subnets_escape_public_subnet "
+                                     "when use_proxy is set" % network_name))
+            elif not any((vm or {}).get("group", "") == "bastion" for vm in
+                         (network_subnets.get(escape_public_subnet, {}) or {}).values()):
+                errors.append(format("vm.%s.%s : use_proxy is set, but there is no VM with "
+                                     "group 'bastion' in the escape public subnet"
+                                     % (network_name, escape_public_subnet)))
+
+    for cluster_name, cluster in (config.get("kubernetes", {}) or {}).items():
+        network_name = (cluster or {}).get("network")
+        if (network_name is None) or (network_name not in networks.keys()):
+            continue
+        subnets = networks[network_name].get("subnets", {}) or {}
+        for subnet_name in cluster.get("subnetworks", []) or []:
+            if subnet_name not in subnets.keys():
+                errors.append(format("kubernetes.%s : subnet %s is not defined in network %s"
+                                     % (cluster_name, subnet_name, network_name)))
+
+
+def validate_config(config: dict) -> tuple:
+
+    """ this function validates the content of a config.yml against the schema of its
+    provider, and cross-checks its entries
+
+    :param config: dict, the content of the config.yml
+
+    :return: (list, list), the errors and the warnings
+    """
+
+    errors = []
+    warnings = []
+    provider = config.get("provider", "admin")
+    get_config_validator(provider if isinstance(provider, str) else "admin")(config, "config", errors)
+
+    # the cross-checks assume a well-typed configuration
+    if len(errors) == 0:
+        check_consistency(config, errors, warnings)
+
+    return errors, warnings
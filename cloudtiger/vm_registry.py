@@ -0,0 +1,217 @@
+"""Indexed registry of the VMs of a CloudTiger scope."""
+import fnmatch
+import re
+
+# prefix of the VM patterns interpreted as regular expressions
+REGEX_PATTERN_PREFIX = "re:"
+
+# characters making a VM pattern a glob
+GLOB_CHARACTERS = set("*?[")
+
+
+class VMRecord:
+    """
+    A class to store a VM of a scope and its SSH parameters. The attributes are
+    read by the ssh.cfg templates (as the entries of 'vm_ssh_params').
+
+    Attributes
+    ----------
+    name: str
+        the name of the VM (as defined in the config.yml)
+    network: str
+        the network of the VM
+    subnet: str
+        the subnet of the VM
+    group: str
+        the group of the VM, as set in the config.yml (may be a comma-separated list)
+    groups: list
+        the list of groups of the VM
+    config: dict
+        the parameters of the VM in the config.yml
+    address: str
+        the address of the VM, as set in config_ips.yml or all_addresses_info.yml (may
+        end with ':<SSH_PORT>')
+    private_ip: str
+        the private IP address of the VM
+    os_user: str
+        the OS username, used for the initial SSH connection
+    standard_user: str
+        the username used for SSH connections once the VM is configured
+    ssh_port: str
+        the SSH port of the VM
+    ansible_python_interpreter: str
+        the python interpreter used by Ansible on the VM
+    env: str
+        the environment of the VM (consolidated mode only)
+    owner: str
+        the owner of the VM (consolidated mode only)
+    bastion_address: str
+        the public address of the SSH bastion of the VM (proxy mode only)
+    bastion_name: str
+        the name of the SSH bastion of the VM (proxy mode only)
+    """
+
+    __slots__ = ("name", "network", "subnet", "group", "groups", "config", "address",
+                 "private_ip", "os_user", "standard_user", "ssh_port",
+                 "ansible_python_interpreter", "env", "owner", "bastion_address",
+                 "bastion_name")
+
+    def __init__(self, name: str, network: str, subnet: str, config: dict = None,
+                 group: str = "ungrouped", address: str = None, env: str = None,
+                 owner: str = None):
+        self.name = name
+        self.network = network
+        self.subnet = subnet
+        self.config = config if config is not None else {}
+        self.group = group
+        self.groups = group.split(",")
+        self.address = address
+        self.private_ip = address.split(':')[0] if address is not None else None
+        self.os_user = None
+        self.standard_user = None
+        self.ssh_port = None
+        self.ansible_python_interpreter = None
+        self.env = env
+        self.owner = owner
+        self.bastion_address = None
+        self.bastion_name = None
+
+
+class VMRegistry:
+    """
+    A class to index the VMs of a scope by name, group, subnet, network, environment
+    and owner, so that consumers do not walk the nested 'vm' dictionary of the config.yml.
+
+    Attributes
+    ----------
+    records: dict
+        the VMRecord of each VM name
+    by_group: dict
+        the list of VMRecord of each group
+    by_subnet: dict
+        the list of VMRecord of each subnet name
+    by_network: dict
+        the list of VMRecord of each network name
+    by_env: dict
+        the list of VMRecord of each environment
+    by_owner: dict
+        the list of VMRecord of each owner
+
+    Methods
+    -------
+    add()
+        add a VM to the registry
+    get()
+        return the VMRecord of a VM name
+    match()
+        return the names of the VMs matching a pattern
+    restrict()
+        return a registry restricted to some VMs
+    from_config()
+        build the registry of the 'vm' dictionary of a config.yml
+    """
+
+    def __init__(self, records=()):
+        self.records = {}
+        self.by_group = {}
+        self.by_subnet = {}
+        self.by_network = {}
+        self.by_env = {}
+        self.by_owner = {}
+        for record in records:
+            self.add(record)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records.values())
+
+    def __contains__(self, vm_name: str) -> bool:
+        return vm_name in self.records
+
+    def add(self, record: VMRecord):
+
+        """ this function adds a VM to the registry and its indexes
+
+        :param record: VMRecord, the VM to add
+        """
+
+        self.records[record.name] = record
+        for group in record.groups:
+            self.by_group.setdefault(group, []).append(record)
+        self.by_subnet.setdefault(record.subnet, []).append(record)
+        self.by_network.setdefault(record.network, []).append(record)
+        if record.env is not None:
+            self.by_env.setdefault(record.env, []).append(record)
+        if record.owner is not None:
+            self.by_owner.setdefault(record.owner, []).append(record)
+
+    def get(self, vm_name: str) -> VMRecord:
+
+        """ this function returns the VMRecord of a VM name
+
+        :param vm_name: str, the name of the VM
+
+        :return: VMRecord, the record of the VM, None if the VM is unknown
+        """
+
+        return self.records.get(vm_name)
+
+    def match(self, pattern: str) -> set:
+
+        """ this function returns the names of the VMs matching a pattern, which can be :
+        - the name of a VM, a group or a subnet
+        - a glob on the names of the VMs, e.g. 'web-*'
+        - a regular expression on the names of the VMs, prefixed by 're:', e.g. 're:web-[0-9]+'
+
+        :param pattern: str, the pattern
+
+        :return: set, the names of the matching VMs
+        """
+
+        if pattern.startswith(REGEX_PATTERN_PREFIX):
+            regex = re.compile(pattern[len(REGEX_PATTERN_PREFIX):])
+            return {vm_name for vm_name in self.records if regex.fullmatch(vm_name)}
+
+        if not GLOB_CHARACTERS.isdisjoint(pattern):
+            return set(fnmatch.filter(self.records, pattern))
+
+        vm_names = {vm.name for vm in self.by_group.get(pattern, [])}
+        vm_names.update(vm.name for vm in self.by_subnet.get(pattern, []))
+        if pattern in self.records:
+            vm_names.add(pattern)
+
+        return vm_names
+
+    def restrict(self, vm_names: set) -> "VMRegistry":
+
+        """ this function returns a view of the registry containing only some VMs, in
+        the order of the registry. The records are shared, not copied
+
+        :param vm_names: set, the names of the VMs to keep
+
+        :return: VMRegistry, the restricted registry
+        """
+
+        return VMRegistry(vm for vm_name, vm in self.records.items() if vm_name in vm_names)
+
+    @classmethod
+    def from_config(cls, vm_config: dict) -> "VMRegistry":
+
+        """ this function builds the registry of the 'vm' dictionary of a config.yml,
+        i.e. <NETWORK>: <SUBNET>: <VM_NAME>: <VM_PARAMETERS>
+
+        :param vm_config: dict, the 'vm' dictionary of the config.yml
+
+        :return: VMRegistry, the registry of the VMs
+        """
+
+        return cls(
+            VMRecord(vm_name, network_name, subnet_name, vm,
+                     group=vm.get("group", "ungrouped"),
+                     address=vm.get("private_ip"))
+            for network_name, network_subnets in (vm_config or {}).items()
+            for subnet_name, subnet_vms in (network_subnets or {}).items()
+            for vm_name, vm in (subnet_vms or {}).items()
+        )
@@ -13,7 +13,7 @@ with open('HISTORY.rst') as history_file:
 requirements = [
     'Click>=7.0', 'python-dotenv>=0.14.0', 'pyyaml', 'jinja2',
     'ansible', 'pykeepass', 'Paramiko', 'xmltodict', 'pycryptodome',
-    'requests', 'passlib', 'netaddr'
+    'requests', 'passlib', 'netaddr', 'cryptography'
 ]
 
 test_requirements = []
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+"""Performance tests for `cloudtiger` package."""
+
+import logging
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+PACKAGE_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# modules that should only be imported by the subcommands needing them
+HEAVY_MODULES = ["ansible", "netaddr", "requests", "pkg_resources", "jinja2", "cryptography"]
+
+# maximum extra time (in seconds) the import of the CLI may take on top of
+# its mandatory dependencies (click, pyyaml)
+IMPORT_TIME_BUDGET = float(os.environ.get("CLOUDTIGER_IMPORT_TIME_BUDGET", "0.15"))
+
+# the timing benchmarks depend on the load of the machine, they only run when this
+# environment variable is set
+RUN_BENCHMARKS = os.environ.get("CLOUDTIGER_BENCHMARKS", "") not in ["", "0"]
+
+# number of scopes rendered by the rendering benchmark
+RENDERED_SCOPES = 20
+
+# the timings are logged (shown by pytest for failed tests), the test suite does not print
+logger = logging.getLogger(__name__)
+
+
+def cold_import_time(statement, repeat=5):
+
+    """ this function returns the best wall-clock time of a python interpreter
+    executing 'statement' """
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], cwd=PACKAGE_ROOT, check=True)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+class TestStartup(unittest.TestCase):
+    """Tests for the startup time of the CLI."""
+
+    def test_no_heavy_import(self):
+        """Test that importing the CLI does not import heavy dependencies"""
+        statement = format("import sys, cloudtiger.cli; print(','.join(m for m in %s "
+                           "if m in sys.modules))" % HEAVY_MODULES)
+        result = subprocess.run([sys.executable, "-c", statement], cwd=PACKAGE_ROOT,
+                                check=True, capture_output=True, text=True)
+        assert result.stdout.strip() == "", result.stdout
+
+    @unittest.skipUnless(RUN_BENCHMARKS, "set CLOUDTIGER_BENCHMARKS=1 to run the benchmarks")
+    def test_import_time(self):
+        """Test that the cold start of the CLI stays within budget"""
+        reference = cold_import_time("import click, yaml")
+        cli = cold_import_time("import cloudtiger.cli")
+        timing = format("CLI import time : %.3fs (reference %.3fs)" % (cli, reference))
+        logger.info(timing)
+        assert cli - reference < IMPORT_TIME_BUDGET, timing
+
+
+def count_compilations(environment):
+
+    """ this function makes a jinja environment record the names of the templates it
+    compiles, and returns the list of names """
+
+    compiled = []
+    compile_source = environment.compile
+
+    def compile_and_record(source, name=None, filename=None, *args, **kwargs):
+        compiled.append(name)
+        return compile_source(source, name, filename, *args, **kwargs)
+
+    environment.compile = compile_and_record
+
+    return compiled
+
+
+class TestRendering(unittest.TestCase):
+    """Tests for the rendering of the Terraform templates of a scope."""
+
+    def setUp(self):
+        import yaml
+        from cloudtiger.cloudtiger import LIBRARIES_PATH
+
+        self.templates_folder = os.path.join(LIBRARIES_PATH, "internal")
+        config_file = os.path.join(PACKAGE_ROOT, "tests", "gitops", "config", "aws",
+                                   "single_scope", "config.yml")
+        with open(config_file, "r") as f:
+            self.scope_config = yaml.safe_load(f)
+        self.scope_config["scope"] = "aws/single_scope"
+
+    def test_templates_compiled_once(self):
+        """Test that the shared jinja environment compiles each template at most once, and
+        that the other processes load it from the bytecode cache"""
+        from jinja2 import Environment
+        from cloudtiger.common_tools import get_jinja_environment
+
+        environment = get_jinja_environment(self.templates_folder)
+        assert get_jinja_environment(self.templates_folder) is environment
+        template_names = [name for name in environment.list_templates(extensions=["j2"])
+                          if name.startswith("terraform_providers/")]
+        assert len(template_names) > 0
+
+        compiled = count_compilations(environment)
+        try:
+            for _ in range(RENDERED_SCOPES):
+                for template_name in template_names:
+                    environment.get_template(template_name).render(self.scope_config,
+                                                                   env=os.environ)
+        finally:
+            del environment.compile
+        assert len(compiled) == len(set(compiled)), compiled
+
+        # a new process has its own environment, sharing the bytecode cache
+        other_environment = Environment(loader=environment.loader,
+                                        bytecode_cache=environment.bytecode_cache)
+        compiled = count_compilations(other_environment)
+        for template_name in template_names:
+            other_environment.get_template(template_name).render(self.scope_config,
+                                                                 env=os.environ)
+        assert compiled == [], compiled
+
+    @unittest.skipUnless(RUN_BENCHMARKS, "set CLOUDTIGER_BENCHMARKS=1 to run the benchmarks")
+    def test_scope_render_time(self):
+        """Test that the shared jinja environment renders a scope faster than fresh templates"""
+        from jinja2 import Template
+        from cloudtiger.common_tools import get_jinja_environment
+
+        environment = get_jinja_environment(self.templates_folder)
+        template_names = [name for name in environment.list_templates(extensions=["j2"])
+                          if name.startswith("terraform_providers/")]
+
+        start = time.perf_counter()
+        for _ in range(RENDERED_SCOPES):
+            for template_name in template_names:
+                with open(os.path.join(self.templates_folder, template_name), "r") as f:
+                    Template(f.read()).render(self.scope_config, env=os.environ)
+        fresh = (time.perf_counter() - start) / RENDERED_SCOPES
+
+        start = time.perf_counter()
+        for _ in range(RENDERED_SCOPES):
+            for template_name in template_names:
+                environment.get_template(template_name).render(self.scope_config,
+                                                               env=os.environ)
+        shared = (time.perf_counter() - start) / RENDERED_SCOPES
+
+        timing = format("Scope render time : %.4fs (fresh templates %.4fs)" % (shared, fresh))
+        logger.info(timing)
+        assert shared < fresh, timing
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""Tests for the dotenv parser of `cloudtiger`, checked against bash."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cloudtiger.common_tools import parse_dotenv, source_dotenv
+
+# dotenv lines parsed in-process, and the value bash gives to their variable
+DOTENV_LINES = {
+    "export PLAIN=value": "value",
+    "export   SPACED=value": "value",
+    "export EMPTY=": "",
+    "export HASH=abc#def": "abc#def",
+    "export HASH_END=abc#": "abc#",
+    "export COMMENT=abc # comment": "abc",
+    "export HASH_START=#abc": "#abc",
+    "export TAB_COMMENT=abc\t#comment": "abc",
+    "export DOUBLE=\"two words # not a comment\"": "two words # not a comment",
+    "export SINGLE='$NOT_EXPANDED #x'": "$NOT_EXPANDED #x",
+    "export ESCAPED_QUOTE=\"say \\\"hi\\\"\"": "say \"hi\"",
+    "export ESCAPED_HASH=abc\\ #def": "abc #def",
+    "export MIXED=\"a b\"'c d'e#f": "a bc de#f",
+    "export QUOTED_HASH=\"abc\"#def": "abc#def",
+    "export QUOTED_COMMENT=\"abc\" #def": "abc",
+    "export PASSWORD=p@ss#w0rd!": "p@ss#w0rd!",
+}
+
+# dotenv lines without 'export' : their variable is only loaded if it was exported before
+NOT_EXPORTED_LINES = [
+    "NOT_EXPORTED=value",
+    "export REASSIGNED=first",
+    "REASSIGNED=second",
+]
+NOT_EXPORTED_VARIABLES = {"REASSIGNED": "second"}
+
+# dotenv lines that need a real shell
+SHELL_LINES = [
+    "EXPANDED=$HOME",
+    "SUBSTITUTED=`date`",
+    "MULTI_WORD=two words",
+    "export MULTI_EXPORT=one two",
+    "UNCLOSED=\"abc",
+]
+
+
+@unittest.skipIf(shutil.which("bash") is None, "bash is not installed")
+class TestParseDotenv(unittest.TestCase):
+    """Tests for parse_dotenv, compared with source_dotenv (the fallback sourcing the file
+    with bash)."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write_dotenv(self, lines):
+        envfile = os.path.join(self.folder, "test.env")
+        with open(envfile, "w") as f:
+            f.write("# header comment\n\n" + "\n".join(lines) + "\n")
+        return envfile
+
+    def test_same_values_as_bash(self):
+        """Test that the values parsed in-process are the values given by bash"""
+        envfile = self.write_dotenv(list(DOTENV_LINES.keys()))
+        variables = parse_dotenv(envfile)
+        assert variables is not None
+        bash_variables = source_dotenv(envfile)
+        for line, value in DOTENV_LINES.items():
+            key = line.split("=", 1)[0].split()[-1]
+            assert variables[key] == value, (line, variables[key])
+            assert bash_variables[key] == value, (line, bash_variables[key])
+        assert variables == bash_variables
+
+    def test_not_exported(self):
+        """Test that the variables that are not exported are not loaded, as by bash"""
+        envfile = self.write_dotenv(NOT_EXPORTED_LINES)
+        assert parse_dotenv(envfile) == NOT_EXPORTED_VARIABLES
+        assert source_dotenv(envfile) == NOT_EXPORTED_VARIABLES
+
+    def test_shell_lines(self):
+        """Test that the lines needing a shell are left to bash"""
+        for line in SHELL_LINES:
+            assert parse_dotenv(self.write_dotenv(["export PLAIN=value", line])) is None, line
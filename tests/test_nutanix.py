@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+"""Tests for the Nutanix client of `cloudtiger`, against a local stand-in of the v3 API."""
+
+import base64
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cloudtiger.specific.nutanix import NutanixClient
+
+# number of VMs of the stand-in
+NB_VMS = 1234
+
+STUB_USER = "admin"
+STUB_PASSWORD = "secret"
+
+
+class NutanixStubHandler(BaseHTTPRequestHandler):
+    """A stand-in of the 'vms/list' call of the Nutanix v3 API."""
+
+    def do_POST(self):
+        expected_auth = "Basic " + base64.b64encode(
+            (STUB_USER + ":" + STUB_PASSWORD).encode()).decode()
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.queries.append(payload)
+
+        if self.headers.get("Authorization") != expected_auth:
+            self.send_response(401)
+            self.end_headers()
+            return
+        if self.path != "/api/nutanix/v3/vms/list":
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        offset, length = payload["offset"], payload["length"]
+        entities = [{"spec": {"name": "vm-%s" % i}, "metadata": {"uuid": "uuid-%s" % i}}
+                    for i in range(offset, min(offset + length, NB_VMS))]
+        body = json.dumps({"metadata": {"total_matches": NB_VMS, "offset": offset,
+                                        "length": len(entities)},
+                           "entities": entities}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestNutanixClient(unittest.TestCase):
+    """Tests for the Nutanix client."""
+
+    def setUp(self):
+        """Start the stand-in of the Nutanix API."""
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), NutanixStubHandler)
+        self.server.queries = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = "http://127.0.0.1:%s/api/nutanix/v3" % self.server.server_port
+        self.cache_folder = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.cache_folder, "nutanix_vms.json")
+        self.logger = logging.getLogger("test_nutanix")
+
+    def tearDown(self):
+        """Stop the stand-in of the Nutanix API."""
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_folder)
+
+    def client(self, password=STUB_PASSWORD):
+        return NutanixClient(self.logger, self.base_url, STUB_USER, password, page_length=100,
+                             jobs=4, cache_file=self.cache_file)
+
+    def test_list_all_pages(self):
+        """Test that all the VMs are listed, one query per page"""
+        vm_uuids = self.client().get_vm_uuids()
+        assert len(vm_uuids) == NB_VMS
+        assert vm_uuids["vm-1233"] == "uuid-1233"
+        assert sorted(query["offset"] for query in self.server.queries) == \
+            list(range(0, NB_VMS, 100))
+
+    def test_cache(self):
+        """Test that the UUIDs are read from the cache file until it expires"""
+        assert self.client().get_vm_uuid("vm-42") == "uuid-42"
+        nb_queries = len(self.server.queries)
+
+        assert self.client().get_vm_uuid("vm-43") == "uuid-43"
+        assert len(self.server.queries) == nb_queries
+
+        expired = time.time() - 2 * self.client().cache_ttl
+        os.utime(self.cache_file, (expired, expired))
+        assert self.client().get_vm_uuid("vm-44") == "uuid-44"
+        assert len(self.server.queries) == 2 * nb_queries
+
+    def test_unknown_vm(self):
+        """Test that an unknown VM is searched again, then fails"""
+        client = self.client()
+        client.get_vm_uuids()
+        with self.assertRaises(Exception):
+            client.get_vm_uuid("missing-vm")
+
+    def test_authentication_failure(self):
+        """Test that an API error is raised"""
+        with self.assertRaises(Exception):
+            self.client(password="wrong").get_vm_uuids()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""Tests for the dependencies between the scopes of a run of `cloudtiger`."""
+
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import click
+
+from cloudtiger.cli import check_approval
+from cloudtiger.scheduler import build_dependencies, run_operations, sort_operations
+
+
+def read_input(operation, inputs_folder):
+    """Worker reading its input, as a command waiting for an approval does"""
+    python_input = sys.stdin.read()
+    command_input = subprocess.run(["cat"], check=True, capture_output=True, text=True,
+                                   timeout=10).stdout
+    with open(os.path.join(inputs_folder, operation.scope), "w") as f:
+        f.write(repr((python_input, command_input)))
+
+
+class TestBuildDependencies(unittest.TestCase):
+    """Tests for build_dependencies."""
+
+    def operations(self, scopes):
+        return [SimpleNamespace(scope=scope, provider="aws", scope_config_dict={},
+                                project_root="/nonexistent") for scope in scopes]
+
+    def test_meta_scope_is_parent(self):
+        """Test that only the <datacenter>/_meta scope is a parent of the datacenter scopes"""
+        operations = self.operations(["dc/_meta", "dc/app", "dc/app_meta", "dc/db_meta",
+                                      "other/app"])
+        dependencies = build_dependencies(logging.getLogger("test_scheduler"), operations)
+        assert dependencies == {
+            "dc/_meta": set(),
+            "dc/app": {"dc/_meta"},
+            "dc/app_meta": {"dc/_meta"},
+            "dc/db_meta": {"dc/_meta"},
+            "other/app": set()
+        }, dependencies
+        assert sort_operations(operations, dependencies)[0].scope == "dc/_meta"
+
+    def test_meta_scopes_without_meta(self):
+        """Test that scopes named *_meta do not depend on each other"""
+        operations = self.operations(["dc/app_meta", "dc/db_meta"])
+        dependencies = build_dependencies(logging.getLogger("test_scheduler"), operations)
+        assert dependencies == {"dc/app_meta": set(), "dc/db_meta": set()}, dependencies
+        assert len(sort_operations(operations, dependencies)) == 2
+
+
+class TestParallelInput(unittest.TestCase):
+    """Tests for the input of the scopes run in parallel."""
+
+    def setUp(self):
+        self.project_root = tempfile.mkdtemp()
+        self.inputs_folder = os.path.join(self.project_root, "inputs")
+        os.makedirs(self.inputs_folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.project_root)
+
+    def test_empty_input(self):
+        """Test that the workers of a parallel run read an empty input instead of waiting"""
+        operations = [SimpleNamespace(scope=scope, project_root=self.project_root)
+                      for scope in ["scope_1", "scope_2", "scope_3"]]
+        # the input of the run is a pipe that stays open, as a terminal nobody types in
+        saved_stdin = os.dup(0)
+        read_end, write_end = os.pipe()
+        os.dup2(read_end, 0)
+        try:
+            failures = run_operations(logging.getLogger("test_scheduler"), operations,
+                                      read_input, (self.inputs_folder,), jobs=2)
+        finally:
+            os.dup2(saved_stdin, 0)
+            for file_descriptor in [saved_stdin, read_end, write_end]:
+                os.close(file_descriptor)
+        assert failures == {}, failures
+        for operation in operations:
+            with open(os.path.join(self.inputs_folder, operation.scope), "r") as f:
+                assert f.read() == repr(("", "")), operation.scope
+
+    def test_approval_needed(self):
+        """Test that apply and destroy need --auto-approve on scopes run in parallel"""
+        context = SimpleNamespace(obj={"jobs": 2, "operations": ["scope_1", "scope_2"]})
+        for tf_action in ["apply", "destroy"]:
+            with self.assertRaises(click.UsageError):
+                check_approval(context, ["init", tf_action], False)
+            check_approval(context, ["init", tf_action], True)
+        check_approval(context, ["init", "plan", "output"], False)
+        check_approval(SimpleNamespace(obj={"jobs": 1, "operations": ["scope_1", "scope_2"]}),
+                       ["apply"], False)
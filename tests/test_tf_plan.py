@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""Tests for the streaming processor of the Terraform plans of `cloudtiger`."""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from cloudtiger.tf_plan import TerraformPlanStream
+
+# lines of a recorded 'terraform plan -json' (Terraform 1.5), importing a VM
+PLAN_LINES = [
+    '{"@level":"info","@message":"Terraform 1.5.7","@module":"terraform.ui",'
+    '"@timestamp":"2024-01-10T10:00:00.000000+01:00","terraform":"1.5.7","type":"version",'
+    '"ui":"1.1"}',
+    '{"@level":"info","@message":"module.vm[\\"vm1\\"].aws_instance.vm: Refreshing state... '
+    '[id=i-0123]","@module":"terraform.ui","@timestamp":"2024-01-10T10:00:01.000000+01:00",'
+    '"hook":{"resource":{"addr":"module.vm[\\"vm1\\"].aws_instance.vm","module":'
+    '"module.vm[\\"vm1\\"]","resource":"aws_instance.vm","implied_provider":"aws",'
+    '"resource_type":"aws_instance","resource_name":"vm","resource_key":null},'
+    '"id_key":"id","id_value":"i-0123"},"type":"refresh_complete"}',
+    '{"@level":"warn","@message":"Warning: Argument is deprecated","@module":"terraform.ui",'
+    '"@timestamp":"2024-01-10T10:00:01.500000+01:00","diagnostic":{"severity":"warning",'
+    '"summary":"Argument is deprecated","detail":"Use tags_all — déprécié"},'
+    '"type":"diagnostic"}',
+    '',
+    '{"@level":"info","@message":"module.vm[\\"vm1\\"].aws_instance.vm: Plan to update",'
+    '"@module":"terraform.ui","@timestamp":"2024-01-10T10:00:02.000000+01:00","change":'
+    '{"resource":{"addr":"module.vm[\\"vm1\\"].aws_instance.vm","module":"module.vm[\\"vm1\\"]",'
+    '"resource":"aws_instance.vm","implied_provider":"aws","resource_type":"aws_instance",'
+    '"resource_name":"vm","resource_key":null},"action":"update"},"type":"planned_change"}',
+    '{"@level":"info","@message":"module.vm[\\"vm2\\"].aws_instance.vm: Plan to import",'
+    '"@module":"terraform.ui","@timestamp":"2024-01-10T10:00:02.000000+01:00","change":'
+    '{"resource":{"addr":"module.vm[\\"vm2\\"].aws_instance.vm","module":"module.vm[\\"vm2\\"]",'
+    '"resource":"aws_instance.vm","implied_provider":"aws","resource_type":"aws_instance",'
+    '"resource_name":"vm","resource_key":null},"action":"noop","importing":{"id":"i-0456"}},'
+    '"type":"planned_change"}',
+    '{"@level":"info","@message":"aws_security_group.sg: Plan to replace","@module":'
+    '"terraform.ui","@timestamp":"2024-01-10T10:00:02.000000+01:00","change":{"resource":'
+    '{"addr":"aws_security_group.sg","module":"","resource":"aws_security_group.sg",'
+    '"implied_provider":"aws","resource_type":"aws_security_group","resource_name":"sg",'
+    '"resource_key":null},"action":"replace","reason":"cannot_update"},'
+    '"type":"planned_change"}',
+    '{"@level":"info","@message":"data.aws_ami.ubuntu: Plan to read","@module":"terraform.ui",'
+    '"@timestamp":"2024-01-10T10:00:02.000000+01:00","change":{"resource":{"addr":'
+    '"data.aws_ami.ubuntu","module":"","resource":"data.aws_ami.ubuntu","implied_provider":'
+    '"aws","resource_type":"aws_ami","resource_name":"ubuntu","resource_key":null},'
+    '"action":"read"},"type":"planned_change"}',
+    '{"@level":"info","@message":"Plan: 1 to import, 1 to add, 1 to change, 1 to destroy.",'
+    '"@module":"terraform.ui","@timestamp":"2024-01-10T10:00:03.000000+01:00","changes":'
+    '{"add":1,"change":1,"import":1,"remove":1,"operation":"plan"},"type":"change_summary"}',
+]
+
+# lines of a recorded 'terraform apply -json' of the same plan, failing on a resource
+APPLY_LINES = [
+    '{"@level":"info","@message":"module.vm[\\"vm2\\"].aws_instance.vm: Importing... '
+    '[id=i-0456]","@module":"terraform.ui","@timestamp":"2024-01-10T10:01:00.000000+01:00",'
+    '"hook":{"resource":{"addr":"module.vm[\\"vm2\\"].aws_instance.vm","module":'
+    '"module.vm[\\"vm2\\"]","resource":"aws_instance.vm","implied_provider":"aws",'
+    '"resource_type":"aws_instance","resource_name":"vm","resource_key":null},'
+    '"import_id":"i-0456"},"type":"import_complete"}',
+    '{"@level":"info","@message":"module.vm[\\"vm1\\"].aws_instance.vm: Modifications '
+    'complete after 2s [id=i-0123]","@module":"terraform.ui","@timestamp":'
+    '"2024-01-10T10:01:02.000000+01:00","hook":{"resource":{"addr":'
+    '"module.vm[\\"vm1\\"].aws_instance.vm","module":"module.vm[\\"vm1\\"]","resource":'
+    '"aws_instance.vm","implied_provider":"aws","resource_type":"aws_instance",'
+    '"resource_name":"vm","resource_key":null},"action":"update","id_key":"id",'
+    '"id_value":"i-0123","elapsed_seconds":2},"type":"apply_complete"}',
+    '{"@level":"error","@message":"aws_security_group.sg: Creation errored after 1s",'
+    '"@module":"terraform.ui","@timestamp":"2024-01-10T10:01:03.000000+01:00","hook":'
+    '{"resource":{"addr":"aws_security_group.sg","module":"","resource":'
+    '"aws_security_group.sg","implied_provider":"aws","resource_type":"aws_security_group",'
+    '"resource_name":"sg","resource_key":null},"action":"create","elapsed_seconds":1},'
+    '"type":"apply_errored"}',
+    '{"@level":"error","@message":"Error: creating Security Group: InvalidGroup.Duplicate",'
+    '"@module":"terraform.ui","@timestamp":"2024-01-10T10:01:03.000000+01:00","diagnostic":'
+    '{"severity":"error","summary":"creating Security Group: InvalidGroup.Duplicate",'
+    '"detail":"","address":"aws_security_group.sg"},"type":"diagnostic"}',
+    '{"@level":"error","@message":"Error: Invalid provider configuration","@module":'
+    '"terraform.ui","@timestamp":"2024-01-10T10:01:03.000000+01:00","diagnostic":'
+    '{"severity":"error","summary":"Invalid provider configuration","detail":""},'
+    '"type":"diagnostic"}',
+]
+
+
+class TestTerraformPlanStream(unittest.TestCase):
+    """Tests for TerraformPlanStream."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.nice_plan_file = os.path.join(self.folder, "tf_nice_plan.json")
+        self.logger = logging.getLogger("test_tf_plan")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def stream(self, lines):
+        """Return the stream after processing the lines and closing it"""
+        stream = TerraformPlanStream(self.logger, self.nice_plan_file)
+        for line in lines:
+            stream.on_line(line)
+        stream.close()
+        return stream
+
+    def old_nice_plan(self, lines):
+        """Return the indented JSON file written from the whole plan output"""
+        nice_plan = {"line_" + str(i): json.loads(lines[i])
+                     for i in range(len(lines)) if lines[i] != ""}
+        nice_plan_file = os.path.join(self.folder, "old_nice_plan.json")
+        with open(nice_plan_file, "w") as f:
+            json.dump(nice_plan, f, indent=4)
+        with open(nice_plan_file, "r") as f:
+            return f.read()
+
+    def test_nice_plan_file(self):
+        """Test that the streamed file is the json.dump of the whole plan"""
+        for lines in [PLAN_LINES, APPLY_LINES, [], [""]]:
+            self.stream(lines)
+            with open(self.nice_plan_file, "r") as f:
+                assert f.read() == self.old_nice_plan(lines), lines
+
+    def test_plan(self):
+        """Test the changes counted in a plan"""
+        stream = self.stream(PLAN_LINES)
+        assert stream.nb_lines == len(PLAN_LINES)
+        assert stream.nb_events == len(PLAN_LINES) - 1
+        assert stream.summary == {"add": 1, "change": 1, "import": 1, "remove": 1,
+                                  "operation": "plan"}
+        assert stream.module_changes == {
+            "module.vm": {"add": 0, "change": 1, "destroy": 0, "import": 1},
+            "(root)": {"add": 1, "change": 0, "destroy": 1, "import": 0}
+        }, stream.module_changes
+        assert stream.imports == {'module.vm["vm2"].aws_instance.vm': "i-0456"}
+        assert stream.resource_changes == [("update", 'module.vm["vm1"].aws_instance.vm'),
+                                           ("replace", "aws_security_group.sg")]
+        assert stream.errors == []
+        assert stream.failed_resources == {}
+
+    def test_apply_errors(self):
+        """Test the resources failed during an apply"""
+        stream = self.stream(APPLY_LINES)
+        assert stream.failed_resources == {
+            "aws_security_group.sg": "creating Security Group: InvalidGroup.Duplicate"
+        }, stream.failed_resources
+        assert stream.errors == ["creating Security Group: InvalidGroup.Duplicate",
+                                 "Invalid provider configuration"]
+        assert stream.resource_changes == []
+        assert stream.summary is None
+
+    def test_apply_errored_without_diagnostic(self):
+        """Test that a resource is failed by its apply_errored event alone"""
+        stream = self.stream(APPLY_LINES[:3])
+        assert stream.failed_resources == {
+            "aws_security_group.sg": "aws_security_group.sg: Creation errored after 1s"
+        }, stream.failed_resources
+
+    def test_not_json_lines(self):
+        """Test that the lines that are not JSON are skipped"""
+        stream = self.stream(["panic: runtime error", PLAN_LINES[-1]])
+        assert stream.nb_events == 1
+        with open(self.nice_plan_file, "r") as f:
+            assert json.load(f) == {"line_1": json.loads(PLAN_LINES[-1])}
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+"""Tests for the validation of the config.yml of `cloudtiger`."""
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import yaml
+
+from cloudtiger.ans import meta_distribute
+from cloudtiger.validation import validate_config
+
+
+class TestMetaDistributeValidation(unittest.TestCase):
+    """Tests for the validation of the config.yml distributed from a meta_config.yml."""
+
+    def setUp(self):
+        self.project_root = tempfile.mkdtemp()
+        self.datacenter_folder = os.path.join(self.project_root, "config", "aws", "dc")
+        for scope in ["with_tasks", "without_tasks", "not_in_meta"]:
+            os.makedirs(os.path.join(self.datacenter_folder, scope))
+            with open(os.path.join(self.datacenter_folder, scope, "config.yml"), "w") as f:
+                yaml.dump({"provider": "aws"}, f)
+        with open(os.path.join(self.datacenter_folder, "meta_config.yml"), "w") as f:
+            yaml.dump({"ansible": {
+                "with_tasks": {"tasks": [{"type": "playbook", "name": "setup"}]},
+                "without_tasks": {"params": {"user": "admin"}}
+            }}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.project_root)
+
+    def test_distributed_configs_are_valid(self):
+        """Test that the config.yml written by meta_distribute pass the validation"""
+        operation = SimpleNamespace(logger=logging.getLogger("test_validation"),
+                                    project_root=self.project_root, scope="aws/dc",
+                                    scope_config_folder=self.datacenter_folder)
+        meta_distribute(operation)
+
+        for scope in ["with_tasks", "without_tasks", "not_in_meta"]:
+            with open(os.path.join(self.datacenter_folder, scope, "config.yml"), "r") as f:
+                config = yaml.safe_load(f)
+            errors, _ = validate_config(config)
+            assert errors == [], (scope, errors)